@@ -0,0 +1,365 @@
+# Бенчмарк и регрессионный прогон TXD сжатия (inu_txd)
+#
+#   python benchmarks/txd_benchmark.py [--quick] [--txd file.txd ...]
+#   blender -b --python benchmarks/txd_benchmark.py -- [--quick] [--images a.png ...]
+#
+# Синтетические и реальные текстуры нескольких размеров прогоняются через
+# process_texture_parallel, compress_miplevel_dxt1 и compress_miplevel_dxt3.
+# Для каждого случая пишутся MPix/s, пик выделенной памяти (tracemalloc, только
+# этот случай) и PSNR относительно исходника; при падении скорости или качества
+# относительно сохранённого baseline - код выхода 1. Скорость сравнивается только
+# с baseline, записанным на этой же машине (данные хоста хранятся в baseline).
+# inu_txd не зависит от bpy, поэтому Blender не обязателен.
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tracemalloc
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from inu_tools_gta_sa.inu_txd import (
+    DXT_QUALITY_FAST, DXT_QUALITY_BALANCED, DXT_QUALITY_BEST,
+    encoder_options, process_texture_parallel, compress_miplevel_dxt1, compress_miplevel_dxt3,
+    decode_dxt1_level, decode_dxt3_level, DXT_DECODERS, TEXNATIVE_HEADER, TxdReader,
+)
+
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "txd_baseline.json")
+DEFAULT_SIZES = (64, 256, 1024)
+QUICK_SIZES = (64, 256)
+
+# Допуски регрессии: средняя (геометрическая) скорость ниже baseline больше чем на 25%,
+# отдельный случай - больше чем на 50%, или PSNR ниже на 0.1 дБ
+MAX_SLOWDOWN = 0.25
+MAX_CASE_SLOWDOWN = 0.5
+MAX_PSNR_DROP = 0.1
+# Короткие случаи повторяются, пока не наберётся это время (иначе замер - шум таймера)
+MIN_CASE_SECONDS = 0.2
+MAX_CASE_RUNS = 50
+# Медленные случаи перемеряются перед отчётом: один замер на занятой машине - не регрессия
+SLOW_RETRIES = 2
+
+
+# =============================================================================
+# TEXTURES
+# =============================================================================
+
+def synthetic_texture(kind, size, seed=0):
+    """(size, size, 4) uint8 test image: gradient, noise, flat, cutout or smoke"""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:size, 0:size].astype(np.float32) / max(1, size - 1)
+    image = np.empty((size, size, 4), dtype=np.float32)
+    image[:, :, 3] = 1.0
+    if kind == 'gradient':
+        image[:, :, 0] = x
+        image[:, :, 1] = y
+        image[:, :, 2] = 0.5 + 0.5 * np.sin(6.0 * (x + y))
+    elif kind == 'noise':
+        image[:, :, :3] = rng.random((size, size, 3))
+    elif kind == 'flat':
+        # Крупные одноцветные области (UI, разметка)
+        row, column = np.mgrid[0:size, 0:size] * 4 // size
+        image[:, :, :3] = rng.random((16, 3))[row * 4 + column]
+    elif kind == 'cutout':
+        image[:, :, :3] = 0.3 + 0.4 * rng.random((size, size, 3))
+        image[:, :, 3] = ((x - 0.5) ** 2 + (y - 0.5) ** 2 < 0.16).astype(np.float32)
+    elif kind == 'smoke':
+        image[:, :, :3] = 0.8
+        image[:, :, 3] = np.clip(1.0 - 2.0 * np.hypot(x - 0.5, y - 0.5), 0.0, 1.0)
+    else:
+        raise ValueError(f"unknown texture kind: {kind}")
+    return np.clip(np.rint(image * 255.0), 0, 255).astype(np.uint8)
+
+
+SYNTHETIC_KINDS = {
+    # вид -> использует альфу
+    'gradient': False,
+    'noise': False,
+    'flat': False,
+    'cutout': True,
+    'smoke': True,
+}
+
+
+def txd_samples(paths):
+    """Level 0 of every DXT texture in existing TXD files: [(name, pixels, use_alpha)]"""
+    samples = []
+    for path in paths:
+        with TxdReader(path) as reader:
+            for texture in reader:
+                if texture.format not in DXT_DECODERS or texture.width % 4 or texture.height % 4:
+                    continue
+                samples.append((f"txd:{texture.name}", np.array(texture.decode(0)), texture.format != 'DXT1'))
+    return samples
+
+
+def image_samples(paths):
+    """Image files loaded through Blender (only inside blender -b)"""
+    import bpy
+    samples = []
+    for path in paths:
+        image = bpy.data.images.load(path, check_existing=True)
+        width, height = image.size
+        buffer = np.empty(width * height * 4, dtype=np.float32)
+        image.pixels.foreach_get(buffer)
+        # Blender хранит строки снизу вверх
+        pixels = np.clip(np.rint(buffer.reshape(height, width, 4)[::-1] * 255.0), 0, 255).astype(np.uint8)
+        if width % 4 or height % 4:
+            pixels = pixels[:height // 4 * 4, :width // 4 * 4]
+        samples.append((f"image:{os.path.basename(path)}", pixels, bool((pixels[:, :, 3] < 255).any())))
+    return samples
+
+
+# =============================================================================
+# MEASUREMENT
+# =============================================================================
+
+def cpu_name():
+    """CPU model string ('' if unknown)"""
+    # platform.processor() на Linux обычно пуст - модель берётся из /proc/cpuinfo
+    try:
+        with open('/proc/cpuinfo', encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('model name'):
+                    return line.split(':', 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor()
+
+
+def host_info():
+    """Machine the results were measured on; throughput is only comparable on the same host"""
+    return {
+        'system': platform.system(),
+        'machine': platform.machine(),
+        'cpu': cpu_name(),
+        'cpus': os.cpu_count(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+    }
+
+
+# Поля хоста, от которых зависит скорость; версии Python/NumPy только выводятся
+HOST_KEYS = ('system', 'machine', 'cpu', 'cpus')
+
+
+def same_host(host, other):
+    return bool(other) and all(host.get(key) == other.get(key) for key in HOST_KEYS)
+
+
+def psnr(reference, decoded):
+    diff = decoded.astype(np.float64) - reference
+    mse = float(np.mean(diff * diff))
+    return 99.0 if mse == 0 else float(10.0 * np.log10(255.0 * 255.0 / mse))
+
+
+def level0_from_native(tex_native, width, height, use_alpha):
+    """Decode level 0 of a texture native built by inu_txd"""
+    offset = 12 + TEXNATIVE_HEADER.size
+    size = int.from_bytes(tex_native[offset:offset + 4], 'little')
+    fourcc = tex_native[12 + 76:12 + 80].decode('ascii', errors='replace')
+    decoder = DXT_DECODERS.get(fourcc, (decode_dxt3_level if use_alpha else decode_dxt1_level,))[0]
+    return decoder(tex_native[offset + 4:offset + 4 + size], width, height)
+
+
+def encode(encoder, pixels, use_alpha, quality):
+    height, width = pixels.shape[:2]
+    if encoder == 'pipeline':
+        return process_texture_parallel(('bench', pixels, width, height, use_alpha, encoder_options(quality=quality)))
+    if encoder == 'dxt1':
+        return compress_miplevel_dxt1(pixels)
+    return compress_miplevel_dxt3(pixels)
+
+
+def peak_alloc_mb(encoder, pixels, use_alpha, quality):
+    """Peak memory allocated by one run of this case alone, in MB.
+
+    tracemalloc sees Python and NumPy allocations; the run is separate from
+    the timed ones (tracing slows allocation down).
+    """
+    tracemalloc.start()
+    try:
+        encode(encoder, pixels, use_alpha, quality)
+        return tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+    finally:
+        tracemalloc.stop()
+
+
+def run_case(encoder, pixels, use_alpha, quality, repeat):
+    """Best-of-repeat time, PSNR and peak allocation of one encoder on one image"""
+    height, width = pixels.shape[:2]
+    channels = 4 if use_alpha else 3
+    best = None
+    runs = total = 0
+    while runs < repeat or (total < MIN_CASE_SECONDS and runs < MAX_CASE_RUNS):
+        runs += 1
+        start = time.perf_counter()
+        result = encode(encoder, pixels, use_alpha, quality)
+        elapsed = time.perf_counter() - start
+        total += elapsed
+        best = elapsed if best is None else min(best, elapsed)
+
+    if encoder == 'pipeline':
+        decoded = level0_from_native(result, width, height, use_alpha)
+    elif encoder == 'dxt1':
+        decoded, channels = decode_dxt1_level(result, width, height), 3
+    else:
+        decoded, channels = decode_dxt3_level(result, width, height), 4
+    return {
+        'mpix_s': round(width * height / 1e6 / max(best, 1e-9), 2),
+        'seconds': round(best, 5),
+        'psnr': round(psnr(pixels[:, :, :channels], decoded[:, :, :channels]), 3),
+        'peak_alloc_mb': round(peak_alloc_mb(encoder, pixels, use_alpha, quality), 1),
+    }
+
+
+def benchmark_cases(samples, encoders=('pipeline', 'dxt1', 'dxt3')):
+    """{case id: (encoder, pixels, use_alpha)} for every encoder that fits a sample"""
+    cases = {}
+    for name, pixels, use_alpha in samples:
+        for encoder in encoders:
+            # DXT3 без альфы и DXT1 на альфе ничего не говорят о реальном экспорте
+            if (encoder == 'dxt1' and use_alpha) or (encoder == 'dxt3' and not use_alpha):
+                continue
+            cases[f"{encoder}/{name}/{pixels.shape[1]}x{pixels.shape[0]}"] = (encoder, pixels, use_alpha)
+    return cases
+
+
+def benchmark(cases, quality, repeat):
+    """Run every case, returns {case id: metrics}"""
+    results = {}
+    for case, (encoder, pixels, use_alpha) in cases.items():
+        metrics = results[case] = run_case(encoder, pixels, use_alpha, quality, repeat)
+        print(f"{case:40s} {metrics['mpix_s']:8.2f} MPix/s  PSNR {metrics['psnr']:6.2f} dB  "
+              f"peak alloc {metrics['peak_alloc_mb']:.1f} MB")
+    return results
+
+
+def is_slow(metrics, reference, max_slowdown=MAX_SLOWDOWN):
+    return metrics['mpix_s'] < reference['mpix_s'] * (1.0 - max_slowdown)
+
+
+def compare(results, baseline, max_slowdown=MAX_SLOWDOWN, max_psnr_drop=MAX_PSNR_DROP,
+            max_case_slowdown=MAX_CASE_SLOWDOWN, check_speed=True):
+    """Regressions against a baseline {case id: metrics}, as printable strings.
+
+    Throughput is judged on the geometric mean over all shared cases (one
+    noisy case does not fail the run) plus a looser per-case limit, and only
+    with check_speed (baseline from this host); PSNR is deterministic and
+    checked per case.
+    """
+    failures = []
+    ratios = []
+    for case, metrics in results.items():
+        reference = baseline.get(case)
+        if reference is None:
+            continue
+        if check_speed:
+            ratios.append(metrics['mpix_s'] / max(reference['mpix_s'], 1e-9))
+            if is_slow(metrics, reference, max_case_slowdown):
+                failures.append(f"{case}: {metrics['mpix_s']:.2f} MPix/s < baseline {reference['mpix_s']:.2f}")
+        if metrics['psnr'] < reference['psnr'] - max_psnr_drop:
+            failures.append(f"{case}: PSNR {metrics['psnr']:.2f} dB < baseline {reference['psnr']:.2f}")
+    if ratios:
+        mean_ratio = float(np.exp(np.mean(np.log(ratios))))
+        print(f"Throughput vs baseline: {mean_ratio:.2f}x (geometric mean of {len(ratios)} cases)")
+        if mean_ratio < 1.0 - max_slowdown:
+            failures.append(f"throughput {mean_ratio:.2f}x of baseline")
+    return failures
+
+
+# =============================================================================
+# MAIN
+# =============================================================================
+
+def parse_args(argv):
+    # В Blender аргументы скрипта идут после "--"
+    if '--' in argv:
+        argv = argv[argv.index('--') + 1:]
+    elif 'bpy' in sys.modules:
+        argv = []
+    parser = argparse.ArgumentParser(description="TXD compression benchmark")
+    parser.add_argument('--quick', action='store_true', help="only 64 and 256 px synthetic textures")
+    parser.add_argument('--sizes', type=int, nargs='+', help="synthetic texture sizes")
+    parser.add_argument('--txd', nargs='+', default=[], help="existing TXD files to take sample textures from")
+    parser.add_argument('--images', nargs='+', default=[], help="image files (blender -b only)")
+    parser.add_argument('--quality', default=DXT_QUALITY_FAST,
+                        choices=[DXT_QUALITY_FAST, DXT_QUALITY_BALANCED, DXT_QUALITY_BEST])
+    parser.add_argument('--repeat', type=int, default=3, help="runs per case, the fastest is kept")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="baseline JSON")
+    parser.add_argument('--save-baseline', action='store_true', help="write results as the new baseline")
+    parser.add_argument('--max-slowdown', type=float, default=MAX_SLOWDOWN, help="allowed mean throughput loss")
+    parser.add_argument('--max-case-slowdown', type=float, default=MAX_CASE_SLOWDOWN,
+                        help="allowed throughput loss of a single case")
+    parser.add_argument('--max-psnr-drop', type=float, default=MAX_PSNR_DROP)
+    parser.add_argument('--output', help="also write results to this JSON file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    sizes = args.sizes or (QUICK_SIZES if args.quick else DEFAULT_SIZES)
+
+    samples = [(kind, synthetic_texture(kind, size), use_alpha)
+               for size in sizes for kind, use_alpha in SYNTHETIC_KINDS.items()]
+    samples += txd_samples(args.txd)
+    if args.images:
+        samples += image_samples(args.images)
+
+    # Прогрев: первые вызовы NumPy не должны попадать в замеры
+    process_texture_parallel(('warmup', synthetic_texture('noise', 16), 16, 16, True, encoder_options()))
+
+    cases = benchmark_cases(samples)
+    results = benchmark(cases, args.quality, args.repeat)
+    report = {'quality': args.quality, 'host': host_info(), 'results': results}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=1, sort_keys=True)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=1, sort_keys=True)
+        print(f"Baseline saved: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, run with --save-baseline first")
+        return 0
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    if baseline.get('quality') != args.quality:
+        print(f"Baseline was recorded with quality {baseline.get('quality')}, comparison skipped")
+        return 0
+
+    # Скорость зависит от машины: на чужом baseline проверяется только PSNR
+    check_speed = same_host(report['host'], baseline.get('host'))
+    if not check_speed:
+        print("Baseline was recorded on another machine "
+              f"({baseline.get('host', {}).get('cpu') or 'unknown host'}), throughput comparison skipped; "
+              "record one here with --save-baseline")
+
+    for _ in range(SLOW_RETRIES if check_speed else 0):
+        slow = {case: cases[case] for case, metrics in results.items()
+                if case in baseline['results'] and is_slow(metrics, baseline['results'][case], args.max_case_slowdown)}
+        if not slow:
+            break
+        print(f"Re-measuring {len(slow)} slow case(s)")
+        for case, metrics in benchmark(slow, args.quality, args.repeat).items():
+            if metrics['mpix_s'] > results[case]['mpix_s']:
+                results[case] = metrics
+
+    failures = compare(results, baseline['results'], args.max_slowdown, args.max_psnr_drop,
+                       args.max_case_slowdown, check_speed)
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+    print(f"{len(results)} cases, {len(failures)} regression(s)")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,102 @@
+# INU_tools(gta_sa) for Blender 4.4
+# Объединённая панель инструментов для работы с GTA SA моделями
+# Включает: Export (DFF, COL, LOD, TXD), Prelight, Lightmap Generator
+#
+# This addon depends on DragonFF addon for DFF export.
+# DragonFF © its respective authors.
+
+bl_info = {
+    "name": "INU_tools(gta_sa)",
+    "author": "INU",
+    "version": (1, 5, 0),
+    "blender": (4, 4, 0),
+    "location": "View3D > Sidebar (N) > GTA Tools",
+    "description": "Toolset for GTA SA models. Requires DragonFF addon",
+    "warning": "Requires DragonFF addon installed for DFF export",
+    "category": "3D View",
+}
+
+# Changelog:
+# v1.5.0 - TXD экспорт: векторное DXT1 сжатие всего мип-уровня за один проход NumPy
+#        - TXD экспорт: векторная упаковка явной альфы DXT3 (uint64) вместе с цветовыми блоками
+#        - TXD экспорт: ядро вынесено в inu_txd.py (без bpy), пул процессов с shared memory и настройкой числа воркеров
+#        - TXD экспорт: дисковый кэш сжатых текстур по хэшу пикселей (LRU, лимит размера, hit/miss в отчёте)
+#        - TXD экспорт: пиксели читаются через foreach_get в float32 буфер, одно чтение на проверку альфы и сжатие
+#        - TXD экспорт: кэш анализа изображений (альфа, размер, хэш) - каждое изображение читается один раз за экспорт
+#        - TXD экспорт: мип-цепочка в float32 за один проход, гамма-корректный фильтр, альфа-взвешивание и сохранение покрытия альфы
+#        - TXD экспорт: GPU режим пакетом - все PNG сразу, несколько nvcompress параллельно, отказ CUDA запоминается
+#        - TXD экспорт: потоковая запись - текстуры пишутся на диск по мере готовности, размеры секций дописываются в конце
+#        - TXD: чтение существующих TXD (inu_txd.TxdReader) через mmap без копирования, декодирование DXT1/DXT3 в NumPy
+#        - TXD экспорт: инкрементальное обновление - неизменённые текстуры копируются из старого TXD, пересжимаются только изменённые
+#        - TXD экспорт: одинаковые пиксели под разными именами сжимаются один раз (в Export All - на все группы), режимы отчёта и объединения (объединение - только в Export All)
+#        - TXD экспорт: качество Fast/Balanced/Best (главная ось + уточнение МНК концов DXT, одна настройка сцены для TXD и Export All, по умолчанию Fast), RMSE каждой текстуры в отчёте
+#        - TXD экспорт: одноцветные блоки и блоки с постоянной альфой кодируются по таблице оптимальных концов без поиска
+#        - TXD экспорт: ресемплинг некратных 4 текстур (кратно 4 / степень двойки, Box/Bilinear/Lanczos) и ограничение размера вместо пропуска
+#        - TXD экспорт: несжатые форматы 8888/888/1555 и палитра PAL8 (median cut + k-means), выбор на текстуру или Auto
+#        - TXD экспорт: DXT5 (интерполированная альфа) для плавной прозрачности, режим DXT Auto выбирает DXT1/DXT3/DXT5 по гистограмме альфы
+#        - TXD: стабильный API ядра inu_txd без bpy (compress_texture, compress_textures, build_txd, write_txd)
+#        - TXD: бенчмарк сжатия benchmarks/txd_benchmark.py (MPix/s, пик памяти каждого случая, PSNR, сравнение с baseline той же машины)
+#        - TXD экспорт: бюджет размера архива и макс. размер по мипам - верхние мип-уровни отбрасываются, размер каждой текстуры в отчёте
+#        - Export All: консольный режим (blender -b, cli_main) - коллекция/маска/список имён, JSON отчёт, код выхода при ошибках
+#        - Export All: манифест export_all.inu.json - неизменённые модели пропускаются (отпечатки меша, материалов, модификаторов, трансформаций, изображений), флаг "Все заново"
+#        - Export All: пиксели всех групп читаются заранее, TXD всех групп сжимаются в одном пуле и пишутся в фоне, пока экспортируются DFF/COL
+#        - Экспорт: превью прелайта обходится переключением одной связи на материал (без пересоздания нод), восстанавливается даже при ошибке экспорта
+#        - COL экспорт: встроенная запись COL3 (inu_col.py) без DragonFF - границы, сферы, боксы, int16 вершины, грани и группы граней (BVH), имя модели сразу в заголовке, сцена не меняется; сферы/боксы берутся и из раскладки импорта DragonFF (коллекция модели) с поверхностью из настроек пустышки, теневой меш COL3 (Shadow Object DragonFF)
+#        - Export All: исправлен вывод ошибок (показывались ошибки только последней группы)
+#        - Аддон стал пакетом inu_tools_gta_sa (установка из zip): ядра inu_txd/inu_col импортируются относительно, без правки sys.path
+# v1.4.5 - Export All: массовый экспорт нескольких групп моделей (Model1_DFF + Model2_DFF и т.д.)
+#        - Lightmap Generator: панель снова доступна в интерфейсе
+# v1.4.4 - Prelight: Fill Colors - покраска полигонов с пипеткой и системой уровней
+#        - Prelight: Scatter Light - рассеивание света с настройками и уровнями
+#        - Prelight: убраны лишние заголовки, оставлены только кнопки
+#        - Color Attributes: раздельные кнопки создания/удаления Day и Night
+#        - Color Attributes: кнопка Day/Night создаёт оба атрибута
+#        - Drag-and-Drop: перетаскивание PNG/JPG/TGA из File Browser создаёт материал
+#        - INU Tools панель перемещена в Properties > Scene
+#        - Удалена пустая вкладка GTA Textures из N-панели
+# v1.4.3 - TXD экспорт: исправлена прозрачность DXT3 текстур в игре
+#        - TXD экспорт: текстуры с размером не кратным 4 пропускаются с предупреждением
+# v1.4.2 - TXD экспорт: добавлен GPU режим через NVIDIA Texture Tools
+# v1.4.1 - TXD экспорт: параллельная обработка текстур (до 8x быстрее)
+# v1.4.0 - UV Editor: добавлена панель GTA Tools с UV Grid Randomizer и визуализацией сетки
+#        - UV Editor: добавлена привязка UV к ближайшей ячейке сетки (Snap to Grid)
+#        - UV Editor: добавлен выбор позиции UV в ячейке (9 вариантов выравнивания)
+#        - UV Editor: добавлена функция "Связать полигоны" - полигоны с пересекающимися UV перемещаются вместе
+#        - GTA Textures: проверка количества материалов (лимит 50)
+#        - GTA Textures: загрузка текстуры только для выбранного материала
+#        - GTA Textures: автоустановка Specular=0 и подключение Alpha канала
+#        - Переведены все описания кнопок на русский язык
+# v1.3.0 - Добавлена очистка материалов: объединение дубликатов (.001, .002, etc.)
+# v1.2.9 - Добавлена вкладка GTA Textures: автозагрузка текстур по именам материалов
+# v1.2.8 - COL экспорт теперь использует версию COL3 (GTA SA) вместо COL1
+# v1.2.7 - DFF экспорт: добавлены only_selected=True и export_coll=False для исправления краша
+# v1.2.6 - DFF экспорт теперь использует версию GTA SA (v3.6.0.3) вместо GTA 3
+# v1.2.5 - Исправление имени модели внутри COL файла (base_name без суффикса COL)
+# v1.2.4 - Добавлен прогресс-бар при Export All
+# v1.2.3 - Автоустановка типа Collision Object для COL модели перед экспортом
+# v1.2.2 - TXD в Export All берёт текстуры из DFF + LOD в один архив
+# v1.2.1 - Поиск моделей только среди выделенных объектов
+# v1.2.0 - Улучшено определение моделей по суффиксам DFF/LOD/COL (без разделителей)
+# v1.1.0 - Добавлен экспорт DFF/COL/LOD/TXD, определение моделей по суффиксам
+# v1.0.0 - Начальная версия
+
+try:
+    import bpy
+except ImportError:
+    # Без Blender (рабочие процессы пула, скрипты сборки) доступны только ядра inu_txd/inu_col
+    addon = None
+else:
+    from . import addon
+
+
+def register():
+    addon.register()
+
+
+def unregister():
+    addon.unregister()
+
+
+def cli_main(argv=None):
+    """Headless Export All, see addon.cli_main"""
+    return addon.cli_main(argv)
@@ -1,71 +1,39 @@
-# INU_tools(gta_sa) for Blender 4.4
-# Объединённая панель инструментов для работы с GTA SA моделями
-# Включает: Export (DFF, COL, LOD, TXD), Prelight, Lightmap Generator
-#
-# This addon depends on DragonFF addon for DFF/COL export.
-# DragonFF © its respective authors.
-
-bl_info = {
-    "name": "INU_tools(gta_sa)",
-    "author": "INU",
-    "version": (1, 4, 5),
-    "blender": (4, 4, 0),
-    "location": "View3D > Sidebar (N) > GTA Tools",
-    "description": "Toolset for GTA SA models. Requires DragonFF addon",
-    "warning": "Requires DragonFF addon installed for DFF/COL export",
-    "category": "3D View",
-}
-
-# Changelog:
-# v1.4.5 - Export All: массовый экспорт нескольких групп моделей (Model1_DFF + Model2_DFF и т.д.)
-#        - Lightmap Generator: панель снова доступна в интерфейсе
-# v1.4.4 - Prelight: Fill Colors - покраска полигонов с пипеткой и системой уровней
-#        - Prelight: Scatter Light - рассеивание света с настройками и уровнями
-#        - Prelight: убраны лишние заголовки, оставлены только кнопки
-#        - Color Attributes: раздельные кнопки создания/удаления Day и Night
-#        - Color Attributes: кнопка Day/Night создаёт оба атрибута
-#        - Drag-and-Drop: перетаскивание PNG/JPG/TGA из File Browser создаёт материал
-#        - INU Tools панель перемещена в Properties > Scene
-#        - Удалена пустая вкладка GTA Textures из N-панели
-# v1.4.3 - TXD экспорт: исправлена прозрачность DXT3 текстур в игре
-#        - TXD экспорт: текстуры с размером не кратным 4 пропускаются с предупреждением
-# v1.4.2 - TXD экспорт: добавлен GPU режим через NVIDIA Texture Tools
-# v1.4.1 - TXD экспорт: параллельная обработка текстур (до 8x быстрее)
-# v1.4.0 - UV Editor: добавлена панель GTA Tools с UV Grid Randomizer и визуализацией сетки
-#        - UV Editor: добавлена привязка UV к ближайшей ячейке сетки (Snap to Grid)
-#        - UV Editor: добавлен выбор позиции UV в ячейке (9 вариантов выравнивания)
-#        - UV Editor: добавлена функция "Связать полигоны" - полигоны с пересекающимися UV перемещаются вместе
-#        - GTA Textures: проверка количества материалов (лимит 50)
-#        - GTA Textures: загрузка текстуры только для выбранного материала
-#        - GTA Textures: автоустановка Specular=0 и подключение Alpha канала
-#        - Переведены все описания кнопок на русский язык
-# v1.3.0 - Добавлена очистка материалов: объединение дубликатов (.001, .002, etc.)
-# v1.2.9 - Добавлена вкладка GTA Textures: автозагрузка текстур по именам материалов
-# v1.2.8 - COL экспорт теперь использует версию COL3 (GTA SA) вместо COL1
-# v1.2.7 - DFF экспорт: добавлены only_selected=True и export_coll=False для исправления краша
-# v1.2.6 - DFF экспорт теперь использует версию GTA SA (v3.6.0.3) вместо GTA 3
-# v1.2.5 - Исправление имени модели внутри COL файла (base_name без суффикса COL)
-# v1.2.4 - Добавлен прогресс-бар при Export All
-# v1.2.3 - Автоустановка типа Collision Object для COL модели перед экспортом
-# v1.2.2 - TXD в Export All берёт текстуры из DFF + LOD в один архив
-# v1.2.1 - Поиск моделей только среди выделенных объектов
-# v1.2.0 - Улучшено определение моделей по суффиксам DFF/LOD/COL (без разделителей)
-# v1.1.0 - Добавлен экспорт DFF/COL/LOD/TXD, определение моделей по суффиксам
-# v1.0.0 - Начальная версия
+# INU_tools(gta_sa) - операторы, панели и экспорт (bl_info и changelog в __init__.py)
 
 import bpy
 import bmesh
 import math
-import struct
 import os
-import tempfile
-import subprocess
+import sys
+import json
+import hashlib
+import fnmatch
+import argparse
+import itertools
+import threading
+import contextlib
 import numpy as np
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from mathutils import Vector
-from bpy.props import StringProperty, BoolProperty, FloatProperty, FloatVectorProperty, IntProperty, CollectionProperty
+from bpy.props import StringProperty, BoolProperty, FloatProperty, FloatVectorProperty, IntProperty, CollectionProperty, EnumProperty
 from bpy_extras.io_utils import ExportHelper
 
+# Ядро TXD - inu_txd.py без bpy (его импортируют рабочие процессы)
+from .inu_txd import (
+    TXD_BACKEND_THREAD, TXD_BACKEND_PROCESS, MIP_FILTER_BOX, MIP_FILTER_LINEAR,
+    DXT_QUALITY_FAST, DXT_QUALITY_BALANCED, DXT_QUALITY_BEST,
+    RESIZE_OFF, RESIZE_MULTIPLE_4, RESIZE_POW2, RESAMPLE_BOX, RESAMPLE_BILINEAR, RESAMPLE_LANCZOS,
+    target_texture_size, plan_mip_budget,
+    TXD_RASTER_DXT, TXD_RASTER_DXT5, TXD_RASTER_DXT_AUTO, TXD_RASTER_AUTO, TXD_RASTER_8888, TXD_RASTER_888, TXD_RASTER_1555, TXD_RASTER_PAL8,
+    TXD_RASTER_FORMATS, DXT_RASTERS, texture_native_format,
+    encoder_options, encoder_settings_key,
+    process_texture_parallel, encode_texture, run_texture_jobs, NvttCompressor, compress_textures_nvtt, TxdWriter,
+    TextureCache, texture_cache_key, hash_pixels, default_cache_dir, TXD_ENCODER_VERSION,
+    open_previous_txd, find_reusable_native, save_txd_sidecar, native_checksum,
+    set_texture_native_name, TextureDedup,
+    TXD_DEDUP_OFF, TXD_DEDUP_SHARE, TXD_DEDUP_REPORT, TXD_DEDUP_ALIAS,
+)
+from .inu_col import build_col3, write_col, COL_MAX_COORD, COL_WRITER_VERSION
+
 
 # =============================================================================
 # LOCALIZATION SYSTEM
@@ -99,6 +67,22 @@ TRANSLATIONS = {
     "Путь к папке с системными текстурами GTA": "Path to GTA system textures folder",
     "Путь к папке где находится .blend файл": "Path to folder where .blend file is located",
     "Не экспортировать TXD при Export All": "Do not export TXD with Export All",
+    "Потоков/процессов": "Workers",
+    "Кэш TXD": "TXD Cache",
+    "МБ": "MB",
+    "Кэш анализа на сессию": "Session analysis cache",
+    "Альфа-взвеш.": "Alpha weighted",
+    "Покрытие альфы": "Alpha coverage",
+    "Качество": "Quality",
+    "Только изменённые": "Changed only",
+    "Дубликаты": "Duplicates",
+    "Размер": "Size",
+    "Макс.": "Max",
+    "Фильтр": "Filter",
+    "Бюджет КБ": "Budget KB",
+    "Формат": "Format",
+    "Макс. мип": "Max Mip",
+    "Все заново": "Force",
     "Пропустить TXD": "Skip TXD",
 
     # Enum items (label, description)
@@ -156,6 +140,8 @@ TRANSLATIONS = {
     "Не удалось определить имя модели!": "Could not determine model name!",
     "Экспортировано:": "Exported:",
     "Ошибки:": "Errors:",
+    "Без изменений:": "Unchanged:",
+    "пересобрано:": "rebuilt:",
     "Найдено:": "Found:",
     "Среди выделенных не найдено DFF/LOD/COL моделей": "No DFF/LOD/COL models found among selected",
     "Укажите хотя бы один путь к папке с текстурами!": "Specify at least one path to textures folder!",
@@ -293,159 +279,26 @@ def T(text):
 # TXD EXPORTER
 # =============================================================================
 
-RW_TEXDICTIONARY = 0x16
-RW_TEXTURENATIVE = 0x15
-RW_STRUCT = 0x01
-RW_EXTENSION = 0x03
-RW_VERSION = 0x1803FFFF
-PLATFORM_D3D9 = 9
-RASTER_565 = 0x0200
-RASTER_8888 = 0x0500
-RASTER_MIPMAP = 0x8000
-FILTER_LINEAR = 0x02
-ADDRESS_WRAP = 0x01
-
-
-def make_filter_flags():
-    return FILTER_LINEAR | (ADDRESS_WRAP << 8) | (ADDRESS_WRAP << 12)
-
-
 def check_nvtt_available(nvtt_path):
     """Check NVIDIA Texture Tools availability"""
     if not nvtt_path or not os.path.isdir(nvtt_path):
         return False, "Папка NVTT не найдена"
-    nvcompress = os.path.join(nvtt_path, "nvcompress.exe")
-    if not os.path.isfile(nvcompress):
-        return False, "nvcompress.exe не найден в указанной папке"
-    return True, nvcompress
+    for exe_name in ("nvcompress.exe", "nvcompress"):
+        nvcompress = os.path.join(nvtt_path, exe_name)
+        if os.path.isfile(nvcompress):
+            return True, nvcompress
+    return False, "nvcompress.exe не найден в указанной папке"
 
 
-def compress_with_nvtt(name, image, use_alpha, nvcompress_path):
-    """Compress texture via NVIDIA Texture Tools (GPU)"""
-    temp_dir = tempfile.gettempdir()
-    # Используем безопасное имя файла
-    safe_name = "".join(c if c.isalnum() or c in "._-" else "_" for c in name)
-    input_file = os.path.join(temp_dir, f"_nvtt_{safe_name}.png")
-    output_file = os.path.join(temp_dir, f"_nvtt_{safe_name}.dds")
+# Компрессоры живут всю сессию - отказ CUDA запоминается и между экспортами
+_nvtt_compressors = {}
 
-    try:
-        # Сохраняем изображение через Blender (правильная ориентация)
-        old_path = image.filepath_raw
-        old_format = image.file_format
-        image.filepath_raw = input_file
-        image.file_format = 'PNG'
-        image.save()
-        image.filepath_raw = old_path
-        image.file_format = old_format
-
-        width, height = image.size[0], image.size[1]
-
-        # Вызвать nvcompress
-        # -alpha говорит nvcompress что PNG имеет alpha канал
-        fmt = "-bc2" if use_alpha else "-bc1"  # bc1=DXT1, bc2=DXT3
-        alpha_flag = ["-alpha"] if use_alpha else []
-        cmd = [nvcompress_path, "-nocuda", fmt, "-mipmap"] + alpha_flag + [input_file, output_file]
-
-        # Попробовать с CUDA, если не получится - без
-        cmd_cuda = [nvcompress_path, fmt, "-mipmap"] + alpha_flag + [input_file, output_file]
-
-        result = subprocess.run(cmd_cuda, capture_output=True, timeout=60)
-        if result.returncode != 0:
-            result = subprocess.run(cmd, capture_output=True, timeout=60)
-
-        if not os.path.exists(output_file):
-            return None
-
-        # Прочитать DDS и извлечь данные
-        with open(output_file, 'rb') as f:
-            dds_data = f.read()
-
-        # Парсим DDS
-        if dds_data[:4] != b'DDS ':
-            return None
-
-        # DDS Header (124 байта после "DDS ")
-        dds_height = struct.unpack('<I', dds_data[12:16])[0]
-        dds_width = struct.unpack('<I', dds_data[16:20])[0]
-        mip_count = struct.unpack('<I', dds_data[28:32])[0]
-        if mip_count == 0:
-            mip_count = 1
-
-        # Проверяем на DX10 extended header
-        pf_fourcc = dds_data[84:88]
-        header_size = 128
-        if pf_fourcc == b'DX10':
-            header_size = 148  # 128 + 20 bytes DX10 header
-
-        # Данные начинаются после заголовка
-        pixel_data = dds_data[header_size:]
-
-        # Создаём TXD структуру
-        if use_alpha:
-            dxt_type = 3
-            raster_format = RASTER_8888 | RASTER_MIPMAP
-            depth = 32
-            block_size = 16
-        else:
-            dxt_type = 1
-            raster_format = RASTER_565 | RASTER_MIPMAP
-            depth = 16
-            block_size = 8
-
-        tex_name = name[:31].encode('ascii', errors='replace').ljust(32, b'\x00')
-        fourcc = b'DXT1' if dxt_type == 1 else b'DXT3'
-
-        # Собираем мипмапы
-        struct_data = bytearray()
-        struct_data.extend(struct.pack('<II', PLATFORM_D3D9, make_filter_flags()))
-        struct_data.extend(tex_name)
-        struct_data.extend(b'\x00' * 32)
-        struct_data.extend(struct.pack('<I', raster_format))
-        struct_data.extend(fourcc)
-        struct_data.extend(struct.pack('<HH', dds_width, dds_height))
-        struct_data.extend(struct.pack('<B', depth))
-        struct_data.extend(struct.pack('<B', mip_count))
-        struct_data.extend(struct.pack('<B', 4))  # raster type
-        struct_data.extend(struct.pack('<B', 0x08))  # D3D format flag
-
-        # Извлекаем каждый мип-уровень
-        offset = 0
-        mip_w, mip_h = dds_width, dds_height
-        for _ in range(mip_count):
-            blocks_x = max(1, (mip_w + 3) // 4)
-            blocks_y = max(1, (mip_h + 3) // 4)
-            mip_size = blocks_x * blocks_y * block_size
-
-            if offset + mip_size <= len(pixel_data):
-                mip_data = pixel_data[offset:offset + mip_size]
-                struct_data.extend(struct.pack('<I', len(mip_data)))
-                struct_data.extend(mip_data)
-                offset += mip_size
-
-            mip_w = max(1, mip_w // 2)
-            mip_h = max(1, mip_h // 2)
-
-        tex_native = bytearray()
-        write_rw_section_header(tex_native, RW_STRUCT, len(struct_data))
-        tex_native.extend(struct_data)
-        write_rw_section_header(tex_native, RW_EXTENSION, 0)
-
-        return bytes(tex_native)
-
-    except Exception as e:
-        print(f"NVTT ERROR: {name}: {e}")
-        return None
-
-    finally:
-        # Очистка временных файлов
-        if os.path.exists(input_file):
-            os.remove(input_file)
-        if os.path.exists(output_file):
-            os.remove(output_file)
 
-
-def write_rw_section_header(data, section_type, size):
-    data.extend(struct.pack('<III', section_type, size, RW_VERSION))
+def get_nvtt_compressor(nvcompress_path):
+    compressor = _nvtt_compressors.get(nvcompress_path)
+    if compressor is None:
+        compressor = _nvtt_compressors[nvcompress_path] = NvttCompressor(nvcompress_path)
+    return compressor
 
 
 def is_texture_connected_to_alpha(tex_node):
@@ -467,13 +320,89 @@ def is_texture_connected_to_alpha(tex_node):
     return False
 
 
-def check_image_has_transparent_pixels(image):
+def read_image_pixels_float(image):
+    """Read raw image pixels into a preallocated float32 buffer via foreach_get"""
+    # foreach_get пишет прямо в буфер, без промежуточного списка Python float
+    buf = np.empty(len(image.pixels), dtype=np.float32)
+    image.pixels.foreach_get(buf)
+    return buf
+
+
+def read_image_pixels(image, pixel_cache=None):
+    """Read image as top-down uint8 (H, W, 4) pixels and a transparency flag.
+
+    With pixel_cache (dict per export) every image is read only once, and the
+    same read serves alpha detection and compression.
+    """
+    if pixel_cache is not None and image.name in pixel_cache:
+        return pixel_cache[image.name]
+
+    width, height = image.size[0], image.size[1]
+    buf = read_image_pixels_float(image)
+    has_transparent = bool(len(buf) >= 4 and np.any(buf[3::4] < 0.99))
+
+    # Масштабируем на месте, в uint8 переводим один раз
+    np.multiply(buf, 255, out=buf)
+    pixels = np.flipud(buf.astype(np.uint8).reshape(height, width, 4))
+    del buf
+
+    entry = (pixels, has_transparent)
+    if pixel_cache is not None:
+        pixel_cache[image.name] = entry
+    return entry
+
+
+# Кэш анализа изображений на всю сессию Blender: {image.name: info}
+# info = {'signature', 'size', 'has_transparent', 'hash'} - без самих пикселей
+_image_analysis_cache = {}
+
+
+def get_image_signature(image):
+    """Cheap change signature of an image: dirty flag, size and source file mtime"""
+    filepath = bpy.path.abspath(image.filepath) if image.filepath else ''
+    mtime = 0.0
+    if filepath and not image.packed_file:
+        try:
+            mtime = os.path.getmtime(filepath)
+        except OSError:
+            pass
+    packed_size = image.packed_file.size if image.packed_file else 0
+    generated = ()
+    if image.source == 'GENERATED':
+        generated = (image.generated_type, tuple(image.generated_color))
+    return (image.is_dirty, tuple(image.size), image.source, filepath, mtime, packed_size, generated)
+
+
+def analyze_image(image, analysis, pixel_cache=None, use_session_cache=True):
+    """Alpha flag, size and pixel hash of an image, read at most once per export.
+
+    analysis is the per-export dict; with use_session_cache clean images whose
+    signature did not change are not read at all.
+    """
+    if image.name in analysis:
+        return analysis[image.name]
+
+    signature = get_image_signature(image)
+    info = _image_analysis_cache.get(image.name) if use_session_cache else None
+    if info is None or info['signature'] != signature:
+        pixels, has_transparent = read_image_pixels(image, pixel_cache)
+        info = {
+            'signature': signature,
+            'size': (image.size[0], image.size[1]),
+            'has_transparent': has_transparent,
+            'hash': hash_pixels(pixels),
+        }
+        # Изменённые в памяти (dirty) изображения нельзя сверить по сигнатуре
+        if use_session_cache and not image.is_dirty:
+            _image_analysis_cache[image.name] = info
+
+    analysis[image.name] = info
+    return info
+
+
+def check_image_has_transparent_pixels(image, pixel_cache=None):
     try:
-        pixels = np.array(image.pixels[:])
-        if len(pixels) < 4:
-            return False
-        alpha = pixels[3::4]
-        return np.any(alpha < 0.99)
+        return read_image_pixels(image, pixel_cache)[1]
     except:
         return False
 
@@ -486,10 +415,7 @@ def is_node_connected(node):
     return False
 
 
-def collect_textures(selected_only=False):
-    textures = {}
-    transparent_textures = set()
-
+def get_export_materials(selected_only=False):
     if selected_only:
         materials = set()
         for obj in bpy.context.selected_objects:
@@ -497,11 +423,27 @@ def collect_textures(selected_only=False):
                 for slot in obj.material_slots:
                     if slot.material:
                         materials.add(slot.material)
-        materials = list(materials)
-    else:
-        materials = bpy.data.materials
+        return list(materials)
+    return bpy.data.materials
+
 
+def alias_images(materials, aliases):
+    """Point image nodes that use a duplicate image at the kept one"""
     for mat in materials:
+        if not mat.use_nodes or not mat.node_tree:
+            continue
+        for node in mat.node_tree.nodes:
+            if node.type == 'TEX_IMAGE' and node.image in aliases:
+                node.image = aliases[node.image]
+
+
+def collect_textures(selected_only=False, pixel_cache=None, analysis=None, use_session_cache=False):
+    textures = {}
+    if analysis is None:
+        analysis = {}
+    transparent_textures = set()
+
+    for mat in get_export_materials(selected_only):
         if not mat.use_nodes or not mat.node_tree:
             continue
         for node in mat.node_tree.nodes:
@@ -513,7 +455,11 @@ def collect_textures(selected_only=False):
                 img = node.image
                 name = os.path.splitext(img.name)[0]
                 alpha_connected = is_texture_connected_to_alpha(node)
-                has_transparent = check_image_has_transparent_pixels(img)
+                # Одно изображение в десятках материалов анализируется один раз
+                try:
+                    has_transparent = analyze_image(img, analysis, pixel_cache, use_session_cache)['has_transparent']
+                except Exception:
+                    has_transparent = False
                 if has_transparent:
                     transparent_textures.add(img.name)
                 # DXT3 только если альфа подключена И есть прозрачные пиксели
@@ -527,394 +473,429 @@ def collect_textures(selected_only=False):
     return textures, list(transparent_textures)
 
 
-def downsample_image(pixels, width, height):
-    new_w = max(1, width // 2)
-    new_h = max(1, height // 2)
-    if width == 1 and height == 1:
-        return None, 0, 0
-    if width > 1 and height > 1:
-        reshaped = pixels[:new_h*2, :new_w*2].reshape(new_h, 2, new_w, 2, 4)
-        downsampled = reshaped.mean(axis=(1, 3)).astype(np.uint8)
-    elif width > 1:
-        downsampled = pixels[:1, :new_w*2].reshape(1, new_w, 2, 4).mean(axis=2).astype(np.uint8)
-    elif height > 1:
-        downsampled = pixels[:new_h*2, :1].reshape(new_h, 2, 1, 4).mean(axis=1).astype(np.uint8)
-    else:
-        return None, 0, 0
-    return downsampled, new_w, new_h
-
-
-def pad_to_4x4(pixels, width, height):
-    if width >= 4 and height >= 4:
-        return pixels, width, height
-    pad_w = max(4, width)
-    pad_h = max(4, height)
-    padded = np.zeros((pad_h, pad_w, 4), dtype=np.uint8)
-    padded[:height, :width] = pixels
-    if width < pad_w:
-        padded[:height, width:] = pixels[:, -1:, :]
-    if height < pad_h:
-        padded[height:, :width] = pixels[-1:, :, :]
-    if width < pad_w and height < pad_h:
-        padded[height:, width:] = pixels[-1, -1, :]
-    return padded, pad_w, pad_h
-
-
-def compress_dxt1_block(rgb):
-    rgb = rgb.astype(np.float32)
-    lum = rgb[:, 0] * 0.299 + rgb[:, 1] * 0.587 + rgb[:, 2] * 0.114
-    min_idx, max_idx = np.argmin(lum), np.argmax(lum)
-    c0, c1 = rgb[max_idx], rgb[min_idx]
-
-    def to_565(c):
-        r = int(np.clip(c[0] / 255.0 * 31 + 0.5, 0, 31))
-        g = int(np.clip(c[1] / 255.0 * 63 + 0.5, 0, 63))
-        b = int(np.clip(c[2] / 255.0 * 31 + 0.5, 0, 31))
-        return (r << 11) | (g << 5) | b
-
-    def from_565(c):
-        return np.array([
-            ((c >> 11) & 0x1F) * 255.0 / 31.0,
-            ((c >> 5) & 0x3F) * 255.0 / 63.0,
-            (c & 0x1F) * 255.0 / 31.0
-        ])
-
-    color0, color1 = to_565(c0), to_565(c1)
-
-    # Для DXT3 нужен режим 4 цветов (color0 > color1)
-    if color0 < color1:
-        color0, color1 = color1, color0
-
-    # Палитру строим из 565 значений (как будет при декомпрессии)
-    c0_565 = from_565(color0)
-    c1_565 = from_565(color1)
-    palette = np.array([c0_565, c1_565, (2.0*c0_565 + c1_565)/3.0, (c0_565 + 2.0*c1_565)/3.0])
-    indices = 0
-    for i in range(16):
-        dists = np.sum((rgb[i] - palette) ** 2, axis=1)
-        indices |= (np.argmin(dists) << (i * 2))
-    return struct.pack('<HHI', color0, color1, indices)
-
-
-def compress_dxt3_block(rgba):
-    alpha_data = 0
-    for i in range(16):
-        a4 = int(np.clip(rgba[i, 3] / 255.0 * 15 + 0.5, 0, 15))
-        alpha_data |= (a4 << (i * 4))
-    alpha_bytes = struct.pack('<Q', alpha_data)
-    color_bytes = compress_dxt1_block(rgba[:, :3])
-    return alpha_bytes + color_bytes
-
-
-def compress_miplevel_dxt1(pixels):
-    h, w = pixels.shape[:2]
-    compressed = bytearray()
-    for y in range(0, h, 4):
-        for x in range(0, w, 4):
-            block = pixels[y:y+4, x:x+4, :3].reshape(16, 3)
-            compressed.extend(compress_dxt1_block(block))
-    return bytes(compressed)
-
-
-def compress_miplevel_dxt3(pixels):
-    h, w = pixels.shape[:2]
-    compressed = bytearray()
-    for y in range(0, h, 4):
-        for x in range(0, w, 4):
-            block = pixels[y:y+4, x:x+4].reshape(16, 4)
-            compressed.extend(compress_dxt3_block(block))
-    return bytes(compressed)
-
-
-def create_texture_native(name, image, use_alpha):
-    width, height = image.size[0], image.size[1]
-    new_w = (width + 3) // 4 * 4
-    new_h = (height + 3) // 4 * 4
-
-    pixels = np.array(image.pixels[:]).reshape(height, width, 4)
-    pixels = (pixels * 255).astype(np.uint8)
-    pixels = np.flipud(pixels)
-
-    if new_w != width or new_h != height:
-        padded = np.zeros((new_h, new_w, 4), dtype=np.uint8)
-        padded[:height, :width] = pixels
-        if width < new_w:
-            padded[:height, width:] = pixels[:, -1:, :]
-        if height < new_h:
-            padded[height:, :] = padded[height-1:height, :]
-        pixels = padded
-        width, height = new_w, new_h
-
-    mip_levels = []
-    current_pixels = pixels
-    current_w, current_h = width, height
-
-    while current_w >= 1 and current_h >= 1:
-        compress_pixels, _, _ = pad_to_4x4(current_pixels, current_w, current_h)
-        if use_alpha:
-            compressed = compress_miplevel_dxt3(compress_pixels)
-        else:
-            compressed = compress_miplevel_dxt1(compress_pixels)
-        mip_levels.append(compressed)
-        current_pixels, current_w, current_h = downsample_image(current_pixels, current_w, current_h)
-        if current_pixels is None:
-            break
+def create_texture_native(name, image, use_alpha, pixel_cache=None, options=None):
+    return process_texture_parallel(prepare_texture_data(name, image, use_alpha, pixel_cache, options))
 
-    if use_alpha:
-        dxt_type = 3
-        raster_format = RASTER_8888 | RASTER_MIPMAP
-        depth = 32
-    else:
-        dxt_type = 1
-        raster_format = RASTER_565 | RASTER_MIPMAP
-        depth = 16
-
-    tex_name = name[:31].encode('ascii', errors='replace').ljust(32, b'\x00')
-    mip_count = len(mip_levels)
-    fourcc = b'DXT1' if dxt_type == 1 else b'DXT3'
-
-    struct_data = bytearray()
-    struct_data.extend(struct.pack('<II', PLATFORM_D3D9, make_filter_flags()))
-    struct_data.extend(tex_name)
-    struct_data.extend(b'\x00' * 32)
-    struct_data.extend(struct.pack('<I', raster_format))
-    struct_data.extend(fourcc)
-    struct_data.extend(struct.pack('<HH', width, height))
-    struct_data.extend(struct.pack('<B', depth))
-    struct_data.extend(struct.pack('<B', mip_count))
-    struct_data.extend(struct.pack('<B', 4))  # raster type
-    # D3D format flag: 0x08 для DXT1, 0x09 для DXT3 (с альфой)
-    struct_data.extend(struct.pack('<B', 0x09 if use_alpha else 0x08))
-
-    for mip_data in mip_levels:
-        struct_data.extend(struct.pack('<I', len(mip_data)))
-        struct_data.extend(mip_data)
-
-    tex_native = bytearray()
-    write_rw_section_header(tex_native, RW_STRUCT, len(struct_data))
-    tex_native.extend(struct_data)
-    write_rw_section_header(tex_native, RW_EXTENSION, 0)
-
-    return bytes(tex_native)
-
-
-def prepare_texture_data(name, image, use_alpha):
-    """Prepare texture data in main thread (Blender data access)"""
-    width, height = image.size[0], image.size[1]
-    pixels = np.array(image.pixels[:]).reshape(height, width, 4)
-    pixels = (pixels * 255).astype(np.uint8)
-    pixels = np.flipud(pixels)
-    return (name, pixels, width, height, use_alpha)
-
-
-def process_texture_parallel(texture_data):
-    """Process prepared texture data (can run in parallel)"""
-    name, pixels, width, height, use_alpha = texture_data
-
-    new_w = (width + 3) // 4 * 4
-    new_h = (height + 3) // 4 * 4
-
-    if new_w != width or new_h != height:
-        padded = np.zeros((new_h, new_w, 4), dtype=np.uint8)
-        padded[:height, :width] = pixels
-        if width < new_w:
-            padded[:height, width:] = pixels[:, -1:, :]
-        if height < new_h:
-            padded[height:, :] = padded[height-1:height, :]
-        pixels = padded
-        width, height = new_w, new_h
-
-    mip_levels = []
-    current_pixels = pixels
-    current_w, current_h = width, height
-
-    while current_w >= 1 and current_h >= 1:
-        compress_pixels, _, _ = pad_to_4x4(current_pixels, current_w, current_h)
-        if use_alpha:
-            compressed = compress_miplevel_dxt3(compress_pixels)
-        else:
-            compressed = compress_miplevel_dxt1(compress_pixels)
-        mip_levels.append(compressed)
-        current_pixels, current_w, current_h = downsample_image(current_pixels, current_w, current_h)
-        if current_pixels is None:
-            break
 
-    if use_alpha:
-        dxt_type = 3
-        raster_format = RASTER_8888 | RASTER_MIPMAP
-        depth = 32
-    else:
-        dxt_type = 1
-        raster_format = RASTER_565 | RASTER_MIPMAP
-        depth = 16
-
-    tex_name = name[:31].encode('ascii', errors='replace').ljust(32, b'\x00')
-    mip_count = len(mip_levels)
-    fourcc = b'DXT1' if dxt_type == 1 else b'DXT3'
-
-    struct_data = bytearray()
-    struct_data.extend(struct.pack('<II', PLATFORM_D3D9, make_filter_flags()))
-    struct_data.extend(tex_name)
-    struct_data.extend(b'\x00' * 32)
-    struct_data.extend(struct.pack('<I', raster_format))
-    struct_data.extend(fourcc)
-    struct_data.extend(struct.pack('<HH', width, height))
-    struct_data.extend(struct.pack('<B', depth))
-    struct_data.extend(struct.pack('<B', mip_count))
-    struct_data.extend(struct.pack('<B', 4))  # raster type
-    # D3D format flag: 0x08 для DXT1, 0x09 для DXT3 (с альфой)
-    struct_data.extend(struct.pack('<B', 0x09 if use_alpha else 0x08))
-
-    for mip_data in mip_levels:
-        struct_data.extend(struct.pack('<I', len(mip_data)))
-        struct_data.extend(mip_data)
-
-    tex_native = bytearray()
-    write_rw_section_header(tex_native, RW_STRUCT, len(struct_data))
-    tex_native.extend(struct_data)
-    write_rw_section_header(tex_native, RW_EXTENSION, 0)
-
-    return bytes(tex_native)
-
-
-def export_txd(filepath, context, selected_only=False, use_gpu=False):
-    textures, transparent_list = collect_textures(selected_only)
+def prepare_texture_data(name, image, use_alpha, pixel_cache=None, options=None, size=None):
+    """Prepare texture data in main thread (Blender data access).
+
+    size is the export size; pixels are resampled to it on the worker.
+    """
+    width, height = size or (image.size[0], image.size[1])
+    pixels, _ = read_image_pixels(image, pixel_cache)
+    return (name, pixels, width, height, use_alpha, options or encoder_options())
+
+
+def get_texture_raster(image, default=TXD_RASTER_DXT):
+    """Raster format of an image: custom property gtatools_txd_format overrides the scene setting"""
+    raster = str(image.get('gtatools_txd_format', default)).upper()
+    return raster if raster in TXD_RASTER_FORMATS else default
+
+
+def get_txd_encoder_options(scene):
+    """CPU encoder options from scene settings"""
+    options = encoder_options(
+        mip_filter=getattr(scene, 'gtatools_txd_mip_filter', MIP_FILTER_BOX),
+        alpha_weighted=getattr(scene, 'gtatools_txd_mip_alpha_weighted', False),
+        alpha_coverage=getattr(scene, 'gtatools_txd_mip_alpha_coverage', False),
+        quality=getattr(scene, 'gtatools_txd_quality', DXT_QUALITY_FAST),
+    )
+    # Фильтр ресемплинга входит в ключ кэша только когда изменение размера включено
+    if getattr(scene, 'gtatools_txd_resize', RESIZE_OFF) != RESIZE_OFF or getattr(scene, 'gtatools_txd_max_size', 0):
+        options['resize_filter'] = getattr(scene, 'gtatools_txd_resize_filter', RESAMPLE_BILINEAR)
+    return options
+
+
+class TxdExportPlan:
+    """Planned TXD export: textures, their sources and prepared pixels.
+
+    Built on the main thread by plan_txd_export; write_txd_export needs no
+    Blender data when the plan is a snapshot, so it can run on a worker thread.
+    """
+
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+def plan_txd_export(filepath, context, selected_only=False, use_gpu=False, dedup=None, snapshot=False, wm=None,
+                    allow_alias=False):
+    """Main-thread part of a TXD export, returns (plan, None) or (None, error message).
+
+    With snapshot pixels of every texture that may need compressing are read
+    up front, so writing the archive never falls back to Blender images.
+    allow_alias is for callers that export the DFF after the TXD (Export All):
+    otherwise the Alias duplicate mode falls back to Share.
+    """
+    scene = context.scene
+
+    # Пиксели читаются один раз: и для проверки альфы, и для сжатия
+    pixel_cache = {}
+    analysis = {}
+    use_session_cache = getattr(scene, 'gtatools_txd_session_analysis', False)
+    textures, transparent_list = collect_textures(selected_only, pixel_cache, analysis, use_session_cache)
     if not textures:
         msg = "No textures found on selected objects" if selected_only else "No textures found in scene"
-        return {'CANCELLED'}, msg, []
+        return None, msg
 
-    scene = context.scene
-    nvcompress_path = None
-    mode_name = "CPU"
+    compressor = None
+    backend = getattr(scene, 'gtatools_txd_backend', TXD_BACKEND_THREAD)
+    num_workers = getattr(scene, 'gtatools_txd_workers', 0)
+    options = get_txd_encoder_options(scene)
+    mode_name = "CPU" if backend == TXD_BACKEND_THREAD else "CPU, process pool"
 
     # Проверка GPU режима
     if use_gpu:
         nvtt_path = getattr(scene, 'gtatools_nvtt_path', '')
         available, result = check_nvtt_available(nvtt_path)
         if not available:
-            return {'CANCELLED'}, f"GPU режим недоступен: {result}\nУкажите путь к NVIDIA Texture Tools в настройках", []
-        nvcompress_path = result
+            return None, f"GPU режим недоступен: {result}\nУкажите путь к NVIDIA Texture Tools в настройках"
+        compressor = get_nvtt_compressor(result)
         mode_name = "GPU (NVTT)"
 
-    wm = context.window_manager
+    cache = None
+    if getattr(scene, 'gtatools_txd_use_cache', False):
+        cache_dir = bpy.path.abspath(scene.gtatools_txd_cache_dir) if scene.gtatools_txd_cache_dir else default_cache_dir()
+        cache = TextureCache(cache_dir, scene.gtatools_txd_cache_size_mb * 1024 * 1024)
+
+    # Инкрементальный режим: неизменённые текстуры берутся из существующего TXD как есть
+    incremental = getattr(scene, 'gtatools_txd_incremental', False)
+    dedup_mode = getattr(scene, 'gtatools_txd_dedup', TXD_DEDUP_OFF)
+    # Alias меняет материалы: DFF уже на диске ссылался бы на имя, которого нет в новом TXD
+    alias_disabled = dedup_mode == TXD_DEDUP_ALIAS and not allow_alias
+    if alias_disabled:
+        dedup_mode = TXD_DEDUP_SHARE
+    if dedup_mode == TXD_DEDUP_OFF:
+        dedup = None
+    previous, sidecar = open_previous_txd(filepath) if incremental else (None, {})
+
     total = len(textures)
-    wm.progress_begin(0, total * 2)
+    if wm:
+        wm.progress_begin(0, total * 2)
 
     # Разделяем на DXT1 и DXT3 для правильного порядка (DXT3 в конце)
-    dxt1_images = []  # (name, image, use_alpha) для GPU
-    dxt3_images = []
-    dxt1_data = []    # prepared data для CPU
-    dxt3_data = []
+    dxt1_entries = []  # (name, image, use_alpha)
+    dxt3_entries = []
 
     skipped_textures = []
+    resized_textures = []
+    export_sizes = {}
+    resize_mode = getattr(scene, 'gtatools_txd_resize', RESIZE_OFF)
+    max_size = getattr(scene, 'gtatools_txd_max_size', 0)
     for i, (name, (image, uses_alpha)) in enumerate(textures.items()):
-        wm.progress_update(i)
+        if wm:
+            wm.progress_update(i)
 
-        # Проверка размера - должен быть кратен 4 для DXT
+        # Размер экспорта: исходный или после ресемплинга / ограничения
         w, h = image.size[0], image.size[1]
-        if w % 4 != 0 or h % 4 != 0:
+        export_w, export_h = target_texture_size(w, h, resize_mode, max_size)
+        # Проверка размера - должен быть кратен 4 для DXT
+        if export_w % 4 != 0 or export_h % 4 != 0:
             print(f"[TXD] ПРОПУСК {name}: размер {w}x{h} не кратен 4 (DXT требует кратность 4)")
             skipped_textures.append(f"{name} ({w}x{h})")
             continue
-
-        print(f"[TXD] {name}: {w}x{h}, uses_alpha={uses_alpha}")
-        try:
-            if uses_alpha:
-                dxt3_images.append((name, image, True))
-                if not use_gpu:
-                    dxt3_data.append(prepare_texture_data(name, image, True))
-            else:
-                dxt1_images.append((name, image, False))
-                if not use_gpu:
-                    dxt1_data.append(prepare_texture_data(name, image, False))
-        except Exception as e:
-            print(f"TXD PREPARE ERROR: {name}: {e}")
-
-    dxt1_count = len(dxt1_images)
-    dxt3_count = len(dxt3_images)
+        if (export_w, export_h) != (w, h):
+            print(f"[TXD] {name}: {w}x{h} -> {export_w}x{export_h}")
+            resized_textures.append(f"{name} ({w}x{h} -> {export_w}x{export_h})")
+        export_sizes[name] = (export_w, export_h)
+
+        print(f"[TXD] {name}: {export_w}x{export_h}, uses_alpha={uses_alpha}")
+        if uses_alpha:
+            dxt3_entries.append((name, image, True))
+        else:
+            dxt1_entries.append((name, image, False))
+
+    dxt1_count = len(dxt1_entries)
+    entries = dxt1_entries + dxt3_entries
+
+    # Бюджет: сколько верхних мип-уровней отбросить у каждой текстуры (размеры DXT известны заранее)
+    budget_kb = getattr(scene, 'gtatools_txd_budget_kb', 0)
+    mip_max_size = getattr(scene, 'gtatools_txd_mip_max_size', 0)
+    # Формат растра: свойство изображения gtatools_txd_format или общий из настроек
+    default_raster = getattr(scene, 'gtatools_txd_raster', TXD_RASTER_DXT)
+    rasters = [get_texture_raster(image, default_raster) for _, image, _ in entries]
+    mip_skips = plan_mip_budget([export_sizes[name] + (use_alpha, raster)
+                                 for (name, _, use_alpha), raster in zip(entries, rasters)],
+                                budget_kb * 1024, mip_max_size)
+    entry_options = []
+    for skip, raster in zip(mip_skips, rasters):
+        overrides = {}
+        if skip:
+            overrides['mip_skip'] = skip
+        if raster != TXD_RASTER_DXT:
+            overrides['raster'] = raster
+        entry_options.append(dict(options, **overrides) if overrides else options)
 
     # Phase 2: Compression
-    tex_natives = []
-
-    if use_gpu and nvcompress_path:
-        # GPU режим - NVTT для DXT1, CPU для DXT3 (NVTT DXT3 некорректно работает)
-        for i, (name, image, _) in enumerate(dxt1_images):
+    # Источник каждой текстуры: старый TXD, дубликат, другой TXD этого запуска, кэш, NVTT или CPU пул.
+    # Запись идёт строго по индексам - порядок DXT1 -> DXT3 сохраняется, а в памяти только несколько готовых текстур
+    sources = [None] * len(entries)
+    cache_keys = [None] * len(entries)
+    reused = {}
+    first_by_key = {}    # ключ -> индекс первой текстуры с такими пикселями
+    dup_remaining = {}   # ключ -> сколько дубликатов ещё ждут готовую текстуру
+    duplicates = []      # (дубликат, оригинал)
+    aliases = {}         # изображение-дубликат -> оставленное изображение (режим ALIAS)
+
+    for i, (name, image, use_alpha) in enumerate(entries):
+        if wm:
             wm.progress_update(total + i)
+        width, height = export_sizes[name]
+        # GPU режим - NVTT для DXT1, CPU для DXT3 (NVTT DXT3 некорректно работает) и несжатых форматов
+        source = 'GPU' if compressor and i < dxt1_count and rasters[i] in DXT_RASTERS else 'CPU'
+        if cache or incremental or dedup_mode != TXD_DEDUP_OFF:
             try:
-                result = compress_with_nvtt(name, image, False, nvcompress_path)
-                if result:
-                    tex_natives.append(result)
-                else:
-                    data = prepare_texture_data(name, image, False)
-                    result = process_texture_parallel(data)
-                    tex_natives.append(result)
+                pixel_hash = analyze_image(image, analysis, pixel_cache, use_session_cache)['hash']
             except Exception as e:
-                print(f"TXD GPU ERROR: {name}: {e}")
+                print(f"TXD PREPARE ERROR: {name}: {e}")
+                continue
+            if source == 'GPU':
+                settings = ('NVTT', mip_skips[i]) if mip_skips[i] else ('NVTT',)
+                # NVTT получает уже ресемплированные пиксели - фильтр тоже часть ключа
+                if 'resize_filter' in entry_options[i]:
+                    settings += (('resize_filter', entry_options[i]['resize_filter']),)
+                # При пропуске уровней вход NVTT - уровень нашей mip цепочки
+                if mip_skips[i]:
+                    settings += tuple((option, entry_options[i][option])
+                                      for option in ('mip_filter', 'alpha_weighted', 'alpha_coverage'))
+            else:
+                settings = ('CPU',) + encoder_settings_key(entry_options[i])
+            key = cache_keys[i] = texture_cache_key(pixel_hash, width, height, use_alpha, settings)
+            texture = find_reusable_native(previous, sidecar, name, key) if previous else None
+
+            duplicate = dedup_mode != TXD_DEDUP_OFF and key in first_by_key
+            if duplicate:
+                original = entries[first_by_key[key]]
+                duplicates.append((name, original[0]))
+                if dedup_mode == TXD_DEDUP_ALIAS:
+                    aliases[image] = original[1]
+                    continue
 
-        # DXT3 через CPU
-        for i, (name, image, _) in enumerate(dxt3_images):
-            wm.progress_update(total + dxt1_count + i)
+            if texture is not None:
+                reused[i] = texture
+                source = 'TXD'
+            elif duplicate:
+                dup_remaining[key] = dup_remaining.get(key, 0) + 1
+                source = 'DUP'
+            elif dedup and dedup.find(key):
+                source = 'SHARED'
+            elif cache and cache.contains(key):
+                source = 'CACHE'
+            first_by_key.setdefault(key, i)
+        sources[i] = source
+
+    if aliases:
+        alias_images(get_export_materials(selected_only), aliases)
+    # Следующие TXD этого запуска могут брать эти текстуры ещё до того, как архив записан
+    if dedup:
+        dedup.reserve(key for key, source in zip(cache_keys, sources) if key and source)
+
+    # Пиксели читаются только для текстур, которые действительно надо сжать
+    # (в снимке - и для тех, что могут откатиться на CPU сжатие)
+    texture_data = {}
+    for i, source in enumerate(sources):
+        if source in ('GPU', 'CPU') or (snapshot and source in ('DUP', 'SHARED', 'CACHE')):
+            name, image, use_alpha = entries[i]
             try:
-                data = prepare_texture_data(name, image, True)
-                result = process_texture_parallel(data)
-                tex_natives.append(result)
+                texture_data[i] = prepare_texture_data(name, image, use_alpha, pixel_cache, entry_options[i],
+                                                       export_sizes[name])
             except Exception as e:
-                print(f"TXD CPU (DXT3) ERROR: {name}: {e}")
-    else:
-        # CPU режим - обрабатываем в правильном порядке (DXT1 первыми)
-        num_workers = min(8, os.cpu_count() or 4)
-
-        # Сначала DXT1
-        with ThreadPoolExecutor(max_workers=num_workers) as executor:
-            futures = [executor.submit(process_texture_parallel, data) for data in dxt1_data]
-            for i, future in enumerate(futures):
-                wm.progress_update(total + i)
-                try:
-                    result = future.result()
-                    tex_natives.append(result)
-                except Exception as e:
-                    print(f"TXD CPU ERROR: {e}")
-
-        # Потом DXT3
-        with ThreadPoolExecutor(max_workers=num_workers) as executor:
-            futures = [executor.submit(process_texture_parallel, data) for data in dxt3_data]
-            for i, future in enumerate(futures):
-                wm.progress_update(total + dxt1_count + i)
-                try:
-                    result = future.result()
-                    tex_natives.append(result)
-                except Exception as e:
-                    print(f"TXD CPU ERROR: {e}")
+                print(f"TXD PREPARE ERROR: {name}: {e}")
+                sources[i] = None
+    pixel_cache.clear()
+
+    plan = TxdExportPlan(
+        filepath=filepath, entries=entries, sources=sources, cache_keys=cache_keys, reused=reused,
+        dup_remaining=dup_remaining, duplicates=duplicates, texture_data=texture_data,
+        export_sizes=export_sizes, mip_skips=mip_skips, entry_options=entry_options,
+        compressor=compressor, backend=backend, num_workers=num_workers, mode_name=mode_name,
+        cache=cache, incremental=incremental, previous=previous, dedup=dedup, dedup_mode=dedup_mode,
+        budget_kb=budget_kb, skipped_textures=skipped_textures, resized_textures=resized_textures,
+        transparent_list=transparent_list, aliases=aliases, alias_disabled=alias_disabled,
+    )
+    return plan, None
 
-    wm.progress_end()
 
-    if not tex_natives:
-        return {'CANCELLED'}, "No textures could be processed", []
+def start_txd_jobs(plans):
+    """One NVTT batch and one CPU pool for the textures of all plans, results in plan order"""
+    gpu_data = [plan.texture_data[i] for plan in plans
+                for i, source in enumerate(plan.sources) if source == 'GPU']
+    cpu_data = [plan.texture_data.pop(i) for plan in plans
+                for i, source in enumerate(plan.sources) if source == 'CPU']
+    compressor = next((plan.compressor for plan in plans if plan.compressor), None)
+    backend, num_workers = plans[0].backend, plans[0].num_workers
+    return compress_textures_nvtt(gpu_data, compressor, num_workers), run_texture_jobs(cpu_data, backend, num_workers)
 
-    tex_natives_data = bytearray()
-    for tex_native in tex_natives:
-        write_rw_section_header(tex_natives_data, RW_TEXTURENATIVE, len(tex_native))
-        tex_natives_data.extend(tex_native)
 
-    struct_section = bytearray()
-    dict_struct = struct.pack('<HH', len(tex_natives), 0)
-    write_rw_section_header(struct_section, RW_STRUCT, len(dict_struct))
-    struct_section.extend(dict_struct)
+def write_txd_export(plan, gpu_jobs, cpu_jobs, wm=None):
+    """Compress, copy and write the planned textures; returns (status, message, transparent_list).
 
-    extension_data = bytearray()
-    write_rw_section_header(extension_data, RW_EXTENSION, 0)
+    gpu_jobs / cpu_jobs yield one result per 'GPU' / 'CPU' texture of the plan, in order.
+    """
+    entries, sources, cache_keys = plan.entries, plan.sources, plan.cache_keys
+    texture_data, dup_remaining = plan.texture_data, plan.dup_remaining
+    cache, dedup = plan.cache, plan.dedup
+    export_sizes, mip_skips = plan.export_sizes, plan.mip_skips
+    total = len(entries)
+
+    def compress_on_cpu(i):
+        """Fallback for NVTT failures and cache/shared entries that went missing"""
+        name, image, use_alpha = entries[i]
+        data = texture_data.pop(i, None) or prepare_texture_data(name, image, use_alpha, None, plan.entry_options[i],
+                                                                 export_sizes[name])
+        result, rmse_by_name[name] = encode_texture(data)
+        if cache and sources[i] == 'CACHE':
+            cache.put(cache_keys[i], result)
+        return result
 
-    with open(filepath, 'wb') as f:
-        content_size = len(struct_section) + len(tex_natives_data) + len(extension_data)
-        f.write(struct.pack('<III', RW_TEXDICTIONARY, content_size, RW_VERSION))
-        f.write(struct_section)
-        f.write(tex_natives_data)
-        f.write(extension_data)
+    written = {}
+    native_sizes = {}  # имя -> размер секции текстуры в архиве
+    native_formats = {}  # имя -> записанный формат (DXT1, DXT3, PAL8...)
+    rmse_by_name = {}  # только для текстур, сжатых в этом экспорте
+    held = {}  # готовые текстуры, которые ещё понадобятся дубликатам
+    reused_count = 0
+    with TxdWriter(plan.filepath) as writer:
+        for i, source in enumerate(sources):
+            if source is None:
+                continue
+            name = entries[i][0]
+            key = cache_keys[i]
+            if wm:
+                wm.progress_update(total + i)
+            tex_native = None
+            try:
+                if source == 'TXD':
+                    with plan.reused.pop(i).native_data() as data:
+                        tex_native = bytes(data) if dup_remaining.get(key) else data
+                        writer.add(tex_native)
+                        written[name.lower()] = {'key': key, 'crc': native_checksum(tex_native)}
+                        native_sizes[name] = len(tex_native)
+                        native_formats[name] = texture_native_format(tex_native)
+                    reused_count += 1
+                    if dup_remaining.get(key):
+                        held[key] = tex_native
+                    continue
+                if source == 'DUP':
+                    dup_remaining[key] -= 1
+                    original = held.pop(key) if not dup_remaining[key] else held.get(key)
+                    tex_native = set_texture_native_name(original, name) if original else compress_on_cpu(i)
+                elif source == 'SHARED':
+                    tex_native = dedup.read(key, name) or compress_on_cpu(i)
+                elif source == 'CACHE':
+                    tex_native = cache.get(key, name) or compress_on_cpu(i)
+                else:
+                    result, error = next(gpu_jobs if source == 'GPU' else cpu_jobs)
+                    if error is not None:
+                        print(f"TXD {source} ERROR: {name}: {error}")
+                    else:
+                        tex_native, rmse_by_name[name] = result
+                        if cache:
+                            cache.put(key, tex_native)
+                    if tex_native is None and source == 'GPU':
+                        tex_native = compress_on_cpu(i)
+            except Exception as e:
+                print(f"TXD CPU ERROR: {name}: {e}")
+            texture_data.pop(i, None)
+            if tex_native:
+                writer.add(tex_native)
+                native_sizes[name] = len(tex_native)
+                native_formats[name] = texture_native_format(tex_native)
+                if key:
+                    written[name.lower()] = {'key': key, 'crc': native_checksum(tex_native)}
+                    if source != 'DUP' and dup_remaining.get(key):
+                        held[key] = tex_native
+        # Старый файл отпускается до замены (на Windows отображённый файл нельзя заменить)
+        if plan.previous:
+            plan.previous.close()
+    texture_data.clear()
+    held.clear()
+
+    if cache:
+        cache.trim()
+
+    if not writer.count:
+        return {'CANCELLED'}, "No textures could be processed", []
 
-    msg = f"Exported {dxt1_count} DXT1 + {dxt3_count} DXT3 ({mode_name})"
-    if skipped_textures:
-        msg += f"\nПРОПУЩЕНО (размер не кратен 4): {', '.join(skipped_textures)}"
-    return {'FINISHED'}, msg, transparent_list
+    if plan.incremental:
+        save_txd_sidecar(plan.filepath, written)
+    if dedup:
+        dedup.register(plan.filepath, written)
+
+    format_counts = {'DXT1': 0, 'DXT3': 0}
+    for texture_format in native_formats.values():
+        format_counts[texture_format] = format_counts.get(texture_format, 0) + 1
+    # DXT1 + DXT3 как раньше, остальные форматы - только если есть
+    counts = [f"{count} {name}" for name, count in format_counts.items() if count or name in ('DXT1', 'DXT3')]
+    msg = f"Exported {' + '.join(counts)} ({plan.mode_name})"
+    if plan.incremental:
+        msg += f", reused {reused_count} / rebuilt {writer.count - reused_count}"
+    if cache:
+        msg += f", {cache.summary()}"
+    if rmse_by_name:
+        for name, rmse in rmse_by_name.items():
+            print(f"[TXD] {name}: RMSE {rmse:.2f}")
+        worst = max(rmse_by_name, key=rmse_by_name.get)
+        average = sum(rmse_by_name.values()) / len(rmse_by_name)
+        msg += f", RMSE avg {average:.2f} / max {rmse_by_name[worst]:.2f} ({worst})"
+    shared_count = sources.count('SHARED')
+    if shared_count:
+        msg += f", {shared_count} shared with previous TXDs"
+    duplicates = plan.duplicates
+    if duplicates:
+        msg += f", {len(duplicates)} duplicate(s)"
+        for name, original in duplicates:
+            print(f"[TXD] ДУБЛИКАТ {name} = {original}")
+        if plan.dedup_mode == TXD_DEDUP_ALIAS:
+            msg += f"\nОБЪЕДИНЕНО: {', '.join(f'{name} -> {original}' for name, original in duplicates)}"
+        elif plan.dedup_mode == TXD_DEDUP_REPORT:
+            msg += f"\nДУБЛИКАТЫ: {', '.join(f'{name} = {original}' for name, original in duplicates)}"
+        elif plan.alias_disabled:
+            msg += "\nAlias только в Export All (DFF пишется после TXD): дубликаты записаны под своими именами"
+    if plan.resized_textures:
+        msg += f"\nИЗМЕНЁН РАЗМЕР: {', '.join(plan.resized_textures)}"
+
+    # Итоговый размер архива и вклад каждой текстуры
+    print(f"[TXD] Размер архива: {writer.size / 1024:.1f} KB")
+    dropped = []
+    for i, (name, image, use_alpha) in enumerate(entries):
+        if name not in native_sizes:
+            continue
+        width, height = export_sizes[name]
+        skip = mip_skips[i]
+        line = f"[TXD]   {name}: {native_sizes[name] / 1024:.1f} KB, {width >> skip}x{height >> skip} {native_formats[name]}"
+        if skip:
+            line += f" (-{skip} mip, {width}x{height})"
+            dropped.append(f"{name} ({width}x{height} -> {width >> skip}x{height >> skip})")
+        print(line)
+    msg += f"\nРазмер TXD: {writer.size / 1024:.1f} KB"
+    budget_kb = plan.budget_kb
+    if budget_kb:
+        msg += f" / бюджет {budget_kb} KB"
+        if writer.size > budget_kb * 1024:
+            msg += " (ПРЕВЫШЕН: отбрасывать больше нечего)"
+    if dropped:
+        msg += f"\nОТБРОШЕНЫ МИПЫ: {', '.join(dropped)}"
+    if plan.skipped_textures:
+        msg += f"\nПРОПУЩЕНО (размер не кратен 4): {', '.join(plan.skipped_textures)}"
+    return {'FINISHED'}, msg, plan.transparent_list
+
+
+def export_txd(filepath, context, selected_only=False, use_gpu=False, dedup=None, allow_alias=False):
+    """Export a TXD; dedup is a TextureDedup shared by several exports of one run"""
+    wm = context.window_manager
+    try:
+        plan, error = plan_txd_export(filepath, context, selected_only, use_gpu, dedup, wm=wm,
+                                      allow_alias=allow_alias)
+        if plan is None:
+            return {'CANCELLED'}, error, []
+        gpu_jobs, cpu_jobs = start_txd_jobs([plan])
+        try:
+            return write_txd_export(plan, gpu_jobs, cpu_jobs, wm)
+        finally:
+            gpu_jobs.close()
+            cpu_jobs.close()
+    finally:
+        wm.progress_end()
 
 
 # =============================================================================
@@ -1006,9 +987,14 @@ def find_selected_models():
 
 def find_all_selected_model_groups():
     """Find all DFF/LOD/COL model groups among selected objects, grouped by base_name"""
+    return find_model_groups(bpy.context.selected_objects)
+
+
+def find_model_groups(objects):
+    """Group DFF/LOD/COL mesh objects by base_name"""
     groups = {}  # {base_name: {'DFF': obj, 'LOD': obj, 'COL': obj}}
 
-    for obj in bpy.context.selected_objects:
+    for obj in objects:
         if obj.type != 'MESH':
             continue
 
@@ -1046,66 +1032,158 @@ def get_base_name_from_selected():
     return None
 
 
-def fix_col_model_name(col_path, model_name):
-    """
-    Исправить имя модели внутри COL файла после экспорта.
+def col_surface(mat):
+    """COL surface (material, flag, brightness, light) from DragonFF collision material settings"""
+    settings = getattr(mat, 'dff', None) if mat else None
+    if settings is None:
+        return (0, 0, 0, 0)
+    # Свет грани: день в младших 4 битах, ночь в старших
+    light = (getattr(settings, 'col_day_light', 0) & 0x0F) | ((getattr(settings, 'col_night_light', 0) & 0x0F) << 4)
+    return (getattr(settings, 'col_mat_index', 0) & 0xFF, getattr(settings, 'col_flags', 0) & 0xFF,
+            getattr(settings, 'col_brightness', 0) & 0xFF, light)
 
-    Структура COL заголовка:
-    - Offset 0-3: Magic (COLL/COL2/COL3/COL4)
-    - Offset 4-7: File size (uint32)
-    - Offset 8-29: Model name (22 bytes, null-terminated)
-    - Offset 30-31: Model ID (uint16)
 
-    Args:
-        col_path: Путь к COL файлу
-        model_name: Имя модели для записи (без расширения .col)
+def col_empty_surface(empty):
+    """COL surface (material, flag, brightness, light) of a sphere/box empty from its DragonFF object settings"""
+    settings = getattr(empty, 'dff', None)
+    if settings is None:
+        return (0, 0, 0, 0)
+    return (getattr(settings, 'col_material', 0) & 0xFF, getattr(settings, 'col_flags', 0) & 0xFF,
+            getattr(settings, 'col_brightness', 0) & 0xFF, getattr(settings, 'col_light', 0) & 0xFF)
 
-    Returns:
-        True если успешно, False если ошибка
-    """
-    try:
-        # Читаем файл
-        with open(col_path, 'rb') as f:
-            data = bytearray(f.read())
 
-        if len(data) < 32:
-            return False
+def dff_object_type(obj):
+    """DragonFF object type (OBJ/COL/SHA/...), None without DragonFF"""
+    return getattr(getattr(obj, 'dff', None), 'type', None)
 
-        # Проверяем что это COL файл
-        magic = data[0:4]
-        if magic not in (b'COLL', b'COL2', b'COL3', b'COL4'):
-            return False
 
-        # Убираем расширение .col если есть
-        if model_name.lower().endswith('.col'):
-            model_name = model_name[:-4]
+def is_col_mesh(obj):
+    return obj.type == 'MESH' and (get_model_type(obj)[0] == 'COL' or dff_object_type(obj) == 'COL')
 
-        # Кодируем имя модели (макс 21 символ + null terminator)
-        # Пробуем ASCII, если не получается - используем latin-1 с заменой
-        try:
-            name_bytes = model_name.encode('ascii')
-        except UnicodeEncodeError:
-            # Для кириллицы и других символов - транслитерация или замена
-            name_bytes = model_name.encode('latin-1', errors='replace')
 
-        # Обрезаем до 21 байта (22-й = null terminator)
-        name_bytes = name_bytes[:21]
+def is_dragonff_col_part(obj):
+    """Sphere/box empty or shadow mesh of a DragonFF COL import (typed or named by the importer)"""
+    if obj.type == 'EMPTY':
+        return dff_object_type(obj) == 'COL' or '.ColSphere' in obj.name or '.ColBox' in obj.name
+    return obj.type == 'MESH' and dff_object_type(obj) == 'SHA'
 
-        # Дополняем нулями до 22 байт
-        name_bytes = name_bytes.ljust(22, b'\x00')
 
-        # Записываем имя модели в заголовок (offset 8)
-        data[8:30] = name_bytes
+def col_parts(obj):
+    """Objects that belong to a COL object, returns (parts, unmapped [(object, reason)]).
 
-        # Сохраняем файл
-        with open(col_path, 'wb') as f:
-            f.write(data)
+    Parts are the children of the COL object plus, as DragonFF lays out an
+    imported COL model (one collection, unparented empties), the DragonFF
+    COL parts of its collections. A collection holding another COL mesh is
+    ambiguous: its unparented parts are reported, not guessed.
+    """
+    parts = list(obj.children)
+    unmapped = []
+    for collection in obj.users_collection:
+        shared = any(other is not obj and is_col_mesh(other) for other in collection.objects)
+        for other in collection.objects:
+            if other is obj or other.parent is not None or other in parts or not is_dragonff_col_part(other):
+                continue
+            if shared:
+                unmapped.append((other, f"collection {collection.name} holds several COL models"))
+            else:
+                parts.append(other)
+    return parts, unmapped
 
-        return True
 
-    except Exception as e:
-        print(f"fix_col_model_name error: {e}")
-        return False
+def col_primitives(obj):
+    """Collision spheres and boxes of a COL object, returns (spheres, boxes, unmapped).
+
+    Empties with Sphere / Cube display from col_parts; the surface comes from
+    the empty's DragonFF collision settings. Positions are relative to the
+    COL object (COL is always exported at the origin).
+    """
+    spheres = []
+    boxes = []
+    parts, unmapped = col_parts(obj)
+    origin = obj.matrix_world.translation
+    for part in parts:
+        if part.type != 'EMPTY':
+            continue
+        center = tuple(part.matrix_world.translation - origin)
+        scale = [abs(v) * part.empty_display_size for v in part.matrix_world.to_scale()]
+        surface = col_empty_surface(part)
+        if part.empty_display_type == 'SPHERE':
+            spheres.append((center, max(scale), surface))
+        elif part.empty_display_type == 'CUBE':
+            boxes.append((tuple(c - s for c, s in zip(center, scale)), tuple(c + s for c, s in zip(center, scale)),
+                          surface))
+        elif is_dragonff_col_part(part):
+            unmapped.append((part, f"empty display {part.empty_display_type} is neither Sphere nor Cube"))
+    return spheres, boxes, unmapped
+
+
+def read_col_mesh(obj, depsgraph):
+    """Triangles of a COL object as arrays: (vertices (V, 3), faces (F, 3), face surfaces (F, 2)).
+
+    Reads the evaluated mesh (modifiers applied) with foreach_get; rotation and
+    scale of the object are applied, its location is not. The scene is not changed.
+    """
+    evaluated = obj.evaluated_get(depsgraph)
+    mesh = evaluated.to_mesh()
+    try:
+        mesh.calc_loop_triangles()
+        vertices = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+        mesh.vertices.foreach_get('co', vertices)
+        faces = np.empty(len(mesh.loop_triangles) * 3, dtype=np.int32)
+        mesh.loop_triangles.foreach_get('vertices', faces)
+        material_indices = np.empty(len(mesh.loop_triangles), dtype=np.int32)
+        mesh.loop_triangles.foreach_get('material_index', material_indices)
+    finally:
+        evaluated.to_mesh_clear()
+
+    # COL всегда в центре (0,0,0): матрица объекта без перемещения
+    matrix = np.array(obj.matrix_world, dtype=np.float64)[:3, :3]
+    vertices = vertices.reshape(-1, 3) @ matrix.T
+
+    # Поверхность грани (материал, свет) - по слоту материала
+    surfaces = np.array([col_surface(slot.material) for slot in obj.material_slots] or [(0, 0, 0, 0)],
+                        dtype=np.uint8)[:, [0, 3]]
+    face_surfaces = surfaces[np.clip(material_indices, 0, len(surfaces) - 1)]
+    return vertices, faces.reshape(-1, 3), face_surfaces
+
+
+def col_shadow_parts(obj):
+    """Shadow meshes of a COL object: DragonFF 'SHA' meshes among its col_parts"""
+    return [part for part in col_parts(obj)[0] if part.type == 'MESH' and dff_object_type(part) == 'SHA']
+
+
+def read_col_shadow(obj, depsgraph):
+    """Shadow mesh of a COL object as (vertices, faces, face surfaces), several merged into one; None if absent"""
+    shadows = col_shadow_parts(obj)
+    if not shadows:
+        return None
+    origin = np.array(obj.matrix_world.translation, dtype=np.float64)
+    vertices, faces, surfaces = [], [], []
+    count = 0
+    for shadow in shadows:
+        shadow_vertices, shadow_faces, shadow_surfaces = read_col_mesh(shadow, depsgraph)
+        # Положение тени - относительно COL объекта (COL экспортируется в центре)
+        vertices.append(shadow_vertices + (np.array(shadow.matrix_world.translation, dtype=np.float64) - origin))
+        faces.append(shadow_faces + count)
+        surfaces.append(shadow_surfaces)
+        count += len(shadow_vertices)
+    return np.concatenate(vertices), np.concatenate(faces), np.concatenate(surfaces)
+
+
+def export_col(filepath, models, depsgraph):
+    """Write COL3 models [(model_name, obj)] into one file in one pass, returns its size"""
+    data = []
+    for model_name, obj in models:
+        vertices, faces, face_surfaces = read_col_mesh(obj, depsgraph)
+        shadow = read_col_shadow(obj, depsgraph)
+        for label, points in (("vertices", vertices), ("shadow vertices", shadow[0] if shadow else ())):
+            if len(points) and np.abs(points).max() > COL_MAX_COORD:
+                print(f"COL WARNING: {obj.name}: {label} beyond ±{COL_MAX_COORD:.0f} m are clamped")
+        spheres, boxes, unmapped = col_primitives(obj)
+        for part, reason in unmapped:
+            print(f"COL WARNING: {obj.name}: {part.name} not exported ({reason})")
+        data.append(build_col3(model_name, vertices, faces, face_surfaces, spheres, boxes, shadow=shadow))
+    return write_col(filepath, data)
 
 
 def get_base_name_from_selection():
@@ -1138,6 +1216,415 @@ def get_model_textures(obj):
     return textures
 
 
+# =============================================================================
+# EXPORT MANIFEST
+# =============================================================================
+
+# Увеличивать при изменении экспорта групп - все выходные файлы пересоберутся
+EXPORT_MANIFEST_VERSION = 1
+EXPORT_MANIFEST_NAME = "export_all.inu.json"
+
+# Тип атрибута меша -> (свойство для foreach_get, компонент на элемент, dtype)
+MESH_ATTRIBUTE_LAYOUT = {
+    'FLOAT': ('value', 1, np.float32),
+    'INT': ('value', 1, np.int32),
+    'INT8': ('value', 1, np.int32),
+    'BOOLEAN': ('value', 1, bool),
+    'FLOAT2': ('vector', 2, np.float32),
+    'INT32_2D': ('value', 2, np.int32),
+    'FLOAT_VECTOR': ('vector', 3, np.float32),
+    'FLOAT_COLOR': ('color', 4, np.float32),
+    'BYTE_COLOR': ('color', 4, np.float32),
+    'QUATERNION': ('value', 4, np.float32),
+    'FLOAT4X4': ('value', 16, np.float32),
+}
+
+
+# Свойства интерфейса и времени выполнения - не влияют на экспорт
+RNA_IGNORED_PROPS = {
+    'rna_type', 'name_full', 'select', 'location', 'width', 'height', 'dimensions', 'hide', 'label',
+    'color', 'use_custom_color', 'show_expanded', 'show_options', 'show_preview', 'show_texture',
+    'is_active', 'is_override_data', 'persistent_uid', 'execution_time', 'show_on_cage', 'show_in_editmode',
+}
+
+# Свойства материала, которые попадают в DFF
+MATERIAL_FINGERPRINT_PROPS = ('diffuse_color', 'specular_intensity', 'roughness', 'metallic',
+                              'blend_method', 'alpha_threshold', 'use_backface_culling')
+
+
+def rna_value(value):
+    """Hashable plain value of an RNA property (ID pointers by name)"""
+    if isinstance(value, (bool, int, float, str)) or value is None:
+        return value
+    # Ссылки на ID (объект, изображение) сравниваем по имени
+    name = getattr(value, 'name', None)
+    if isinstance(name, str):
+        return name
+    try:
+        return tuple(value)
+    except TypeError:
+        return None
+
+
+def rna_values(struct):
+    """Plain property values of an RNA struct (modifier, node, DragonFF settings)"""
+    values = []
+    for prop in struct.bl_rna.properties:
+        if prop.identifier in RNA_IGNORED_PROPS or prop.type == 'COLLECTION':
+            continue
+        try:
+            values.append((prop.identifier, rna_value(getattr(struct, prop.identifier))))
+        except AttributeError:
+            continue
+    return values
+
+
+def hash_mesh(mesh, digest):
+    """Feed geometry, UVs, colors and face data of a mesh into a hashlib digest"""
+    for name in sorted(mesh.attributes.keys()):
+        attribute = mesh.attributes[name]
+        layout = MESH_ATTRIBUTE_LAYOUT.get(attribute.data_type)
+        digest.update(repr((name, attribute.domain, attribute.data_type, len(attribute.data))).encode())
+        if layout is None:
+            continue
+        prop, components, dtype = layout
+        buf = np.empty(len(attribute.data) * components, dtype=dtype)
+        attribute.data.foreach_get(prop, buf)
+        digest.update(buf.tobytes())
+
+    loop_totals = np.empty(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get('loop_total', loop_totals)
+    digest.update(loop_totals.tobytes())
+
+
+def material_fingerprint(mat, image_analysis=None):
+    """Nodes, links and settings of a material; image pixel hashes if image_analysis is given"""
+    if mat is None:
+        return None
+    nodes = []
+    links = []
+    if mat.use_nodes and mat.node_tree:
+        for node in sorted(mat.node_tree.nodes, key=lambda n: n.name):
+            # Ноды превью прелайта не попадают в экспорт
+            if node.name.startswith("Prelight_"):
+                continue
+            inputs = [(socket.identifier, rna_value(getattr(socket, 'default_value', None)))
+                      for socket in node.inputs if not socket.is_linked]
+            image = None
+            if node.type == 'TEX_IMAGE' and node.image:
+                image = node.image.name
+                if image_analysis is not None:
+                    image = (image, analyze_image(node.image, image_analysis, use_session_cache=True)['hash'])
+            nodes.append((node.bl_idname, node.name, rna_values(node), inputs, image))
+        links = sorted((link.from_node.name, link.from_socket.identifier,
+                        link.to_node.name, link.to_socket.identifier) for link in mat.node_tree.links
+                       if not link.from_node.name.startswith("Prelight_")
+                       and not link.to_node.name.startswith("Prelight_"))
+    settings = [rna_value(getattr(mat, name, None)) for name in MATERIAL_FINGERPRINT_PROPS]
+    return (mat.name, settings, nodes, links)
+
+
+def object_fingerprint(obj, *extra):
+    """Fingerprint of a DFF/LOD/COL source object: mesh, modifiers, materials, transforms"""
+    digest = hashlib.sha1()
+    parent = obj.parent.name if obj.parent else None
+    matrix = tuple(tuple(row) for row in obj.matrix_world)
+    digest.update(repr((EXPORT_MANIFEST_VERSION, obj.name, obj.type, parent, matrix) + extra).encode())
+    if obj.type == 'MESH':
+        hash_mesh(obj.data, digest)
+    for mod in obj.modifiers:
+        digest.update(repr((mod.type, rna_values(mod))).encode())
+    for slot in obj.material_slots:
+        digest.update(repr(material_fingerprint(slot.material)).encode())
+    # Настройки DragonFF (тип объекта, пайплайн и т.д.)
+    if hasattr(obj, 'dff'):
+        digest.update(repr(rna_values(obj.dff)).encode())
+    return digest.hexdigest()
+
+
+def txd_fingerprint(context, models, use_gpu, image_analysis):
+    """Fingerprint of a group TXD: image pixel hashes and TXD export settings"""
+    digest = hashlib.sha1()
+    scene = context.scene
+    settings = sorted((name, repr(getattr(scene, name))) for name in scene.bl_rna.properties.keys()
+                      if name.startswith('gtatools_txd_'))
+    digest.update(repr((EXPORT_MANIFEST_VERSION, TXD_ENCODER_VERSION, bool(use_gpu), settings)).encode())
+    for model_type in ['DFF', 'LOD']:
+        obj = models[model_type]
+        if obj is None:
+            continue
+        for slot in obj.material_slots:
+            digest.update(repr(material_fingerprint(slot.material, image_analysis)).encode())
+    return digest.hexdigest()
+
+
+def model_group_outputs(base_name, models, skip_txd):
+    """Output files of a model group: {filename: model_type}"""
+    outputs = {}
+    if (models['DFF'] or models['LOD']) and not skip_txd:
+        outputs[f"{base_name}.txd"] = 'TXD'
+    if models['DFF']:
+        outputs[f"{base_name}.dff"] = 'DFF'
+    if models['LOD']:
+        outputs[f"LOD{base_name}.dff"] = 'LOD'
+    if models['COL']:
+        outputs[f"{base_name}.col"] = 'COL'
+    return outputs
+
+
+def model_group_fingerprints(context, base_name, models, skip_txd, use_gpu, image_analysis):
+    """Fingerprint of every output file of a model group"""
+    fingerprints = {}
+    for filename, model_type in model_group_outputs(base_name, models, skip_txd).items():
+        if model_type == 'TXD':
+            fingerprints[filename] = txd_fingerprint(context, models, use_gpu, image_analysis)
+        elif model_type == 'COL':
+            # Имя модели записывается внутрь COL файла, сферы, боксы и теневой меш - из col_parts
+            obj = models[model_type]
+            fingerprints[filename] = object_fingerprint(obj, model_type, base_name, COL_WRITER_VERSION,
+                                                        col_primitives(obj)[:2],
+                                                        tuple(object_fingerprint(part) for part in col_shadow_parts(obj)))
+        else:
+            fingerprints[filename] = object_fingerprint(models[model_type], model_type, base_name)
+    return fingerprints
+
+
+def export_manifest_path(directory):
+    return os.path.join(directory, EXPORT_MANIFEST_NAME)
+
+
+def load_export_manifest(directory):
+    """Previous {filename: fingerprint} of an output directory, empty if missing or unreadable"""
+    try:
+        with open(export_manifest_path(directory), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if data.get('version') != EXPORT_MANIFEST_VERSION:
+        return {}
+    return data.get('outputs', {})
+
+
+def save_export_manifest(directory, outputs):
+    path = export_manifest_path(directory)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': EXPORT_MANIFEST_VERSION, 'outputs': outputs}, f, indent=1, sort_keys=True)
+        os.replace(temp_path, path)
+    except OSError as e:
+        print(f"EXPORT MANIFEST WRITE ERROR: {e}")
+
+
+def select_model_group_textures(context, models):
+    """Select DFF and LOD of a group, so TXD export collects their textures"""
+    bpy.ops.object.select_all(action='DESELECT')
+    # Выделяем DFF и LOD для сбора текстур
+    if models['DFF']:
+        models['DFF'].select_set(True)
+        context.view_layer.objects.active = models['DFF']
+    if models['LOD']:
+        models['LOD'].select_set(True)
+        if not models['DFF']:
+            context.view_layer.objects.active = models['LOD']
+
+
+def write_txd_exports(plans, results):
+    """Write planned TXDs in order, compressing all of them on one NVTT batch and one CPU pool.
+
+    Runs on a worker thread (plans are snapshots, no Blender data is touched);
+    results[key] = (status, message) is set as soon as each archive is written.
+    """
+    if not plans:
+        return
+    gpu_jobs, cpu_jobs = start_txd_jobs(list(plans.values()))
+    try:
+        for key, plan in plans.items():
+            # Каждому архиву - ровно его задачи, даже если запись оборвалась с ошибкой
+            plan_gpu_jobs = itertools.islice(gpu_jobs, plan.sources.count('GPU'))
+            plan_cpu_jobs = itertools.islice(cpu_jobs, plan.sources.count('CPU'))
+            try:
+                status, message, _ = write_txd_export(plan, plan_gpu_jobs, plan_cpu_jobs)
+            except Exception as e:
+                status, message = {'CANCELLED'}, str(e)
+            for _ in itertools.chain(plan_gpu_jobs, plan_cpu_jobs):
+                pass
+            results[key] = (status, message)
+    finally:
+        gpu_jobs.close()
+        cpu_jobs.close()
+
+
+def export_model_group(context, directory, base_name, models, skip_txd, use_gpu, dedup=None, outputs=None):
+    """Export a single model group (DFF + LOD + COL + TXD) into directory.
+
+    outputs limits the export to these file names (None - all files of the group).
+    """
+    exported = []
+    errors = []
+    if outputs is None:
+        outputs = model_group_outputs(base_name, models, skip_txd)
+
+    # Экспорт TXD (текстуры из DFF + LOD в один архив)
+    # TXD первым: в режиме ALIAS материалы перенаправляются до экспорта DFF
+    if f"{base_name}.txd" in outputs and not skip_txd:
+        txd_path = os.path.join(directory, f"{base_name}.txd")
+        try:
+            select_model_group_textures(context, models)
+            result, message, _ = export_txd(txd_path, context, selected_only=True, use_gpu=use_gpu,
+                                            dedup=dedup, allow_alias=True)
+            if result == {'FINISHED'}:
+                exported.append(f"{base_name}.txd")
+            else:
+                errors.append(f"{base_name}.txd: {message}")
+        except Exception as e:
+            errors.append(f"{base_name}.txd: {str(e)}")
+
+    # Экспорт DFF (версия GTA SA)
+    if models['DFF'] and f"{base_name}.dff" in outputs:
+        dff_path = os.path.join(directory, f"{base_name}.dff")
+        try:
+            bpy.ops.object.select_all(action='DESELECT')
+            models['DFF'].select_set(True)
+            context.view_layer.objects.active = models['DFF']
+
+            bpy.ops.export_dff.scene(
+                filepath=dff_path,
+                export_version='0x36003',
+                only_selected=True,
+                export_coll=False
+            )
+
+            exported.append(f"{base_name}.dff")
+        except Exception as e:
+            errors.append(f"{base_name}.dff: {str(e)}")
+
+    # Экспорт LOD (с префиксом LOD, версия GTA SA)
+    if models['LOD'] and f"LOD{base_name}.dff" in outputs:
+        lod_path = os.path.join(directory, f"LOD{base_name}.dff")
+        try:
+            bpy.ops.object.select_all(action='DESELECT')
+            models['LOD'].select_set(True)
+            context.view_layer.objects.active = models['LOD']
+
+            bpy.ops.export_dff.scene(
+                filepath=lod_path,
+                export_version='0x36003',
+                only_selected=True,
+                export_coll=False
+            )
+
+            exported.append(f"LOD{base_name}.dff")
+        except Exception as e:
+            errors.append(f"LOD{base_name}.dff: {str(e)}")
+
+    # Экспорт COL (COL3, встроенная запись - сцена не меняется)
+    if models['COL'] and f"{base_name}.col" in outputs:
+        col_path = os.path.join(directory, f"{base_name}.col")
+        try:
+            export_col(col_path, [(base_name, models['COL'])], context.evaluated_depsgraph_get())
+            exported.append(f"{base_name}.col")
+        except Exception as e:
+            errors.append(f"{base_name}.col: {str(e)}")
+
+    return exported, errors
+
+
+def export_model_groups(context, directory, model_groups, skip_txd, use_gpu, force=False):
+    """Export several model groups, returns {base_name: (exported, skipped, errors)}.
+
+    Outputs whose source fingerprint matches the manifest in directory are skipped
+    unless force is set.
+    """
+    results = {}
+    wm = context.window_manager
+    # Одинаковые текстуры разных групп сжимаются один раз за запуск
+    dedup = TextureDedup()
+    manifest = load_export_manifest(directory)
+
+    # Превью прелайта ломает экспорт - на время экспорта оно обходится одной связью на материал
+    objects = [models[model_type] for models in model_groups.values() for model_type in ['DFF', 'LOD']]
+    with detached_prelight_preview(objects):
+        # Отпечатки снимаются при обойдённом превью - в том же состоянии, что видит экспорт
+        image_analysis = {}
+        todo = {}
+        for base_name, models in model_groups.items():
+            fingerprints = model_group_fingerprints(context, base_name, models, skip_txd, use_gpu, image_analysis)
+            outputs = {filename for filename, fingerprint in fingerprints.items()
+                       if force or manifest.get(filename) != fingerprint
+                       or not os.path.isfile(os.path.join(directory, filename))}
+            todo[base_name] = (fingerprints, outputs)
+
+        # TXD первым: пиксели всех групп снимаются здесь (в режиме ALIAS материалы перенаправляются до DFF),
+        # сжатие всех групп идёт в одном пуле, а готовые TXD пишутся фоновым потоком, пока здесь идут DFF/COL
+        txd_plans = {}
+        txd_results = {}
+        for base_name, models in model_groups.items():
+            txd_name = f"{base_name}.txd"
+            if txd_name not in todo[base_name][1]:
+                continue
+            try:
+                select_model_group_textures(context, models)
+                txd_plan, error = plan_txd_export(os.path.join(directory, txd_name), context, selected_only=True,
+                                                  use_gpu=use_gpu, dedup=dedup, snapshot=True, allow_alias=True)
+            except Exception as e:
+                txd_plan, error = None, str(e)
+            if txd_plan is None:
+                txd_results[base_name] = ({'CANCELLED'}, error)
+            else:
+                txd_plans[base_name] = txd_plan
+
+        # Alias перенаправил материалы: в манифест идут отпечатки после объединения (их увидит следующий
+        # запуск), а DFF/LOD с изменёнными материалами пишутся заново - старые ссылаются на убранные имена
+        if any(txd_plan.aliases for txd_plan in txd_plans.values()):
+            for base_name, models in model_groups.items():
+                fingerprints, outputs = todo[base_name]
+                aliased = model_group_fingerprints(context, base_name, models, skip_txd, use_gpu, image_analysis)
+                outputs |= {filename for filename, fingerprint in aliased.items()
+                            if fingerprint != fingerprints[filename] and filename != f"{base_name}.txd"}
+                todo[base_name] = (aliased, outputs)
+        txd_writer = threading.Thread(target=write_txd_exports, args=(txd_plans, txd_results), daemon=True)
+        txd_writer.start()
+
+        # Прогресс-бар: по одному шагу на DFF/LOD/COL файл
+        total_steps = sum(len(outputs) for _, outputs in todo.values())
+        current_step = 0
+        wm.progress_begin(0, total_steps)
+
+        try:
+            # Экспортируем каждую группу моделей
+            for base_name, models in model_groups.items():
+                fingerprints, outputs = todo[base_name]
+                model_outputs = outputs - {f"{base_name}.txd"}
+                exported, errors = [], []
+                if model_outputs:
+                    wm.progress_update(current_step)
+                    exported, errors = export_model_group(context, directory, base_name, models, skip_txd, use_gpu,
+                                                          dedup, model_outputs)
+                    current_step += len(model_outputs)
+                results[base_name] = (exported, sorted(set(fingerprints) - outputs), errors)
+        finally:
+            txd_writer.join()
+            wm.progress_end()
+
+            for base_name, (exported, skipped, errors) in results.items():
+                if base_name in txd_plans or base_name in txd_results:
+                    status, message = txd_results.get(base_name, ({'CANCELLED'}, "TXD writer failed"))
+                    if status == {'FINISHED'}:
+                        exported.insert(0, f"{base_name}.txd")
+                    else:
+                        errors.insert(0, f"{base_name}.txd: {message}")
+                fingerprints, outputs = todo[base_name]
+                for filename in outputs:
+                    if filename in exported:
+                        manifest[filename] = fingerprints[filename]
+                    else:
+                        manifest.pop(filename, None)
+            save_export_manifest(directory, manifest)
+
+    return results
+
+
 # =============================================================================
 # PRELIGHT
 # =============================================================================
@@ -1732,6 +2219,65 @@ def analyze_vertex_colors(obj):
     }
 
 
+def detach_prelight_link(mat):
+    """Route the source of Prelight_Mix straight into Base Color.
+
+    Returns (mix_output, base_color_input) to restore, or None if the material
+    shows no prelight preview. The preview nodes themselves stay in place.
+    """
+    if not mat.use_nodes or not mat.node_tree:
+        return None
+    mix_node = mat.node_tree.nodes.get("Prelight_Mix")
+    if mix_node is None:
+        return None
+
+    for link in mat.node_tree.links:
+        if link.from_node == mix_node and link.to_node.type == 'BSDF_PRINCIPLED' \
+                and link.to_socket.name == 'Base Color':
+            break
+    else:
+        return None
+
+    mix_output, base_color_input = link.from_socket, link.to_socket
+    # Вход A (текстура или Lightmap_Mix) - у Mix ноды несколько входов с именем A, берём подключённый
+    source = next((socket.links[0].from_socket for socket in mix_node.inputs
+                   if socket.name == 'A' and socket.is_linked), None)
+    links = mat.node_tree.links
+    links.remove(link)
+    if source is not None:
+        links.new(source, base_color_input)
+    return mix_output, base_color_input
+
+
+@contextlib.contextmanager
+def detached_prelight_preview(objects):
+    """Export-scoped prelight preview bypass for the materials of objects.
+
+    Only the Prelight_Mix -> Base Color link is swapped (DragonFF expects the
+    texture there), so no nodes are created or removed and shaders are not
+    rebuilt. The links are restored on exit, also when the export fails.
+    """
+    detached = []
+    seen = set()
+    try:
+        for obj in objects:
+            if obj is None or obj.type != 'MESH':
+                continue
+            for slot in obj.material_slots:
+                mat = slot.material
+                if not mat or mat.name in seen:
+                    continue
+                seen.add(mat.name)
+                restore = detach_prelight_link(mat)
+                if restore:
+                    detached.append((mat, restore))
+        yield len(detached)
+    finally:
+        for mat, (mix_output, base_color_input) in detached:
+            # Новая связь заменяет временную - у входа Base Color всегда одна связь
+            mat.node_tree.links.new(mix_output, base_color_input)
+
+
 def setup_prelight_preview(obj, enable=True):
     """Setup materials to show vertex colors multiplied with textures in Material Preview
 
@@ -2730,7 +3276,7 @@ class GTATOOLS_OT_export_txd(bpy.types.Operator, ExportHelper):
     """Export textures to TXD archive"""
     bl_idname = "gtatools.export_txd"
     bl_label = "Export TXD"
-    bl_options = {'PRESET'}
+    bl_options = {'PRESET', 'UNDO'}
     filename_ext = ".txd"
     filter_glob: StringProperty(default="*.txd", options={'HIDDEN'})
 
@@ -2750,6 +3296,8 @@ class GTATOOLS_OT_export_txd(bpy.types.Operator, ExportHelper):
     def draw(self, context):
         layout = self.layout
         layout.prop(self, "selected_only")
+        # Качество общее с Export All - одна настройка сцены
+        layout.prop(context.scene, "gtatools_txd_quality")
 
 
 class GTATOOLS_OT_export_dff(bpy.types.Operator, ExportHelper):
@@ -2763,23 +3311,15 @@ class GTATOOLS_OT_export_dff(bpy.types.Operator, ExportHelper):
     def execute(self, context):
         # Check if DragonFF is available
         try:
-            # Отключаем превью прелайта перед экспортом (иначе экспорт ломается)
-            for obj in context.selected_objects:
-                if obj.type == 'MESH':
-                    setup_prelight_preview(obj, enable=False)
-
-            # export_version='0x36003' = GTA SA, only_selected=True, export_coll=False
-            bpy.ops.export_dff.scene(
-                filepath=self.filepath,
-                export_version='0x36003',
-                only_selected=True,
-                export_coll=False
-            )
-
-            # Включаем превью прелайта обратно после экспорта
-            for obj in context.selected_objects:
-                if obj.type == 'MESH':
-                    setup_prelight_preview(obj, enable=True)
+            # Превью прелайта обходится на время экспорта (иначе экспорт ломается)
+            with detached_prelight_preview(context.selected_objects):
+                # export_version='0x36003' = GTA SA, only_selected=True, export_coll=False
+                bpy.ops.export_dff.scene(
+                    filepath=self.filepath,
+                    export_version='0x36003',
+                    only_selected=True,
+                    export_coll=False
+                )
 
             self.report({'INFO'}, f"Exported DFF: {self.filepath}")
             return {'FINISHED'}
@@ -2797,44 +3337,18 @@ class GTATOOLS_OT_export_col(bpy.types.Operator, ExportHelper):
     filter_glob: StringProperty(default="*.col", options={'HIDDEN'})
 
     def execute(self, context):
-        # Check if collision exporter is available
         try:
-            # Отключаем превью прелайта перед экспортом (иначе экспорт ломается)
-            for obj in context.selected_objects:
-                if obj.type == 'MESH':
-                    setup_prelight_preview(obj, enable=False)
-                    # Устанавливаем тип объекта как Collision для DragonFF
-                    if hasattr(obj, 'dff'):
-                        obj.dff.type = 'COL'
-
-            # COL всегда экспортируется в центре (0,0,0)
-            original_locations = {}
-            for obj in context.selected_objects:
-                if obj.type == 'MESH':
-                    original_locations[obj.name] = obj.location.copy()
-                    obj.location = (0, 0, 0)
-
-            # export_version='3' = GTA SA (COL3), only_selected=True
-            bpy.ops.export_col.scene(
-                filepath=self.filepath,
-                export_version='3',
-                only_selected=True
-            )
-
-            # Возвращаем оригинальные позиции
-            for obj in context.selected_objects:
-                if obj.name in original_locations:
-                    obj.location = original_locations[obj.name]
+            # Теневой меш пишется вместе со своей COL моделью, отдельной моделью он не бывает
+            objects = [obj for obj in context.selected_objects if obj.type == 'MESH' and dff_object_type(obj) != 'SHA']
+            if not objects:
+                self.report({'ERROR'}, T("Выберите меш объект!"))
+                return {'CANCELLED'}
 
-            # Исправляем имя модели внутри COL файла
-            # Берём имя из имени файла (без расширения)
+            # Первая модель называется по имени файла, остальные - по базовому имени объекта
             model_name = os.path.splitext(os.path.basename(self.filepath))[0]
-            fix_col_model_name(self.filepath, model_name)
-
-            # Включаем превью прелайта обратно после экспорта
-            for obj in context.selected_objects:
-                if obj.type == 'MESH':
-                    setup_prelight_preview(obj, enable=True)
+            models = [(model_name if i == 0 else get_model_type(obj)[1].rstrip('_'), obj)
+                      for i, obj in enumerate(objects)]
+            export_col(self.filepath, models, context.evaluated_depsgraph_get())
 
             self.report({'INFO'}, f"Exported COL: {self.filepath}")
             return {'FINISHED'}
@@ -2847,7 +3361,7 @@ class GTATOOLS_OT_export_all(bpy.types.Operator):
     """Export all selected models (DFF + COL + LOD + TXD) - supports multiple model groups"""
     bl_idname = "gtatools.export_all"
     bl_label = "Export All (DFF+COL+LOD+TXD)"
-    bl_options = {'REGISTER'}
+    bl_options = {'REGISTER', 'UNDO'}
 
     directory: StringProperty(subtype='DIR_PATH')
 
@@ -2855,102 +3369,6 @@ class GTATOOLS_OT_export_all(bpy.types.Operator):
         context.window_manager.fileselect_add(self)
         return {'RUNNING_MODAL'}
 
-    def export_model_group(self, context, base_name, models, skip_txd, use_gpu):
-        """Export a single model group (DFF + LOD + COL + TXD)"""
-        exported = []
-        errors = []
-
-        # Экспорт DFF (версия GTA SA)
-        if models['DFF']:
-            dff_path = os.path.join(self.directory, f"{base_name}.dff")
-            try:
-                bpy.ops.object.select_all(action='DESELECT')
-                models['DFF'].select_set(True)
-                context.view_layer.objects.active = models['DFF']
-
-                bpy.ops.export_dff.scene(
-                    filepath=dff_path,
-                    export_version='0x36003',
-                    only_selected=True,
-                    export_coll=False
-                )
-
-                exported.append(f"{base_name}.dff")
-            except Exception as e:
-                errors.append(f"{base_name}.dff: {str(e)}")
-
-        # Экспорт LOD (с префиксом LOD, версия GTA SA)
-        if models['LOD']:
-            lod_path = os.path.join(self.directory, f"LOD{base_name}.dff")
-            try:
-                bpy.ops.object.select_all(action='DESELECT')
-                models['LOD'].select_set(True)
-                context.view_layer.objects.active = models['LOD']
-
-                bpy.ops.export_dff.scene(
-                    filepath=lod_path,
-                    export_version='0x36003',
-                    only_selected=True,
-                    export_coll=False
-                )
-
-                exported.append(f"LOD{base_name}.dff")
-            except Exception as e:
-                errors.append(f"LOD{base_name}.dff: {str(e)}")
-
-        # Экспорт COL (версия GTA SA COL3)
-        if models['COL']:
-            col_path = os.path.join(self.directory, f"{base_name}.col")
-            try:
-                bpy.ops.object.select_all(action='DESELECT')
-                models['COL'].select_set(True)
-                context.view_layer.objects.active = models['COL']
-                # Устанавливаем тип объекта как Collision для DragonFF
-                if hasattr(models['COL'], 'dff'):
-                    models['COL'].dff.type = 'COL'
-
-                # COL всегда экспортируется в центре (0,0,0)
-                original_col_loc = models['COL'].location.copy()
-                models['COL'].location = (0, 0, 0)
-
-                bpy.ops.export_col.scene(
-                    filepath=col_path,
-                    export_version='3',
-                    only_selected=True
-                )
-
-                # Возвращаем позицию
-                models['COL'].location = original_col_loc
-
-                # Исправляем имя модели внутри COL файла
-                fix_col_model_name(col_path, base_name)
-                exported.append(f"{base_name}.col")
-            except Exception as e:
-                errors.append(f"{base_name}.col: {str(e)}")
-
-        # Экспорт TXD (текстуры из DFF + LOD в один архив)
-        if (models['DFF'] or models['LOD']) and not skip_txd:
-            txd_path = os.path.join(self.directory, f"{base_name}.txd")
-            try:
-                bpy.ops.object.select_all(action='DESELECT')
-                # Выделяем DFF и LOD для сбора текстур
-                if models['DFF']:
-                    models['DFF'].select_set(True)
-                    context.view_layer.objects.active = models['DFF']
-                if models['LOD']:
-                    models['LOD'].select_set(True)
-                    if not models['DFF']:
-                        context.view_layer.objects.active = models['LOD']
-                result, message, _ = export_txd(txd_path, context, selected_only=True, use_gpu=use_gpu)
-                if result == {'FINISHED'}:
-                    exported.append(f"{base_name}.txd")
-                else:
-                    errors.append(f"{base_name}.txd: {message}")
-            except Exception as e:
-                errors.append(f"{base_name}.txd: {str(e)}")
-
-        return exported, errors
-
     def execute(self, context):
         # Ищем все группы моделей среди выделенных
         model_groups = find_all_selected_model_groups()
@@ -2959,62 +3377,24 @@ class GTATOOLS_OT_export_all(bpy.types.Operator):
             self.report({'ERROR'}, T("Выделите модели для экспорта!"))
             return {'CANCELLED'}
 
-        # Disable prelight preview before export (otherwise export breaks)
-        for base_name, models in model_groups.items():
-            for model_type in ['DFF', 'LOD', 'COL']:
-                if models[model_type] and models[model_type].type == 'MESH':
-                    setup_prelight_preview(models[model_type], enable=False)
-
-        all_exported = []
-        all_errors = []
-        wm = context.window_manager
-
         # Настройки экспорта
         skip_txd = context.scene.gtatools_export_all_skip_txd
         use_gpu = context.scene.gtatools_txd_use_gpu
 
-        # Считаем общее количество шагов для прогресс-бара
-        total_steps = 0
-        for base_name, models in model_groups.items():
-            total_steps += sum([
-                1 if models['DFF'] else 0,
-                1 if models['LOD'] else 0,
-                1 if models['COL'] else 0,
-                1 if (models['DFF'] or models['LOD']) and not skip_txd else 0
-            ])
-
-        current_step = 0
-        wm.progress_begin(0, total_steps)
-
-        # Экспортируем каждую группу моделей
-        for base_name, models in model_groups.items():
-            wm.progress_update(current_step)
-            exported, errors = self.export_model_group(context, base_name, models, skip_txd, use_gpu)
-            all_exported.extend(exported)
-            all_errors.extend(errors)
-
-            # Обновляем прогресс
-            current_step += sum([
-                1 if models['DFF'] else 0,
-                1 if models['LOD'] else 0,
-                1 if models['COL'] else 0,
-                1 if (models['DFF'] or models['LOD']) and not skip_txd else 0
-            ])
-
-        wm.progress_end()
+        force = context.scene.gtatools_export_all_force
 
-        # Включаем превью прелайта обратно после экспорта
-        for base_name, models in model_groups.items():
-            for model_type in ['DFF', 'LOD', 'COL']:
-                if models[model_type] and models[model_type].type == 'MESH':
-                    setup_prelight_preview(models[model_type], enable=True)
+        results = export_model_groups(context, self.directory, model_groups, skip_txd, use_gpu, force)
+        all_exported = [name for exported, _, _ in results.values() for name in exported]
+        all_errors = [error for _, _, errors in results.values() for error in errors]
+        num_skipped = sum(1 for exported, _, errors in results.values() if not exported and not errors)
 
         # Result
         num_groups = len(model_groups)
         if all_exported:
             self.report({'INFO'}, f"{T('Экспортировано:')} {len(all_exported)} файлов ({num_groups} моделей)")
+        self.report({'INFO'}, f"{T('Без изменений:')} {num_skipped}, {T('пересобрано:')} {num_groups - num_skipped}")
         if all_errors:
-            self.report({'WARNING'}, f"{T('Ошибки:')} {'; '.join(errors)}")
+            self.report({'WARNING'}, f"{T('Ошибки:')} {'; '.join(all_errors)}")
 
         return {'FINISHED'}
 
@@ -4348,7 +4728,7 @@ class GTATOOLS_OT_load_textures(bpy.types.Operator):
                 image.reload()
 
             if image.channels >= 4 and len(image.pixels) > 0:
-                pixels = np.array(image.pixels[:])
+                pixels = read_image_pixels_float(image)
                 alpha = pixels[3::4]
                 transparent_count = int(np.sum(alpha < 0.95))
                 print(f"[Texture] {image.name}: прозрачных = {transparent_count}")
@@ -4513,7 +4893,7 @@ class GTATOOLS_OT_drop_texture_as_material(bpy.types.Operator):
         # Проверяем альфа канал
         if image.channels >= 4:
             try:
-                pixels = np.array(image.pixels[:])
+                pixels = read_image_pixels_float(image)
                 alpha = pixels[3::4]
                 transparent_count = int(np.sum(alpha < 0.95))
                 if transparent_count > 5000:
@@ -4707,6 +5087,7 @@ class GTATOOLS_PT_export_panel(bpy.types.Panel):
         row.operator("gtatools.export_all", text="Export All (DFF+COL+LOD+TXD)", icon='EXPORT')
         row = layout.row(align=True)
         row.prop(context.scene, "gtatools_export_all_skip_txd", text=T("Пропустить TXD"))
+        row.prop(context.scene, "gtatools_export_all_force", text=T("Все заново"))
 
         layout.separator()
 
@@ -4727,6 +5108,48 @@ class GTATOOLS_PT_export_panel(bpy.types.Panel):
         row = layout.row(align=True)
         row.prop(context.scene, "gtatools_txd_use_gpu", text="GPU (NVTT)", toggle=True)
 
+        # CPU бэкенд: потоки или процессы
+        if not context.scene.gtatools_txd_use_gpu:
+            row = layout.row(align=True)
+            row.prop(context.scene, "gtatools_txd_backend", expand=True)
+            row = layout.row(align=True)
+            row.prop(context.scene, "gtatools_txd_workers", text=T("Потоков/процессов"))
+
+        # Кэш сжатых текстур
+        row = layout.row(align=True)
+        row.prop(context.scene, "gtatools_txd_use_cache", text=T("Кэш TXD"), toggle=True)
+        if context.scene.gtatools_txd_use_cache:
+            row.prop(context.scene, "gtatools_txd_cache_size_mb", text=T("МБ"))
+            layout.prop(context.scene, "gtatools_txd_cache_dir", text="")
+        row = layout.row(align=True)
+        row.prop(context.scene, "gtatools_txd_session_analysis", text=T("Кэш анализа на сессию"))
+        row = layout.row(align=True)
+        row.prop(context.scene, "gtatools_txd_incremental", text=T("Только изменённые"), toggle=True)
+        row = layout.row(align=True)
+        row.prop(context.scene, "gtatools_txd_dedup", text=T("Дубликаты"))
+
+        # Изменение размера текстур
+        row = layout.row(align=True)
+        row.prop(context.scene, "gtatools_txd_resize", text=T("Размер"))
+        row.prop(context.scene, "gtatools_txd_max_size", text=T("Макс."))
+        if context.scene.gtatools_txd_resize != RESIZE_OFF or context.scene.gtatools_txd_max_size:
+            layout.prop(context.scene, "gtatools_txd_resize_filter", text=T("Фильтр"))
+        row = layout.row(align=True)
+        row.prop(context.scene, "gtatools_txd_raster", text=T("Формат"))
+        row = layout.row(align=True)
+        row.prop(context.scene, "gtatools_txd_budget_kb", text=T("Бюджет КБ"))
+        row.prop(context.scene, "gtatools_txd_mip_max_size", text=T("Макс. мип"))
+
+        # Мип-уровни и качество DXT (CPU сжатие)
+        if not context.scene.gtatools_txd_use_gpu:
+            row = layout.row(align=True)
+            row.prop(context.scene, "gtatools_txd_mip_filter", expand=True)
+            row = layout.row(align=True)
+            row.prop(context.scene, "gtatools_txd_quality", text=T("Качество"))
+            row = layout.row(align=True)
+            row.prop(context.scene, "gtatools_txd_mip_alpha_weighted", text=T("Альфа-взвеш."), toggle=True)
+            row.prop(context.scene, "gtatools_txd_mip_alpha_coverage", text=T("Покрытие альфы"), toggle=True)
+
         # Проверка NVTT если включен GPU
         if context.scene.gtatools_txd_use_gpu:
             nvtt_path = context.scene.gtatools_nvtt_path
@@ -5556,6 +5979,111 @@ class GTATOOLS_PT_uv_tools_panel(bpy.types.Panel):
         row.operator("gtatools.snap_uv_to_grid", text=T("Привязать"), icon='SNAP_GRID')
 
 
+# =============================================================================
+# HEADLESS CLI
+# =============================================================================
+
+def cli_argv(argv=None):
+    """Arguments after '--' in Blender's command line"""
+    if argv is None:
+        argv = sys.argv
+        argv = argv[argv.index('--') + 1:] if '--' in argv else []
+    return argv
+
+
+def cli_parse_args(argv=None):
+    """Parse headless Export All arguments"""
+    parser = argparse.ArgumentParser(
+        prog="blender -b file.blend --python-expr ... --",
+        description="Export All (DFF + LOD + COL + TXD) without UI")
+    parser.add_argument('--output', '-o', required=True, help="Output directory")
+    parser.add_argument('--collection', '-c', action='append', default=[],
+                        help="Export objects of this collection (with children), can repeat")
+    parser.add_argument('--pattern', '-p', action='append', default=[],
+                        help="Model base name pattern (fnmatch, e.g. 'road_*'), can repeat")
+    parser.add_argument('--names', '-n', nargs='+', default=[],
+                        help="Model base names (Model1 Model2 ...)")
+    parser.add_argument('--skip-txd', action='store_true', default=None,
+                        help="Do not export TXD (default: scene setting)")
+    parser.add_argument('--gpu', action='store_true', default=None,
+                        help="Compress TXD with NVIDIA Texture Tools (default: scene setting)")
+    parser.add_argument('--force', action='store_true', default=None,
+                        help="Re-export unchanged models too (default: scene setting)")
+    return parser.parse_args(cli_argv(argv))
+
+
+def cli_collect_groups(context, args):
+    """Model groups to export, returns (model_groups, errors)"""
+    errors = []
+    if args.collection:
+        objects = []
+        for name in args.collection:
+            collection = bpy.data.collections.get(name)
+            if collection is None:
+                errors.append(f"collection not found: {name}")
+                continue
+            objects.extend(collection.all_objects)
+    else:
+        objects = list(context.scene.objects)
+
+    # Только объекты текущего view layer можно выделить для экспорта
+    view_layer_objects = set(context.view_layer.objects)
+    groups = find_model_groups(obj for obj in dict.fromkeys(objects) if obj in view_layer_objects)
+
+    if args.pattern or args.names:
+        wanted = set(args.names)
+        groups = {base_name: models for base_name, models in groups.items()
+                  if base_name in wanted or any(fnmatch.fnmatchcase(base_name, p) for p in args.pattern)}
+        for name in args.names:
+            if name not in groups:
+                errors.append(f"model not found: {name}")
+
+    return groups, errors
+
+
+def cli_main(argv=None):
+    """Headless Export All, prints a JSON summary and returns the exit code
+
+    blender -b file.blend --python-expr "import addon_utils, sys;
+        sys.exit(addon_utils.enable('inu_tools_gta_sa').cli_main())" -- --output out --collection Models
+    """
+    args = cli_parse_args(argv)
+    context = bpy.context
+    directory = os.path.abspath(bpy.path.abspath(args.output))
+    os.makedirs(directory, exist_ok=True)
+
+    model_groups, errors = cli_collect_groups(context, args)
+    if not model_groups:
+        errors.append("no models to export")
+
+    scene = context.scene
+    skip_txd = scene.gtatools_export_all_skip_txd if args.skip_txd is None else args.skip_txd
+    use_gpu = scene.gtatools_txd_use_gpu if args.gpu is None else args.gpu
+    force = scene.gtatools_export_all_force if args.force is None else args.force
+
+    results = export_model_groups(context, directory, model_groups, skip_txd, use_gpu, force) if model_groups else {}
+
+    groups = {base_name: {'exported': exported, 'skipped': skipped, 'errors': group_errors}
+              for base_name, (exported, skipped, group_errors) in results.items()}
+    num_exported = sum(len(group['exported']) for group in groups.values())
+    num_unchanged = sum(1 for group in groups.values() if not group['exported'] and not group['errors'])
+    num_errors = len(errors) + sum(len(group['errors']) for group in groups.values())
+    summary = {
+        'blend': bpy.data.filepath,
+        'output': directory,
+        'groups': groups,
+        'errors': errors,
+        'exported': num_exported,
+        'groups_unchanged': num_unchanged,
+        'groups_rebuilt': len(groups) - num_unchanged,
+        'failed': num_errors,
+        'ok': num_errors == 0,
+    }
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    sys.stdout.flush()
+    return 0 if num_errors == 0 else 1
+
+
 # =============================================================================
 # REGISTRATION
 # =============================================================================
@@ -5696,6 +6224,165 @@ def register():
         default=False
     )
 
+    bpy.types.Scene.gtatools_txd_backend = EnumProperty(
+        name="TXD Backend",
+        description="CPU backend for TXD compression",
+        items=[
+            (TXD_BACKEND_THREAD, "Threads", "Thread pool (low startup cost)"),
+            (TXD_BACKEND_PROCESS, "Processes", "Process pool, pixels passed via shared memory (uses all cores)"),
+        ],
+        default=TXD_BACKEND_THREAD
+    )
+
+    bpy.types.Scene.gtatools_txd_workers = IntProperty(
+        name="TXD Workers",
+        description="Number of TXD compression workers (0 = auto)",
+        default=0,
+        min=0,
+        max=64
+    )
+
+    bpy.types.Scene.gtatools_txd_use_cache = BoolProperty(
+        name="TXD Cache",
+        description="Reuse compressed textures from the disk cache when pixels and settings are unchanged",
+        default=True
+    )
+
+    bpy.types.Scene.gtatools_txd_cache_dir = StringProperty(
+        name="TXD Cache Folder",
+        description="Compressed texture cache folder (empty = system temp folder). Must be empty or an existing cache",
+        default="",
+        subtype='DIR_PATH'
+    )
+
+    bpy.types.Scene.gtatools_txd_cache_size_mb = IntProperty(
+        name="TXD Cache Size",
+        description="Cache size limit in MB, least recently used entries are evicted",
+        default=1024,
+        min=16,
+        max=65536
+    )
+
+    bpy.types.Scene.gtatools_txd_session_analysis = BoolProperty(
+        name="Session Analysis Cache",
+        description="Remember alpha/size/hash of unchanged images between exports (skips re-reading pixels)",
+        default=True
+    )
+
+    bpy.types.Scene.gtatools_txd_incremental = BoolProperty(
+        name="Incremental TXD Update",
+        description="Copy unchanged textures from the existing TXD byte for byte and recompress only changed ones "
+                    "(source keys are kept in a .inu.json file next to the TXD)",
+        default=True
+    )
+
+    bpy.types.Scene.gtatools_txd_dedup = EnumProperty(
+        name="Duplicate Textures",
+        description="Handling of textures with identical pixels under different names",
+        items=[
+            (TXD_DEDUP_OFF, "Off", "Compress every texture separately"),
+            (TXD_DEDUP_SHARE, "Share", "Compress identical pixels once, keep every texture name"),
+            (TXD_DEDUP_REPORT, "Report", "Like Share, and list duplicates in the export report"),
+            (TXD_DEDUP_ALIAS, "Alias", "Keep one TXD entry and point materials to the kept image (Export All only: edits materials, DFF is exported after TXD)"),
+        ],
+        default=TXD_DEDUP_SHARE
+    )
+
+    bpy.types.Scene.gtatools_txd_resize = EnumProperty(
+        name="Resize Textures",
+        description="Resample textures instead of skipping sizes that are not a multiple of 4",
+        items=[
+            (RESIZE_OFF, "Off", "Keep sizes, skip textures that are not a multiple of 4"),
+            (RESIZE_MULTIPLE_4, "Multiple of 4", "Resample to the nearest multiple of 4"),
+            (RESIZE_POW2, "Power of 2", "Resample to the nearest power of two"),
+        ],
+        default=RESIZE_OFF
+    )
+
+    bpy.types.Scene.gtatools_txd_resize_filter = EnumProperty(
+        name="Resize Filter",
+        description="Filter used when textures are resampled",
+        items=[
+            (RESAMPLE_BOX, "Box", "Area average (sharp, fast)"),
+            (RESAMPLE_BILINEAR, "Bilinear", "Triangle filter"),
+            (RESAMPLE_LANCZOS, "Lanczos", "Lanczos-3 (sharpest, slower)"),
+        ],
+        default=RESAMPLE_BILINEAR
+    )
+
+    bpy.types.Scene.gtatools_txd_max_size = IntProperty(
+        name="Max Texture Size",
+        description="Downscale textures whose larger side exceeds this size (0 = no limit)",
+        default=0,
+        min=0,
+        max=8192
+    )
+
+    bpy.types.Scene.gtatools_txd_raster = EnumProperty(
+        name="Raster Format",
+        description="Texture format; an image custom property 'gtatools_txd_format' overrides it per texture",
+        items=[
+            (TXD_RASTER_DXT, "DXT", "DXT1, or DXT3 for textures with alpha"),
+            (TXD_RASTER_DXT5, "DXT5", "DXT1, or DXT5 (interpolated alpha) for textures with alpha"),
+            (TXD_RASTER_DXT_AUTO, "DXT Auto", "DXT1, or DXT3/DXT5 chosen from the alpha histogram"),
+            (TXD_RASTER_AUTO, "Auto", "DXT Auto, or PAL8/8888 for small and few-color textures that DXT encodes badly"),
+            (TXD_RASTER_8888, "8888", "Uncompressed 32-bit with alpha"),
+            (TXD_RASTER_888, "888", "Uncompressed 32-bit without alpha"),
+            (TXD_RASTER_1555, "1555", "16-bit with 1-bit alpha"),
+            (TXD_RASTER_PAL8, "PAL8", "8-bit palette (median cut + k-means)"),
+        ],
+        default=TXD_RASTER_DXT
+    )
+
+    bpy.types.Scene.gtatools_txd_budget_kb = IntProperty(
+        name="TXD Budget (KB)",
+        description="Drop top mip levels of the largest textures until the archive fits this size (0 = no budget)",
+        default=0,
+        min=0,
+        max=1048576
+    )
+
+    bpy.types.Scene.gtatools_txd_mip_max_size = IntProperty(
+        name="Max Mip Size",
+        description="Drop top mip levels until the larger side fits this size, no resampling (0 = off)",
+        default=0,
+        min=0,
+        max=8192
+    )
+
+    bpy.types.Scene.gtatools_txd_mip_filter = EnumProperty(
+        name="Mip Filter",
+        description="Filter used to build mip levels",
+        items=[
+            (MIP_FILTER_BOX, "Box", "2x2 average in sRGB (classic)"),
+            (MIP_FILTER_LINEAR, "Linear", "Gamma-correct 2x2 average in linear light (mips keep brightness)"),
+        ],
+        default=MIP_FILTER_BOX
+    )
+
+    bpy.types.Scene.gtatools_txd_mip_alpha_weighted = BoolProperty(
+        name="Alpha Weighted Mips",
+        description="Weight color by alpha when building mips of DXT3 textures (no dark fringes around cutouts)",
+        default=False
+    )
+
+    bpy.types.Scene.gtatools_txd_mip_alpha_coverage = BoolProperty(
+        name="Preserve Alpha Coverage",
+        description="Scale mip alpha so alpha-tested foliage/fences do not thin out at distance",
+        default=False
+    )
+
+    bpy.types.Scene.gtatools_txd_quality = EnumProperty(
+        name="DXT Quality",
+        description="DXT encoder quality (CPU mode) for Export TXD and Export All, per-texture RMSE is printed to the console",
+        items=[
+            (DXT_QUALITY_FAST, "Fast", "Endpoints from the brightest/darkest texel (fastest)"),
+            (DXT_QUALITY_BALANCED, "Balanced", "Principal axis endpoints + one least-squares refinement (~2.5x slower)"),
+            (DXT_QUALITY_BEST, "Best", "Principal axis + several least-squares refinements (~5x slower)"),
+        ],
+        default=DXT_QUALITY_FAST
+    )
+
     bpy.types.Scene.gtatools_show_nvtt_settings = BoolProperty(
         name="Show NVTT Settings",
         description="Show NVTT settings",
@@ -5791,6 +6478,12 @@ def register():
         description="Do not export TXD with Export All",
         default=False
     )
+    bpy.types.Scene.gtatools_export_all_force = BoolProperty(
+        name="Force",
+        description="Re-export all files, even if the source objects did not change "
+                    "since the last export (see export_all.inu.json in the output folder)",
+        default=False
+    )
 
     print("[GTA Tools Panel] Addon registered!")
 
@@ -5809,10 +6502,29 @@ def unregister():
     del bpy.types.Scene.gtatools_uv_link_islands
     del bpy.types.Scene.gtatools_nvtt_path
     del bpy.types.Scene.gtatools_txd_use_gpu
+    del bpy.types.Scene.gtatools_txd_backend
+    del bpy.types.Scene.gtatools_txd_workers
+    del bpy.types.Scene.gtatools_txd_use_cache
+    del bpy.types.Scene.gtatools_txd_cache_dir
+    del bpy.types.Scene.gtatools_txd_cache_size_mb
+    del bpy.types.Scene.gtatools_txd_session_analysis
+    del bpy.types.Scene.gtatools_txd_incremental
+    del bpy.types.Scene.gtatools_txd_dedup
+    del bpy.types.Scene.gtatools_txd_resize
+    del bpy.types.Scene.gtatools_txd_resize_filter
+    del bpy.types.Scene.gtatools_txd_max_size
+    del bpy.types.Scene.gtatools_txd_raster
+    del bpy.types.Scene.gtatools_txd_budget_kb
+    del bpy.types.Scene.gtatools_txd_mip_max_size
+    del bpy.types.Scene.gtatools_txd_mip_filter
+    del bpy.types.Scene.gtatools_txd_mip_alpha_weighted
+    del bpy.types.Scene.gtatools_txd_mip_alpha_coverage
+    del bpy.types.Scene.gtatools_txd_quality
     del bpy.types.Scene.gtatools_show_nvtt_settings
     del bpy.types.Scene.gtatools_texture_path2
     del bpy.types.Scene.gtatools_texture_path1
     del bpy.types.Scene.gtatools_export_all_skip_txd
+    del bpy.types.Scene.gtatools_export_all_force
     del bpy.types.Scene.gtatools_scatter_radius
     del bpy.types.Scene.gtatools_scatter_iterations
     del bpy.types.Scene.gtatools_scatter_falloff
@@ -5833,6 +6545,3 @@ def unregister():
 
     print("[GTA Tools Panel] Addon unregistered!")
 
-
-if __name__ == "__main__":
-    register()
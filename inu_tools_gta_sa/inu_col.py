@@ -0,0 +1,247 @@
+# inu_col - ядро COL экспорта INU_tools(gta_sa)
+# Не зависит от bpy: на входе массивы вершин и треугольников, на выходе байты COL3.
+#
+# Стабильный API перечислен в __all__:
+#   data = build_col3('model', vertices, faces, face_surfaces)
+#   write_col('model.col', [data, ...])
+# Остальные имена - внутренняя кухня аддона и могут меняться между версиями.
+
+import os
+import struct
+import numpy as np
+
+COL_API_VERSION = 1
+
+# Увеличивать при любом изменении вывода - Export All пересоберёт COL файлы
+COL_WRITER_VERSION = 2
+
+__all__ = [
+    'COL_API_VERSION', 'COL_WRITER_VERSION',
+    'build_col3', 'write_col', 'encode_col_name', 'compress_col_vertices', 'col_face_array', 'build_face_groups',
+    'col_bounds',
+    'COL_FACE_GROUP_MIN_FACES', 'COL_MAX_COORD',
+]
+
+
+# =============================================================================
+# COL3 FORMAT
+# =============================================================================
+
+COL3_FOURCC = b'COL3'
+COL_NAME_SIZE = 22
+COL_HEADER = struct.Struct('<4sI22sH')       # fourcc, размер после этого поля, имя, ID модели
+COL_BOUNDS = struct.Struct('<3f3f3ff')       # min, max, центр, радиус (порядок COL2/COL3)
+# Число сфер, боксов, граней, линий, выравнивание, флаги,
+# смещения сфер, боксов, линий, вершин, граней, плоскостей, затем тень COL3 (число граней, вершины, грани)
+COL3_HEADER_EXT = struct.Struct('<HHHBBI6I3I')
+COL_SPHERE = struct.Struct('<3ffBBBB')       # центр, радиус, поверхность
+COL_BOX = struct.Struct('<3f3fBBBB')         # min, max, поверхность
+
+# Смещения в заголовке отсчитываются от поля размера (после fourcc)
+COL_OFFSET_BASE = 4
+COL3_DATA_OFFSET = COL_HEADER.size - COL_OFFSET_BASE + COL_BOUNDS.size + COL3_HEADER_EXT.size
+
+COL_FLAG_NOT_EMPTY = 0x02
+COL_FLAG_FACE_GROUPS = 0x08
+COL_FLAG_SHADOW_MESH = 0x10
+
+# Вершины хранятся в int16 с шагом 1/128 м
+COL_VERTEX_SCALE = 128.0
+COL_MAX_COORD = 32767 / COL_VERTEX_SCALE
+
+COL_FACE_DTYPE = np.dtype([('a', '<u2'), ('b', '<u2'), ('c', '<u2'), ('material', 'u1'), ('light', 'u1')])
+COL_FACE_GROUP_DTYPE = np.dtype([('min', '<f4', 3), ('max', '<f4', 3), ('start', '<u2'), ('end', '<u2')])
+
+# Группы граней пишутся, начиная с этого числа граней; игра перебирает группы списком,
+# поэтому лист держит ~sqrt(N) граней - проверок боксов и граней примерно поровну
+COL_FACE_GROUP_MIN_FACES = 32
+
+
+def encode_col_name(name):
+    """Model name as the 22-byte null-terminated field of a COL header"""
+    if name.lower().endswith('.col'):
+        name = name[:-4]
+    # Для кириллицы и других символов - latin-1 с заменой
+    try:
+        name_bytes = name.encode('ascii')
+    except UnicodeEncodeError:
+        name_bytes = name.encode('latin-1', errors='replace')
+    return name_bytes[:COL_NAME_SIZE - 1].ljust(COL_NAME_SIZE, b'\0')
+
+
+def col_face_array(name, faces, vertex_count, face_surfaces=None):
+    """(F, 3) vertex indices and (F, 2) uint8 (material, light) surfaces as a COL_FACE_DTYPE array"""
+    faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+    if vertex_count > 0xFFFF or len(faces) > 0xFFFF:
+        raise ValueError(f"COL {name}: {vertex_count} vertices / {len(faces)} faces, COL3 allows 65535")
+    if len(faces) and (faces.min() < 0 or faces.max() >= vertex_count):
+        raise ValueError(f"COL {name}: face index out of range")
+    face_data = np.zeros(len(faces), dtype=COL_FACE_DTYPE)
+    face_data['a'], face_data['b'], face_data['c'] = faces[:, 0], faces[:, 1], faces[:, 2]
+    if face_surfaces is not None:
+        face_surfaces = np.asarray(face_surfaces, dtype=np.uint8).reshape(-1, 2)
+        face_data['material'], face_data['light'] = face_surfaces[:, 0], face_surfaces[:, 1]
+    return face_data
+
+
+def compress_col_vertices(vertices):
+    """(N, 3) float vertices as int16 COL vertices, returns (vertices, clamped count)"""
+    scaled = np.rint(np.asarray(vertices, dtype=np.float64).reshape(-1, 3) * COL_VERTEX_SCALE)
+    clamped = int(np.count_nonzero(np.any(np.abs(scaled) > 32767, axis=1)))
+    return np.clip(scaled, -32767, 32767).astype('<i2'), clamped
+
+
+# =============================================================================
+# FACE GROUPS
+# =============================================================================
+
+def build_face_groups(vertices, faces, max_faces=0):
+    """Spatial split of faces into face groups (BVH leaves).
+
+    Faces are split recursively at the median centroid along the longest
+    axis until a group holds at most max_faces (default ~sqrt(N), at least
+    COL_FACE_GROUP_MIN_FACES). Returns (order, groups): the face permutation
+    and a COL_FACE_GROUP_DTYPE array of bounds with inclusive face ranges.
+    """
+    vertices = np.asarray(vertices, dtype=np.float32).reshape(-1, 3)
+    faces = np.asarray(faces).reshape(-1, 3)
+    count = len(faces)
+    if not max_faces:
+        max_faces = max(COL_FACE_GROUP_MIN_FACES, int(np.sqrt(count)))
+    corners = vertices[faces]                  # (N, 3 вершины, 3 оси)
+    centroids = corners.mean(axis=1)
+    face_min = corners.min(axis=1)
+    face_max = corners.max(axis=1)
+
+    leaves = []
+    stack = [np.arange(count)]
+    while stack:
+        indices = stack.pop()
+        if len(indices) <= max_faces:
+            leaves.append(indices)
+            continue
+        points = centroids[indices]
+        axis = int(np.argmax(points.max(axis=0) - points.min(axis=0)))
+        half = len(indices) // 2
+        split = np.argpartition(points[:, axis], half)
+        # Правая половина кладётся первой - листья идут слева направо
+        stack.append(indices[split[half:]])
+        stack.append(indices[split[:half]])
+
+    groups = np.zeros(len(leaves), dtype=COL_FACE_GROUP_DTYPE)
+    start = 0
+    for i, indices in enumerate(leaves):
+        groups[i]['min'] = face_min[indices].min(axis=0)
+        groups[i]['max'] = face_max[indices].max(axis=0)
+        groups[i]['start'] = start
+        groups[i]['end'] = start + len(indices) - 1
+        start += len(indices)
+    order = np.concatenate(leaves) if leaves else np.zeros(0, dtype=np.int64)
+    return order, groups
+
+
+# =============================================================================
+# COL3 WRITER
+# =============================================================================
+
+def col_bounds(vertices, spheres=(), boxes=()):
+    """Bounding box and sphere (min, max, center, radius) of vertices, spheres and boxes"""
+    points = [np.asarray(vertices, dtype=np.float64).reshape(-1, 3)]
+    for box_min, box_max, _ in boxes:
+        # Все 8 углов - для радиуса описанной сферы
+        corners = np.array([box_min, box_max], dtype=np.float64)
+        points.append(corners[np.indices((2, 2, 2)).reshape(3, -1).T, [0, 1, 2]])
+    points = np.concatenate(points)
+    lows = [points.min(axis=0)] if len(points) else []
+    highs = [points.max(axis=0)] if len(points) else []
+    for center, radius, _ in spheres:
+        lows.append(np.asarray(center, dtype=np.float64) - radius)
+        highs.append(np.asarray(center, dtype=np.float64) + radius)
+    if not lows:
+        return (0.0, 0.0, 0.0), (0.0, 0.0, 0.0), (0.0, 0.0, 0.0), 0.0
+
+    low = np.min(lows, axis=0)
+    high = np.max(highs, axis=0)
+    center = (low + high) / 2
+    radius = float(np.sqrt(((points - center) ** 2).sum(axis=1)).max()) if len(points) else 0.0
+    for sphere_center, sphere_radius, _ in spheres:
+        radius = max(radius, float(np.linalg.norm(np.asarray(sphere_center) - center)) + sphere_radius)
+    return tuple(low), tuple(high), tuple(center), radius
+
+
+def build_col3(name, vertices, faces, face_surfaces=None, spheres=(), boxes=(), model_id=0,
+               face_group_size=0, shadow=None):
+    """One COL3 model as bytes.
+
+    vertices: (V, 3) float coordinates in metres (|x| < 256), faces: (F, 3)
+    vertex indices, face_surfaces: (F, 2) uint8 (material, light) or None.
+    spheres: [(center, radius, (material, flag, brightness, light))],
+    boxes: [(min, max, surface)]. Faces are reordered into spatial face
+    groups once there are at least COL_FACE_GROUP_MIN_FACES of them.
+    shadow: (vertices, faces, face_surfaces) of the shadow mesh or None.
+    """
+    packed, _ = compress_col_vertices(vertices)
+    face_data = col_face_array(name, faces, len(packed), face_surfaces)
+
+    # Границы и группы считаются по сжатым вершинам - ровно то, что увидит игра
+    stored = packed.astype(np.float32) / COL_VERTEX_SCALE
+    groups = None
+    if len(face_data) >= COL_FACE_GROUP_MIN_FACES:
+        faces = np.stack([face_data['a'], face_data['b'], face_data['c']], axis=1)
+        order, groups = build_face_groups(stored, faces, face_group_size)
+        face_data = face_data[order]
+
+    # Теневой меш (COL3): свои вершины и грани после граней коллизии, без групп
+    shadow_vertex_data = shadow_face_data = b''
+    shadow_face_count = 0
+    if shadow is not None:
+        shadow_vertices, shadow_faces, shadow_surfaces = shadow
+        shadow_packed, _ = compress_col_vertices(shadow_vertices)
+        shadow_faces = col_face_array(f"{name} shadow", shadow_faces, len(shadow_packed), shadow_surfaces)
+        shadow_face_count = len(shadow_faces)
+        if shadow_face_count:
+            shadow_vertex_data = shadow_packed.tobytes()
+            shadow_face_data = shadow_faces.tobytes()
+
+    bounds_min, bounds_max, center, radius = col_bounds(stored, spheres, boxes)
+
+    # Данные: сферы, боксы, вершины, группы граней (+ их число), грани, теневые вершины и грани
+    sphere_data = b''.join(COL_SPHERE.pack(*center_, radius_, *surface)
+                           for center_, radius_, surface in spheres)
+    box_data = b''.join(COL_BOX.pack(*box_min, *box_max, *surface) for box_min, box_max, surface in boxes)
+    vertex_data = packed.tobytes()
+    group_data = groups.tobytes() + struct.pack('<I', len(groups)) if groups is not None else b''
+
+    offset_spheres = COL3_DATA_OFFSET
+    offset_boxes = offset_spheres + len(sphere_data)
+    offset_vertices = offset_boxes + len(box_data)
+    offset_faces = offset_vertices + len(vertex_data) + len(group_data)
+    offset_shadow_vertices = offset_faces + face_data.nbytes
+    offset_shadow_faces = offset_shadow_vertices + len(shadow_vertex_data)
+    end = offset_shadow_faces + len(shadow_face_data)
+
+    flags = 0
+    if len(face_data) or spheres or boxes:
+        flags |= COL_FLAG_NOT_EMPTY
+    if groups is not None:
+        flags |= COL_FLAG_FACE_GROUPS
+    if shadow_face_count:
+        flags |= COL_FLAG_SHADOW_MESH
+
+    header = COL_HEADER.pack(COL3_FOURCC, end - COL_OFFSET_BASE, encode_col_name(name), model_id)
+    header += COL_BOUNDS.pack(*bounds_min, *bounds_max, *center, radius)
+    header += COL3_HEADER_EXT.pack(len(spheres), len(boxes), len(face_data), 0, 0, flags,
+                                   offset_spheres, offset_boxes, offset_vertices, offset_vertices,
+                                   offset_faces, end, shadow_face_count, offset_shadow_vertices, offset_shadow_faces)
+    return b''.join((header, sphere_data, box_data, vertex_data, group_data, face_data.tobytes(),
+                     shadow_vertex_data, shadow_face_data))
+
+
+def write_col(filepath, models):
+    """Write COL models (bytes from build_col3) into one file in one pass, returns its size"""
+    data = b''.join(models)
+    temp_path = f"{filepath}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, filepath)
+    return len(data)
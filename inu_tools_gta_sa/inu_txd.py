@@ -0,0 +1,2033 @@
+# inu_txd - ядро TXD экспорта INU_tools(gta_sa)
+# Не зависит от bpy: импортируется аддоном и рабочими процессами сжатия,
+# которым не нужно загружать Blender.
+#
+# Стабильный API (массив на входе, байты на выходе) перечислен в __all__:
+#   native = compress_texture(pixels, 'name', quality=DXT_QUALITY_BALANCED)
+#   write_txd('out.txd', [native, ...])   /   data = build_txd([native, ...])
+#   with TxdReader('out.txd') as txd: rgba = txd.get('name').decode()
+# Остальные имена - внутренняя кухня аддона и могут меняться между версиями.
+
+import os
+import re
+import time
+import json
+import struct
+import subprocess
+import zlib
+import hashlib
+import tempfile
+import mmap
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+
+TXD_API_VERSION = 1
+
+__all__ = [
+    'TXD_API_VERSION',
+    # изображение -> текстура -> архив
+    'as_rgba8', 'prepare_texture', 'compress_texture', 'compress_textures', 'encode_texture',
+    'build_txd', 'write_txd', 'TxdWriter', 'TxdReader', 'TxdTexture',
+    # отдельные ступени
+    'encoder_options', 'build_mip_chain', 'compress_mip_chain', 'resample_image', 'target_texture_size',
+    'build_texture_native', 'build_raster_native', 'texture_native_format', 'texture_native_size',
+    'plan_mip_budget', 'write_rw_section_header', 'set_texture_native_name', 'run_texture_jobs',
+    'compress_miplevel_dxt1', 'compress_miplevel_dxt3', 'compress_miplevel_dxt5',
+    'decode_dxt1_level', 'decode_dxt3_level', 'decode_dxt5_level',
+    # настройки
+    'DXT_QUALITY_FAST', 'DXT_QUALITY_BALANCED', 'DXT_QUALITY_BEST',
+    'MIP_FILTER_BOX', 'MIP_FILTER_LINEAR',
+    'RESIZE_OFF', 'RESIZE_MULTIPLE_4', 'RESIZE_POW2', 'RESAMPLE_BOX', 'RESAMPLE_BILINEAR', 'RESAMPLE_LANCZOS',
+    'TXD_RASTER_DXT', 'TXD_RASTER_DXT5', 'TXD_RASTER_DXT_AUTO', 'TXD_RASTER_AUTO',
+    'TXD_RASTER_8888', 'TXD_RASTER_888', 'TXD_RASTER_1555', 'TXD_RASTER_PAL8',
+    'TXD_BACKEND_THREAD', 'TXD_BACKEND_PROCESS',
+]
+
+
+# =============================================================================
+# RENDERWARE
+# =============================================================================
+
+RW_TEXDICTIONARY = 0x16
+RW_TEXTURENATIVE = 0x15
+RW_STRUCT = 0x01
+RW_EXTENSION = 0x03
+RW_VERSION = 0x1803FFFF
+PLATFORM_D3D8 = 8
+PLATFORM_D3D9 = 9
+RASTER_1555 = 0x0100
+RASTER_565 = 0x0200
+RASTER_8888 = 0x0500
+RASTER_888 = 0x0600
+RASTER_PAL8 = 0x2000
+RASTER_PAL4 = 0x4000
+RASTER_MIPMAP = 0x8000
+FILTER_LINEAR = 0x02
+D3DFMT_A8R8G8B8 = 21
+D3DFMT_X8R8G8B8 = 22
+D3DFMT_A1R5G5B5 = 25
+D3DFMT_P8 = 41
+ADDRESS_WRAP = 0x01
+
+
+def make_filter_flags():
+    return FILTER_LINEAR | (ADDRESS_WRAP << 8) | (ADDRESS_WRAP << 12)
+
+
+# Смещение имени текстуры внутри texture native: заголовок RW_STRUCT + platform + filter flags
+TEXNATIVE_NAME_OFFSET = 12 + 8
+
+
+def write_rw_section_header(data, section_type, size):
+    data.extend(struct.pack('<III', section_type, size, RW_VERSION))
+
+
+def encode_texture_name(name):
+    """Texture name as the fixed 32-byte field of a texture native"""
+    return name[:31].encode('ascii', errors='replace').ljust(32, b'\x00')
+
+
+def set_texture_native_name(tex_native, name):
+    """Return a copy of a texture native with its name field replaced"""
+    data = bytearray(tex_native)
+    data[TEXNATIVE_NAME_OFFSET:TEXNATIVE_NAME_OFFSET + 32] = encode_texture_name(name)
+    return bytes(data)
+
+
+class TxdWriter:
+    """Stream texture natives into a TXD file without holding the archive in RAM.
+
+    Section headers are written with placeholder sizes and patched on close;
+    the file is written next to the target and moved into place only when at
+    least one texture was added and no exception escaped the with block.
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.temp_path = f"{filepath}.{os.getpid()}.tmp"
+        self.count = 0
+        self.size = 0
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.temp_path, 'wb')
+        header = bytearray()
+        write_rw_section_header(header, RW_TEXDICTIONARY, 0)
+        write_rw_section_header(header, RW_STRUCT, 4)
+        header.extend(struct.pack('<HH', 0, 0))
+        self._file.write(header)
+        return self
+
+    def add(self, tex_native):
+        header = bytearray()
+        write_rw_section_header(header, RW_TEXTURENATIVE, len(tex_native))
+        self._file.write(header)
+        self._file.write(tex_native)
+        self.count += 1
+
+    def __exit__(self, exc_type, exc, tb):
+        f = self._file
+        try:
+            if exc_type is None and self.count:
+                extension = bytearray()
+                write_rw_section_header(extension, RW_EXTENSION, 0)
+                f.write(extension)
+                self.size = f.tell()
+                # Размер словаря и число текстур известны только в конце
+                f.seek(4)
+                f.write(struct.pack('<I', self.size - 12))
+                f.seek(24)
+                f.write(struct.pack('<H', self.count))
+        finally:
+            f.close()
+        if exc_type is None and self.count:
+            os.replace(self.temp_path, self.filepath)
+        else:
+            os.remove(self.temp_path)
+        return False
+
+
+# =============================================================================
+# DXT ENCODERS
+# =============================================================================
+
+# Сколько блоков кодируется за один проход NumPy (ограничивает пиковую память)
+DXT_BATCH_BLOCKS = 16384
+
+DXT1_BLOCK_DTYPE = np.dtype([('color0', '<u2'), ('color1', '<u2'), ('indices', '<u4')])
+DXT3_BLOCK_DTYPE = np.dtype([('alpha', '<u8'), ('color0', '<u2'), ('color1', '<u2'), ('indices', '<u4')])
+# DXT5: тот же 64-битный альфа-блок, но alpha0, alpha1 и 16 индексов по 3 бита
+DXT5_BLOCK_DTYPE = DXT3_BLOCK_DTYPE
+
+
+def image_to_blocks(pixels):
+    """Split a (H, W, C) mip level into a row-major (N, 16, C) tensor of 4x4 blocks"""
+    h, w, channels = pixels.shape
+    return (pixels.reshape(h // 4, 4, w // 4, 4, channels)
+            .transpose(0, 2, 1, 3, 4)
+            .reshape(-1, 16, channels))
+
+
+def rgb_to_565(rgb):
+    """Quantize (..., 3) float RGB to packed 565 values"""
+    r = np.clip(rgb[..., 0] / 255.0 * 31 + 0.5, 0, 31).astype(np.uint16)
+    g = np.clip(rgb[..., 1] / 255.0 * 63 + 0.5, 0, 63).astype(np.uint16)
+    b = np.clip(rgb[..., 2] / 255.0 * 31 + 0.5, 0, 31).astype(np.uint16)
+    return (r << 11) | (g << 5) | b
+
+
+def rgb_from_565(color):
+    """Expand packed 565 values to (..., 3) float64 RGB"""
+    color = color.astype(np.int64)
+    return np.stack([
+        ((color >> 11) & 0x1F) * 255.0 / 31.0,
+        ((color >> 5) & 0x3F) * 255.0 / 63.0,
+        (color & 0x1F) * 255.0 / 31.0,
+    ], axis=-1)
+
+
+DXT_QUALITY_FAST = 'FAST'          # концы по яркости (min/max), как раньше
+DXT_QUALITY_BALANCED = 'BALANCED'  # главная ось (PCA) + одно уточнение МНК
+DXT_QUALITY_BEST = 'BEST'          # главная ось + несколько итераций МНК
+
+DXT_REFINE_ITERATIONS = {
+    DXT_QUALITY_FAST: 0,
+    DXT_QUALITY_BALANCED: 1,
+    DXT_QUALITY_BEST: 4,
+}
+
+# Веса концов color0/color1 для индексов 0..3 палитры из 4 цветов
+DXT1_WEIGHTS0 = np.array([1.0, 0.0, 2.0/3.0, 1.0/3.0])
+DXT1_WEIGHTS1 = 1.0 - DXT1_WEIGHTS0
+
+
+def order_endpoints(color0, color1):
+    # Для DXT3 нужен режим 4 цветов (color0 > color1)
+    swap = color0 < color1
+    return np.where(swap, color1, color0), np.where(swap, color0, color1)
+
+
+def fit_dxt1_indices(rgb, color0, color1):
+    """Nearest palette entry for every texel, returns (indices (N, 16), squared error (N,))"""
+    # Палитру строим из 565 значений (как будет при декомпрессии)
+    c0_565 = rgb_from_565(color0)
+    c1_565 = rgb_from_565(color1)
+    palette = (c0_565, c1_565, (2.0*c0_565 + c1_565)/3.0, (c0_565 + 2.0*c1_565)/3.0)
+
+    rgb = rgb.astype(np.float64)
+    dists = np.empty((len(rgb), 16, 4), dtype=np.float64)
+    for k, entry in enumerate(palette):
+        diff = rgb - entry[:, None, :]
+        diff *= diff
+        dists[:, :, k] = diff[:, :, 0] + diff[:, :, 1] + diff[:, :, 2]
+
+    indices = np.argmin(dists, axis=2)
+    error = np.take_along_axis(dists, indices[:, :, None], axis=2)[:, :, 0].sum(axis=1)
+    return indices, error
+
+
+def pca_endpoints(rgb):
+    """Endpoints at the extremes of each block's principal color axis"""
+    rgb = rgb.astype(np.float64)
+    mean = rgb.mean(axis=1)
+    centered = rgb - mean[:, None, :]
+    cov = np.einsum('nki,nkj->nij', centered, centered)
+
+    # Степенной метод, старт - столбец с наибольшей дисперсией
+    rows = np.arange(len(rgb))
+    axis = cov[rows, :, np.argmax(np.diagonal(cov, axis1=1, axis2=2), axis=1)]
+    for _ in range(8):
+        axis = np.einsum('nij,nj->ni', cov, axis)
+        norm = np.linalg.norm(axis, axis=1, keepdims=True)
+        axis = np.where(norm > 1e-12, axis / np.maximum(norm, 1e-12), 0.0)
+
+    projection = np.einsum('nki,ni->nk', centered, axis)
+    c0 = mean + axis * projection.max(axis=1)[:, None]
+    c1 = mean + axis * projection.min(axis=1)[:, None]
+    return np.clip(c0, 0, 255), np.clip(c1, 0, 255)
+
+
+def refine_endpoints(rgb, indices):
+    """Least-squares endpoints for fixed palette indices, (c0, c1, solvable)"""
+    rgb = rgb.astype(np.float64)
+    w0 = DXT1_WEIGHTS0[indices]
+    w1 = DXT1_WEIGHTS1[indices]
+    a00 = (w0 * w0).sum(axis=1)
+    a01 = (w0 * w1).sum(axis=1)
+    a11 = (w1 * w1).sum(axis=1)
+    b0 = np.einsum('nk,nki->ni', w0, rgb)
+    b1 = np.einsum('nk,nki->ni', w1, rgb)
+
+    det = a00 * a11 - a01 * a01
+    solvable = np.abs(det) > 1e-9
+    inv_det = np.where(solvable, 1.0 / np.where(solvable, det, 1.0), 0.0)[:, None]
+    c0 = (a11[:, None] * b0 - a01[:, None] * b1) * inv_det
+    c1 = (a00[:, None] * b1 - a01[:, None] * b0) * inv_det
+    return np.clip(c0, 0, 255), np.clip(c1, 0, 255), solvable
+
+
+def encode_dxt1_chunk(rgb, quality=DXT_QUALITY_FAST):
+    """Encode (N, 16, 3) float32 blocks, returns (color0, color1, indices) arrays"""
+    # Концы отрезка - самый яркий и самый тёмный пиксель блока
+    lum = rgb[:, :, 0] * 0.299 + rgb[:, :, 1] * 0.587 + rgb[:, :, 2] * 0.114
+    rows = np.arange(len(rgb))
+    c0 = rgb[rows, np.argmax(lum, axis=1)]
+    c1 = rgb[rows, np.argmin(lum, axis=1)]
+
+    color0, color1 = order_endpoints(rgb_to_565(c0), rgb_to_565(c1))
+    indices, error = fit_dxt1_indices(rgb, color0, color1)
+
+    if quality != DXT_QUALITY_FAST:
+        # Кандидаты принимаются поблочно, только если уменьшают ошибку
+        candidates = [pca_endpoints(rgb) + (None,)]
+        if quality == DXT_QUALITY_BEST:
+            # Углы ограничивающего параллелепипеда со сдвигом 1/16 внутрь
+            low, high = rgb.min(axis=1), rgb.max(axis=1)
+            inset = (high - low) / 16.0
+            candidates.append((high - inset, low + inset, None))
+        for iteration in range(DXT_REFINE_ITERATIONS.get(quality, 1) + 1):
+            if iteration > 0:
+                candidates = [refine_endpoints(rgb, indices)]
+            for cand0, cand1, solvable in candidates:
+                new0, new1 = order_endpoints(rgb_to_565(cand0), rgb_to_565(cand1))
+                new_indices, new_error = fit_dxt1_indices(rgb, new0, new1)
+                better = new_error < error
+                if solvable is not None:
+                    better &= solvable
+                color0 = np.where(better, new0, color0)
+                color1 = np.where(better, new1, color1)
+                indices = np.where(better[:, None], new_indices, indices)
+                error = np.where(better, new_error, error)
+
+    shifts = np.arange(0, 32, 2, dtype=np.uint32)
+    packed = np.bitwise_or.reduce(indices.astype(np.uint32) << shifts, axis=1)
+    return color0, color1, packed
+
+
+def build_single_color_table(bits):
+    """Best (e0, e1) endpoint pair per 8-bit value for a palette index 2 texel.
+
+    Index 2 is (2*e0 + e1) / 3 with the same expansion as rgb_from_565;
+    e0 == e1 pairs are included, so exact 5/6-bit values are found too.
+    """
+    levels = (1 << bits) - 1
+    expanded = np.arange(levels + 1) * 255.0 / levels
+    interpolated = (2.0 * expanded[:, None] + expanded[None, :]) / 3.0
+    error = np.abs(interpolated[None, :, :] - np.arange(256)[:, None, None])
+    best = error.reshape(256, -1).argmin(axis=1)
+    return np.stack(np.divmod(best, levels + 1), axis=1).astype(np.uint16)
+
+
+# Таблицы оптимальных концов для одноцветных блоков (считаются один раз при импорте)
+SINGLE_COLOR_TABLE5 = build_single_color_table(5)
+SINGLE_COLOR_TABLE6 = build_single_color_table(6)
+
+
+def encode_solid_dxt1(colors):
+    """Encode (N, 3) solid block colors via the endpoint tables, returns (color0, color1, indices)"""
+    colors = colors.astype(np.intp)
+    r = SINGLE_COLOR_TABLE5[colors[:, 0]]
+    g = SINGLE_COLOR_TABLE6[colors[:, 1]]
+    b = SINGLE_COLOR_TABLE5[colors[:, 2]]
+    color0 = (r[:, 0] << 11) | (g[:, 0] << 5) | b[:, 0]
+    color1 = (r[:, 1] << 11) | (g[:, 1] << 5) | b[:, 1]
+
+    # Все текселы на индексе 2; если color0 < color1 - меняем концы и берём индекс 3,
+    # при равных концах индекс 0 (режим 3 цветов не задействуется)
+    swap = color0 < color1
+    indices = np.where(swap, np.uint32(0xFFFFFFFF), np.uint32(0xAAAAAAAA))
+    indices = np.where(color0 == color1, np.uint32(0), indices)
+    color0, color1 = np.where(swap, color1, color0), np.where(swap, color0, color1)
+    return color0.astype(np.uint16), color1.astype(np.uint16), indices.astype(np.uint32)
+
+
+def encode_dxt1_blocks(rgb_blocks, quality=DXT_QUALITY_FAST):
+    """Encode (N, 16, 3) RGB blocks in batches, returns a DXT1_BLOCK_DTYPE array.
+
+    Solid blocks go through the single-color tables, only the rest run the
+    endpoint search.
+    """
+    out = np.empty(len(rgb_blocks), dtype=DXT1_BLOCK_DTYPE)
+    for start in range(0, len(rgb_blocks), DXT_BATCH_BLOCKS):
+        chunk = rgb_blocks[start:start + DXT_BATCH_BLOCKS]
+        target = out[start:start + len(chunk)]
+        solid = (chunk == chunk[:, :1]).all(axis=(1, 2))
+        if solid.any():
+            target['color0'][solid], target['color1'][solid], target['indices'][solid] = \
+                encode_solid_dxt1(chunk[solid, 0])
+        if not solid.all():
+            rest = chunk[~solid].astype(np.float32)
+            target['color0'][~solid], target['color1'][~solid], target['indices'][~solid] = \
+                encode_dxt1_chunk(rest, quality)
+    return out
+
+
+# 4-битная альфа для каждого 8-битного значения
+ALPHA4_TABLE = np.clip(np.arange(256) / 255.0 * 15 + 0.5, 0, 15).astype(np.uint64)
+
+
+def encode_dxt3_alpha(alpha_blocks):
+    """Pack (N, 16) alpha values into explicit 4-bit DXT3 alpha words (uint64)"""
+    constant = (alpha_blocks == alpha_blocks[:, :1]).all(axis=1)
+    # Постоянная альфа (чаще всего 255) - одно слово на блок без упаковки 16 значений
+    words = ALPHA4_TABLE[alpha_blocks[:, 0].astype(np.intp)] * np.uint64(0x1111111111111111)
+    if not constant.all():
+        a4 = ALPHA4_TABLE[alpha_blocks[~constant].astype(np.intp)]
+        shifts = np.arange(0, 64, 4, dtype=np.uint64)
+        words[~constant] = np.bitwise_or.reduce(a4 << shifts, axis=1)
+    return words
+
+
+def encode_dxt3_blocks(rgba_blocks, quality=DXT_QUALITY_FAST):
+    """Encode (N, 16, 4) RGBA blocks, returns a DXT3_BLOCK_DTYPE array"""
+    out = np.empty(len(rgba_blocks), dtype=DXT3_BLOCK_DTYPE)
+    out['alpha'] = encode_dxt3_alpha(rgba_blocks[:, :, 3])
+    color = encode_dxt1_blocks(rgba_blocks[:, :, :3], quality)
+    for field in DXT1_BLOCK_DTYPE.names:
+        out[field] = color[field]
+    return out
+
+
+def dxt5_alpha_palette(alpha0, alpha1):
+    """(N, 8) DXT5 alpha palettes: 8 values if alpha0 > alpha1, else 6 values + 0 and 255"""
+    a0 = alpha0.astype(np.int32)[:, None]
+    a1 = alpha1.astype(np.int32)[:, None]
+    step = np.arange(1, 7, dtype=np.int32)[None, :]
+    eight = ((7 - step) * a0 + step * a1 + 3) // 7
+    six = ((5 - step[:, :4]) * a0 + step[:, :4] * a1 + 2) // 5
+    six = np.concatenate([six, np.zeros_like(a0), np.full_like(a0, 255)], axis=1)
+    return np.concatenate([a0, a1, np.where(a0 > a1, eight, six)], axis=1)
+
+
+def fit_dxt5_alpha(alpha, alpha0, alpha1):
+    """Nearest palette index per pixel, returns (packed uint64 words, squared error per block)"""
+    palette = dxt5_alpha_palette(alpha0, alpha1)
+    distance = np.abs(alpha[:, :, None] - palette[:, None, :])
+    indices = np.argmin(distance, axis=2)
+    error = (np.take_along_axis(distance, indices[:, :, None], axis=2)[:, :, 0] ** 2).sum(axis=1)
+    shifts = np.arange(16, 64, 3, dtype=np.uint64)
+    words = (alpha0.astype(np.uint64) | (alpha1.astype(np.uint64) << np.uint64(8))
+             | np.bitwise_or.reduce(indices.astype(np.uint64) << shifts, axis=1))
+    return words, error
+
+
+def encode_dxt5_alpha(alpha_blocks, quality=DXT_QUALITY_FAST):
+    """Pack (N, 16) alpha values into interpolated DXT5 alpha words (uint64).
+
+    FAST uses the 8-value mode between the block min and max; the other
+    qualities also try the 6-value mode (endpoints over the values other
+    than 0/255, which are stored exactly) and keep the smaller error.
+    """
+    # Постоянная альфа: alpha0 = alpha1 = значение, все индексы 0
+    words = alpha_blocks[:, 0].astype(np.uint64) * np.uint64(0x0101)
+    constant = (alpha_blocks == alpha_blocks[:, :1]).all(axis=1)
+    varying = np.flatnonzero(~constant)
+    for start in range(0, len(varying), DXT_BATCH_BLOCKS):
+        rows = varying[start:start + DXT_BATCH_BLOCKS]
+        alpha = alpha_blocks[rows].astype(np.int32)
+        best, best_error = fit_dxt5_alpha(alpha, alpha.max(axis=1), alpha.min(axis=1))
+        if quality != DXT_QUALITY_FAST:
+            inner = (alpha > 0) & (alpha < 255)
+            low = np.where(inner, alpha, 255).min(axis=1)
+            high = np.where(inner, alpha, 0).max(axis=1)
+            low = np.minimum(low, high)
+            words6, error6 = fit_dxt5_alpha(alpha, low, high)
+            better = error6 < best_error
+            best[better] = words6[better]
+        words[rows] = best
+    return words
+
+
+def encode_dxt5_blocks(rgba_blocks, quality=DXT_QUALITY_FAST):
+    """Encode (N, 16, 4) RGBA blocks, returns a DXT5_BLOCK_DTYPE array"""
+    out = np.empty(len(rgba_blocks), dtype=DXT5_BLOCK_DTYPE)
+    out['alpha'] = encode_dxt5_alpha(rgba_blocks[:, :, 3], quality)
+    color = encode_dxt1_blocks(rgba_blocks[:, :, :3], quality)
+    for field in DXT1_BLOCK_DTYPE.names:
+        out[field] = color[field]
+    return out
+
+
+def compress_dxt1_block(rgb):
+    return encode_dxt1_blocks(rgb.reshape(1, 16, 3)).tobytes()
+
+
+def compress_dxt3_block(rgba):
+    return encode_dxt3_blocks(rgba.reshape(1, 16, 4)).tobytes()
+
+
+def compress_dxt5_block(rgba):
+    return encode_dxt5_blocks(rgba.reshape(1, 16, 4)).tobytes()
+
+
+def compress_miplevel_dxt1(pixels):
+    # Весь уровень кодируется одним пакетом вместо вызова на каждый блок
+    return encode_dxt1_blocks(image_to_blocks(pixels[:, :, :3])).tobytes()
+
+
+def compress_miplevel_dxt3(pixels):
+    # Альфа и цвет упаковываются в один структурный массив -> один tobytes()
+    return encode_dxt3_blocks(image_to_blocks(pixels)).tobytes()
+
+
+def compress_miplevel_dxt5(pixels):
+    return encode_dxt5_blocks(image_to_blocks(pixels)).tobytes()
+
+
+# DXT3 оставляется, если его 4-битная альфа почти без потерь (вырезки 0/255)
+DXT3_ALPHA_MAX_RMSE = 2.0
+
+
+def choose_alpha_format(alpha):
+    """DXT3 or DXT5 for a (H, W) block-aligned alpha level.
+
+    The DXT3 error follows from the alpha histogram (4-bit rounding of each
+    value): cutouts and a few flat levels are exact and stay DXT3. Otherwise
+    DXT5 is taken unless its estimated error - 8 steps over the alpha range
+    of each block - is larger, as on noisy alpha.
+    """
+    alpha = np.asarray(alpha, dtype=np.uint8)
+    histogram = np.bincount(alpha.ravel(), minlength=256)
+    error = np.arange(256) - ALPHA4_TABLE.astype(np.int64) * 17
+    dxt3_rmse = np.sqrt((histogram * error * error).sum() / max(1, histogram.sum()))
+    if dxt3_rmse <= DXT3_ALPHA_MAX_RMSE:
+        return 'DXT3'
+    blocks = image_to_blocks(alpha[:, :, None])[:, :, 0]
+    block_range = (blocks.max(axis=1) - blocks.min(axis=1)).astype(np.float64)
+    # Равномерное квантование шагом range/7: ошибка step/sqrt(12)
+    dxt5_rmse = np.sqrt(np.mean(block_range * block_range)) / (7.0 * np.sqrt(12.0))
+    return 'DXT3' if dxt3_rmse < dxt5_rmse else 'DXT5'
+
+
+# =============================================================================
+# RESAMPLE
+# =============================================================================
+
+RESIZE_OFF = 'OFF'                # размер не меняется, некратные 4 пропускаются
+RESIZE_MULTIPLE_4 = 'MULTIPLE_4'  # к ближайшему кратному 4
+RESIZE_POW2 = 'POW2'              # к ближайшей степени двойки
+
+RESAMPLE_BOX = 'BOX'
+RESAMPLE_BILINEAR = 'BILINEAR'
+RESAMPLE_LANCZOS = 'LANCZOS'
+
+# Радиус ядра фильтра в пикселях источника (при уменьшении растягивается)
+RESAMPLE_SUPPORT = {
+    RESAMPLE_BOX: 0.5,
+    RESAMPLE_BILINEAR: 1.0,
+    RESAMPLE_LANCZOS: 3.0,
+}
+
+
+def snap_dimension(size, mode, limit=0):
+    """Nearest multiple of 4 / power of two (at least 4), not above limit"""
+    if mode == RESIZE_POW2:
+        snapped = max(4, 1 << int(round(np.log2(max(size, 1.0)))))
+        while limit and snapped > max(limit, 4):
+            snapped //= 2
+        return snapped
+    snapped = max(4, int(round(size / 4.0)) * 4)
+    if limit:
+        snapped = min(snapped, max(4, limit // 4 * 4))
+    return snapped
+
+
+def target_texture_size(width, height, mode=RESIZE_OFF, max_size=0):
+    """Size a texture is exported at, (width, height) itself when nothing applies.
+
+    max_size scales both sides proportionally so the larger one fits; the
+    result is snapped to the mode's grid (multiple of 4 when mode is OFF).
+    """
+    scale = min(1.0, max_size / max(width, height)) if max_size else 1.0
+    if mode == RESIZE_OFF and scale == 1.0:
+        return width, height
+    grid = RESIZE_MULTIPLE_4 if mode == RESIZE_OFF else mode
+    return snap_dimension(width * scale, grid, max_size), snap_dimension(height * scale, grid, max_size)
+
+
+def _resample_kernel(x, resample_filter):
+    x = np.abs(x)
+    if resample_filter == RESAMPLE_BOX:
+        return np.where(x < 0.5, 1.0, np.where(x == 0.5, 0.5, 0.0))
+    if resample_filter == RESAMPLE_LANCZOS:
+        return np.where(x < 3.0, np.sinc(x) * np.sinc(x / 3.0), 0.0)
+    return np.maximum(0.0, 1.0 - x)
+
+
+def resample_taps(src_size, dst_size, resample_filter):
+    """Source indices and normalized weights, both (dst_size, taps), for one axis"""
+    scale = src_size / dst_size
+    stretch = max(1.0, scale)
+    radius = RESAMPLE_SUPPORT.get(resample_filter, 1.0) * stretch
+    centers = (np.arange(dst_size) + 0.5) * scale - 0.5
+    taps = int(np.ceil(2.0 * radius)) + 2
+    indices = np.floor(centers - radius).astype(np.intp)[:, None] + np.arange(taps)
+    weights = _resample_kernel((indices - centers[:, None]) / stretch, resample_filter)
+    totals = weights.sum(axis=1, keepdims=True)
+    # Строка без веса (не бывает при разумных размерах) - ближайший пиксель
+    empty = totals[:, 0] <= 1e-12
+    weights[empty] = (indices[empty] == np.rint(centers[empty])[:, None].astype(np.intp))
+    totals[empty] = 1.0
+    # За краем повторяется крайний пиксель
+    return np.clip(indices, 0, src_size - 1), (weights / totals).astype(np.float32)
+
+
+def _resample_axis0(work, dst_size, resample_filter):
+    indices, weights = resample_taps(work.shape[0], dst_size, resample_filter)
+    out = np.zeros((dst_size,) + work.shape[1:], dtype=np.float32)
+    # Цикл только по отводам фильтра, каждый шаг - целый слой изображения
+    for tap in range(indices.shape[1]):
+        out += weights[:, tap, None, None] * work[indices[:, tap]]
+    return out
+
+
+def resample_image(pixels, width, height, resample_filter=RESAMPLE_BILINEAR):
+    """Resample a (H, W, C) uint8 image to width x height with a separable filter"""
+    src_h, src_w = pixels.shape[:2]
+    if (src_w, src_h) == (width, height):
+        return pixels
+    work = pixels.astype(np.float32)
+    if src_h != height:
+        work = _resample_axis0(work, height, resample_filter)
+    if src_w != width:
+        work = _resample_axis0(work.transpose(1, 0, 2), width, resample_filter).transpose(1, 0, 2)
+    return np.clip(np.rint(work), 0, 255).astype(np.uint8)
+
+
+def texture_pixels(texture_data):
+    """Pixels of prepared texture data at its export size (resampled if needed)"""
+    name, pixels, width, height, use_alpha, options = texture_data
+    if pixels.shape[:2] != (height, width):
+        pixels = resample_image(pixels, width, height, options.get('resize_filter', RESAMPLE_BILINEAR))
+    return pixels
+
+
+# =============================================================================
+# MIP CHAIN
+# =============================================================================
+
+MIP_FILTER_BOX = 'BOX'        # усреднение 2x2 в sRGB
+MIP_FILTER_LINEAR = 'LINEAR'  # усреднение 2x2 в линейном свете (гамма-корректно)
+
+# Порог alpha-test, относительно которого сохраняется покрытие вырезов
+MIP_ALPHA_COVERAGE_REF = 0.5
+
+DEFAULT_ENCODER_OPTIONS = {
+    'mip_filter': MIP_FILTER_BOX,
+    'alpha_weighted': False,
+    'alpha_coverage': False,
+    'quality': DXT_QUALITY_FAST,
+}
+
+
+def encoder_options(**overrides):
+    """Encoder options dict with defaults filled in"""
+    options = dict(DEFAULT_ENCODER_OPTIONS)
+    options.update(overrides)
+    return options
+
+
+def encoder_settings_key(options):
+    """Hashable form of encoder options for cache keys"""
+    return tuple(sorted(options.items()))
+
+
+def srgb_to_linear(c):
+    return np.where(c <= 0.04045, c / 12.92, ((c + 0.055) / 1.055) ** 2.4).astype(np.float32)
+
+
+def linear_to_srgb(c):
+    c = np.maximum(c, 0.0)
+    return np.where(c <= 0.0031308, c * 12.92, 1.055 * c ** (1.0 / 2.4) - 0.055).astype(np.float32)
+
+
+def pad_to_blocks(pixels):
+    """Pad a level to whole 4x4 blocks by repeating its last row/column"""
+    h, w = pixels.shape[:2]
+    pad_h = max(4, (h + 3) // 4 * 4) - h
+    pad_w = max(4, (w + 3) // 4 * 4) - w
+    if pad_h == 0 and pad_w == 0:
+        return pixels
+    return np.pad(pixels, ((0, pad_h), (0, pad_w), (0, 0)), mode='edge')
+
+
+def box_downsample(work):
+    """2x2 float32 box filter, odd last row/column is dropped as before"""
+    h, w, channels = work.shape
+    new_w = max(1, w // 2)
+    new_h = max(1, h // 2)
+    if w > 1 and h > 1:
+        return work[:new_h*2, :new_w*2].reshape(new_h, 2, new_w, 2, channels).mean(axis=(1, 3))
+    if w > 1:
+        return work[:, :new_w*2].reshape(h, new_w, 2, channels).mean(axis=2)
+    return work[:new_h*2].reshape(new_h, 2, w, channels).mean(axis=1)
+
+
+def scale_alpha_coverage(alpha, coverage, alpha_ref=MIP_ALPHA_COVERAGE_REF):
+    """Scale alpha so the share of texels passing alpha_ref matches coverage"""
+    low, high = 0.0, 4.0
+    for _ in range(16):
+        scale = (low + high) * 0.5
+        if np.mean(alpha * scale >= alpha_ref) < coverage:
+            low = scale
+        else:
+            high = scale
+    return np.clip(alpha * high, 0.0, 1.0)
+
+
+def build_mip_chain(pixels, mip_filter=MIP_FILTER_BOX, alpha_weighted=False, alpha_coverage=False):
+    """Build the whole mip pyramid of a (H, W, 4) uint8 image in one pass.
+
+    Levels are accumulated in float32 from the previous float level (no
+    re-quantization between levels) and rounded to uint8 once per level.
+    alpha_weighted averages color by alpha (no dark fringes on cutouts),
+    alpha_coverage keeps the alpha-test coverage of level 0 on every mip.
+    Every returned level is padded to whole 4x4 blocks.
+    """
+    work = pixels.astype(np.float32) / 255.0
+    if mip_filter == MIP_FILTER_LINEAR:
+        work[:, :, :3] = srgb_to_linear(work[:, :, :3])
+    if alpha_weighted:
+        # Предумноженный цвет + обычный цвет для полностью прозрачных областей
+        work = np.concatenate([work[:, :, :3] * work[:, :, 3:4], work], axis=2)
+
+    coverage = np.mean(work[:, :, -1] >= MIP_ALPHA_COVERAGE_REF) if alpha_coverage else None
+
+    levels = [pad_to_blocks(pixels)]
+    while work.shape[0] > 1 or work.shape[1] > 1:
+        work = box_downsample(work)
+
+        if alpha_weighted:
+            alpha = work[:, :, 6:7]
+            safe_alpha = np.maximum(alpha, 1e-6)
+            rgb = np.where(alpha > 1e-6, work[:, :, :3] / safe_alpha, work[:, :, 3:6])
+        else:
+            rgb = work[:, :, :3]
+            alpha = work[:, :, 3:4]
+
+        if mip_filter == MIP_FILTER_LINEAR:
+            rgb = linear_to_srgb(rgb)
+        if coverage is not None:
+            alpha = scale_alpha_coverage(alpha, coverage)
+
+        level = np.concatenate([rgb, alpha], axis=2)
+        level = np.clip(np.rint(level * 255.0), 0, 255).astype(np.uint8)
+        levels.append(pad_to_blocks(level))
+    return levels
+
+
+def compress_mip_chain(levels, use_alpha, quality=DXT_QUALITY_FAST, fourcc=None):
+    """Encode all mip levels as one block batch, returns bytes per level"""
+    blocks = [image_to_blocks(level if use_alpha else level[:, :, :3]) for level in levels]
+    counts = [len(level_blocks) for level_blocks in blocks]
+    all_blocks = np.concatenate(blocks) if len(blocks) > 1 else blocks[0]
+    if use_alpha and fourcc == 'DXT5':
+        encoded = encode_dxt5_blocks(all_blocks, quality)
+    elif use_alpha:
+        encoded = encode_dxt3_blocks(all_blocks, quality)
+    else:
+        encoded = encode_dxt1_blocks(all_blocks, quality)
+
+    compressed = []
+    start = 0
+    for count in counts:
+        compressed.append(encoded[start:start + count].tobytes())
+        start += count
+    return compressed
+
+
+# =============================================================================
+# RASTER FORMATS
+# =============================================================================
+
+TXD_RASTER_DXT = 'DXT'            # DXT1 / DXT3 по альфе (как раньше)
+TXD_RASTER_DXT5 = 'DXT5'          # DXT1 / DXT5 по альфе
+TXD_RASTER_DXT_AUTO = 'DXT_AUTO'  # DXT1 / DXT3 / DXT5 по гистограмме альфы
+TXD_RASTER_AUTO = 'AUTO'          # DXT_AUTO или несжатый формат по размеру и качеству (см. choose_raster)
+TXD_RASTER_8888 = '8888'
+TXD_RASTER_888 = '888'
+TXD_RASTER_1555 = '1555'
+TXD_RASTER_PAL8 = 'PAL8'
+TXD_RASTER_FORMATS = (TXD_RASTER_DXT, TXD_RASTER_DXT5, TXD_RASTER_DXT_AUTO, TXD_RASTER_AUTO,
+                      TXD_RASTER_8888, TXD_RASTER_888, TXD_RASTER_1555, TXD_RASTER_PAL8)
+# Форматы, которые пишутся как DXT (непрозрачные текстуры в них всегда DXT1)
+DXT_RASTERS = (TXD_RASTER_DXT, TXD_RASTER_DXT5, TXD_RASTER_DXT_AUTO)
+
+# формат -> (raster format, D3D формат, глубина, байт на пиксель)
+RASTER_LAYOUTS = {
+    TXD_RASTER_8888: (RASTER_8888, D3DFMT_A8R8G8B8, 32, 4),
+    TXD_RASTER_888: (RASTER_888, D3DFMT_X8R8G8B8, 32, 4),
+    TXD_RASTER_1555: (RASTER_1555, D3DFMT_A1R5G5B5, 16, 2),
+    TXD_RASTER_PAL8: (RASTER_PAL8 | RASTER_8888, D3DFMT_P8, 8, 1),
+}
+
+PALETTE_SIZE = 256
+PALETTE_KMEANS_ITERATIONS = 4
+PALETTE_CHUNK = 4096
+
+# AUTO: маленькие текстуры (UI, радар) с плохим DXT переходят на несжатый формат
+RASTER_AUTO_MAX_PIXELS = 64 * 64
+RASTER_AUTO_MAX_RMSE = 5.0
+
+
+def unique_colors(pixels):
+    """Unique RGBA colors of a (H, W, 4) uint8 level: (colors, counts, inverse)"""
+    packed = np.ascontiguousarray(pixels).reshape(-1, 4).view('<u4')[:, 0]
+    unique, inverse, counts = np.unique(packed, return_inverse=True, return_counts=True)
+    colors = unique.astype('<u4').view(np.uint8).reshape(-1, 4)
+    return colors, counts, inverse.reshape(-1)
+
+
+def median_cut_palette(colors, counts, size=PALETTE_SIZE):
+    """Weighted median-cut palette of unique colors, returns (K, 4) float32 (K <= size)"""
+    colors = colors.astype(np.float32)
+    boxes = [np.arange(len(colors))]
+
+    def score(box):
+        # Делится коробка с наибольшим разбросом, взвешенным числом пикселей
+        if len(box) < 2:
+            return 0.0
+        box_colors = colors[box]
+        return float((box_colors.max(axis=0) - box_colors.min(axis=0)).max() * counts[box].sum())
+
+    scores = [score(boxes[0])]
+    while len(boxes) < size:
+        best = int(np.argmax(scores))
+        if scores[best] <= 0:
+            break
+        box = boxes[best]
+        box_colors = colors[box]
+        axis = int(np.argmax(box_colors.max(axis=0) - box_colors.min(axis=0)))
+        order = box[np.argsort(box_colors[:, axis], kind='stable')]
+        cumulative = np.cumsum(counts[order])
+        split = int(np.searchsorted(cumulative, cumulative[-1] / 2.0)) + 1
+        split = min(max(split, 1), len(order) - 1)
+        boxes[best:best + 1] = [order[:split], order[split:]]
+        scores[best:best + 1] = [score(order[:split]), score(order[split:])]
+
+    weights = counts.astype(np.float32)
+    return np.array([(colors[box] * weights[box, None]).sum(axis=0) / weights[box].sum() for box in boxes],
+                    dtype=np.float32)
+
+
+def nearest_palette_index(colors, palette):
+    """Index of the nearest palette entry for every color (squared RGBA distance)"""
+    colors = colors.astype(np.float32)
+    palette_norm = (palette * palette).sum(axis=1)
+    result = np.empty(len(colors), dtype=np.uint8)
+    for start in range(0, len(colors), PALETTE_CHUNK):
+        chunk = colors[start:start + PALETTE_CHUNK]
+        # |c - p|^2 без |c|^2 (одинаков для всех p): одно умножение матриц на кусок
+        distance = palette_norm[None, :] - 2.0 * (chunk @ palette.T)
+        result[start:start + PALETTE_CHUNK] = np.argmin(distance, axis=1)
+    return result
+
+
+def quantize_palette(pixels, size=PALETTE_SIZE, iterations=PALETTE_KMEANS_ITERATIONS):
+    """(size, 4) uint8 palette for a level: exact if it has few colors, else median cut + k-means"""
+    colors, counts, _ = unique_colors(pixels)
+    palette = np.zeros((size, 4), dtype=np.uint8)
+    if len(colors) <= size:
+        palette[:len(colors)] = colors
+        return palette
+
+    centers = median_cut_palette(colors, counts, size)
+    weights = counts.astype(np.float64)
+    for _ in range(iterations):
+        labels = nearest_palette_index(colors, centers)
+        totals = np.bincount(labels, weights=weights, minlength=len(centers))
+        used = totals > 0
+        for channel in range(4):
+            sums = np.bincount(labels, weights=colors[:, channel] * weights, minlength=len(centers))
+            centers[used, channel] = sums[used] / totals[used]
+    palette[:len(centers)] = np.clip(np.rint(centers), 0, 255).astype(np.uint8)
+    return palette
+
+
+def palette_indices(pixels, palette):
+    """(H, W) uint8 palette indices of a level, matched per unique color"""
+    colors, _, inverse = unique_colors(pixels)
+    return nearest_palette_index(colors, palette.astype(np.float32))[inverse].reshape(pixels.shape[:2])
+
+
+def pack_raster_level(pixels, raster, palette=None):
+    """Pack one uncompressed level in D3D byte order"""
+    if raster == TXD_RASTER_PAL8:
+        return palette_indices(pixels, palette).tobytes()
+    if raster == TXD_RASTER_1555:
+        channels = pixels.astype(np.uint32)
+        rgb = (channels[:, :, :3] * 31 + 127) // 255
+        value = ((channels[:, :, 3] >= 128) << 15) | (rgb[:, :, 0] << 10) | (rgb[:, :, 1] << 5) | rgb[:, :, 2]
+        return value.astype('<u2').tobytes()
+    bgra = pixels[:, :, [2, 1, 0, 3]]
+    if raster == TXD_RASTER_888:
+        bgra[:, :, 3] = 255
+    return bgra.tobytes()
+
+
+def effective_raster(raster, use_alpha):
+    """Raster actually written: 888 has no alpha channel, alpha textures use 8888"""
+    return TXD_RASTER_8888 if raster == TXD_RASTER_888 and use_alpha else raster
+
+
+def encode_raster_levels(levels, width, height, raster, use_alpha):
+    """Pack a padded mip chain into a raster format, returns (mip data list, palette or None)"""
+    # Уровни обрезаются до настоящего размера мипа (DXT паддинг до 4x4 не нужен)
+    levels = [level[:max(1, height >> i), :max(1, width >> i)] for i, level in enumerate(levels)]
+    if not use_alpha:
+        # Альфа не подключена - текстура непрозрачная в любом формате
+        levels = [np.concatenate([level[:, :, :3], np.full(level.shape[:2] + (1,), 255, np.uint8)], axis=2)
+                  for level in levels]
+    palette = quantize_palette(levels[0]) if raster == TXD_RASTER_PAL8 else None
+    return [pack_raster_level(level, raster, palette) for level in levels], palette
+
+
+def dxt_fourcc(raster, pixels, use_alpha):
+    """DXT format of a texture for a DXT raster setting (AUTO picks like DXT_AUTO)"""
+    if not use_alpha:
+        return 'DXT1'
+    if raster == TXD_RASTER_DXT5:
+        return 'DXT5'
+    if raster in (TXD_RASTER_DXT_AUTO, TXD_RASTER_AUTO):
+        return choose_alpha_format(pixels[:, :, 3])
+    return 'DXT3'
+
+
+def choose_raster(pixels, use_alpha, dxt_rmse):
+    """AUTO format for a level 0 that DXT already encoded with dxt_rmse.
+
+    DXT stays when its error is within RASTER_AUTO_MAX_RMSE. Otherwise a
+    texture with at most 256 colors goes to a lossless PAL8 if that is not
+    much larger (alpha textures, or small ones); other small textures use
+    PAL8 if the quantized palette is good enough, else 8888/888.
+    """
+    if dxt_rmse <= RASTER_AUTO_MAX_RMSE:
+        return TXD_RASTER_DXT
+    height, width = pixels.shape[:2]
+    small = width * height <= RASTER_AUTO_MAX_PIXELS
+    if len(unique_colors(pixels)[0]) <= PALETTE_SIZE and (use_alpha or small):
+        return TXD_RASTER_PAL8
+    if not small:
+        return TXD_RASTER_DXT
+    palette = quantize_palette(pixels)
+    if raster_rmse(pixels, pack_raster_level(pixels, TXD_RASTER_PAL8, palette), TXD_RASTER_PAL8,
+                   palette, use_alpha) <= RASTER_AUTO_MAX_RMSE:
+        return TXD_RASTER_PAL8
+    return TXD_RASTER_8888 if use_alpha else TXD_RASTER_888
+
+
+def raster_rmse(pixels, level_data, raster, palette, use_alpha):
+    """RMSE (0..255) of an uncompressed level, alpha only if the texture uses it"""
+    height, width = pixels.shape[:2]
+    decoded = RASTER_DECODERS[RASTER_LAYOUTS[raster][1]](level_data, width, height, palette)
+    channels = 4 if use_alpha else 3
+    diff = decoded[:, :, :channels].astype(np.float64) - pixels[:, :, :channels]
+    return float(np.sqrt(np.mean(diff * diff)))
+
+
+# =============================================================================
+# MIP BUDGET
+# =============================================================================
+
+# Заголовки TXD без текстур: TEXDICTIONARY + STRUCT(4) + EXTENSION
+TXD_OVERHEAD = 12 + 12 + 4 + 12
+
+
+def max_mip_skip(width, height):
+    """How many top levels can be dropped while the new level 0 stays an exact multiple of 4"""
+    skip = 0
+    while width % (8 << skip) == 0 and height % (8 << skip) == 0:
+        skip += 1
+    return skip
+
+
+def mip_skip_for_dimension(width, height, max_dimension):
+    """Levels to drop so the larger side fits max_dimension (as far as max_mip_skip allows)"""
+    skip = 0
+    limit = max_mip_skip(width, height)
+    while skip < limit and max(width >> skip, height >> skip) > max_dimension:
+        skip += 1
+    return skip
+
+
+def texture_native_size(width, height, use_alpha, mip_skip=0, raster=TXD_RASTER_DXT):
+    """Exact size of a texture native section (with its header) for a full mip chain.
+
+    AUTO is estimated as DXT - the format is only known after encoding.
+    """
+    width, height = width >> mip_skip, height >> mip_skip
+    block_size = 16 if use_alpha else 8
+    layout = RASTER_LAYOUTS.get(effective_raster(raster, use_alpha))
+    size = 12 + 12 + TEXNATIVE_HEADER.size + 12
+    if raster == TXD_RASTER_PAL8:
+        size += 4 * PALETTE_SIZE
+    while True:
+        if layout:
+            size += 4 + width * height * layout[3]
+        else:
+            size += 4 + max(1, (width + 3) // 4) * max(1, (height + 3) // 4) * block_size
+        if width == 1 and height == 1:
+            return size
+        width, height = max(1, width // 2), max(1, height // 2)
+
+
+def plan_mip_budget(textures, budget_bytes=0, max_dimension=0):
+    """Top mip levels to drop per texture, [(width, height, use_alpha, raster)] -> [skip].
+
+    max_dimension is applied first, then the texture with the largest saving
+    loses one more level until the archive fits budget_bytes (or nothing
+    more can be dropped). Sizes are exact, so nothing is encoded to plan.
+    """
+    skips = [mip_skip_for_dimension(w, h, max_dimension) if max_dimension else 0 for w, h, _, _ in textures]
+    if not budget_bytes:
+        return skips
+
+    sizes = [texture_native_size(w, h, a, skip, r) for (w, h, a, r), skip in zip(textures, skips)]
+    total = TXD_OVERHEAD + sum(sizes)
+    limits = [max_mip_skip(w, h) for w, h, _, _ in textures]
+    while total > budget_bytes:
+        best, best_saving = None, 0
+        for i, (w, h, a, r) in enumerate(textures):
+            if skips[i] < limits[i]:
+                saving = sizes[i] - texture_native_size(w, h, a, skips[i] + 1, r)
+                if saving > best_saving:
+                    best, best_saving = i, saving
+        if best is None:
+            break
+        skips[best] += 1
+        sizes[best] -= best_saving
+        total -= best_saving
+    return skips
+
+
+def process_texture_parallel(texture_data):
+    """Process prepared texture data (can run in parallel)"""
+    return encode_texture(texture_data)[0]
+
+
+def encode_texture(texture_data):
+    """Compress prepared texture data, returns (texture native, level 0 RMSE)"""
+    name, pixels, width, height, use_alpha, options = texture_data
+    pixels = texture_pixels(texture_data)
+
+    new_w = (width + 3) // 4 * 4
+    new_h = (height + 3) // 4 * 4
+
+    if new_w != width or new_h != height:
+        pixels = pad_to_blocks(pixels)
+        width, height = new_w, new_h
+
+    levels = build_mip_chain(
+        pixels,
+        mip_filter=options.get('mip_filter', MIP_FILTER_BOX),
+        alpha_weighted=use_alpha and options.get('alpha_weighted', False),
+        alpha_coverage=use_alpha and options.get('alpha_coverage', False),
+    )
+    # Бюджет: верхние уровни отбрасываются, уровень skip становится нулевым
+    skip = min(options.get('mip_skip', 0), max_mip_skip(width, height))
+    if skip:
+        levels = levels[skip:]
+        width, height = width >> skip, height >> skip
+
+    raster = effective_raster(options.get('raster', TXD_RASTER_DXT), use_alpha)
+    if raster in DXT_RASTERS or raster == TXD_RASTER_AUTO:
+        fourcc = dxt_fourcc(raster, levels[0][:height, :width], use_alpha)
+        mip_levels = compress_mip_chain(levels, use_alpha, options.get('quality', DXT_QUALITY_FAST), fourcc)
+        rmse = texture_rmse(levels[0], mip_levels[0], use_alpha, fourcc)
+        if raster == TXD_RASTER_AUTO:
+            raster = choose_raster(levels[0][:height, :width], use_alpha, rmse)
+        if raster in DXT_RASTERS:
+            return build_texture_native(name, width, height, use_alpha, mip_levels, fourcc), rmse
+
+    mip_levels, palette = encode_raster_levels(levels, width, height, raster, use_alpha)
+    rmse = raster_rmse(levels[0][:height, :width], mip_levels[0], raster, palette, use_alpha)
+    del levels
+    return build_raster_native(name, width, height, raster, use_alpha, mip_levels, palette), rmse
+
+
+def build_texture_native(name, width, height, use_alpha, mip_levels, fourcc=None):
+    """Build a D3D9 DXT1/DXT3/DXT5 texture native (STRUCT + EXTENSION) from compressed mips.
+
+    fourcc defaults to DXT3 for alpha textures and DXT1 otherwise.
+    """
+    if use_alpha:
+        raster_format = RASTER_8888 | RASTER_MIPMAP
+        depth = 32
+    else:
+        raster_format = RASTER_565 | RASTER_MIPMAP
+        depth = 16
+
+    tex_name = encode_texture_name(name)
+    mip_count = len(mip_levels)
+    fourcc = (fourcc or ('DXT3' if use_alpha else 'DXT1')).encode('ascii')
+
+    struct_data = bytearray()
+    struct_data.extend(struct.pack('<II', PLATFORM_D3D9, make_filter_flags()))
+    struct_data.extend(tex_name)
+    struct_data.extend(b'\x00' * 32)
+    struct_data.extend(struct.pack('<I', raster_format))
+    struct_data.extend(fourcc)
+    struct_data.extend(struct.pack('<HH', width, height))
+    struct_data.extend(struct.pack('<B', depth))
+    struct_data.extend(struct.pack('<B', mip_count))
+    struct_data.extend(struct.pack('<B', 4))  # raster type
+    # D3D format flag: 0x08 для DXT1, 0x09 для DXT3/DXT5 (с альфой)
+    struct_data.extend(struct.pack('<B', 0x09 if use_alpha else 0x08))
+
+    for mip_data in mip_levels:
+        struct_data.extend(struct.pack('<I', len(mip_data)))
+        struct_data.extend(mip_data)
+
+    tex_native = bytearray()
+    write_rw_section_header(tex_native, RW_STRUCT, len(struct_data))
+    tex_native.extend(struct_data)
+    write_rw_section_header(tex_native, RW_EXTENSION, 0)
+
+    return bytes(tex_native)
+
+
+def build_raster_native(name, width, height, raster, use_alpha, mip_levels, palette=None):
+    """Build a D3D9 uncompressed or PAL8 texture native from packed mips"""
+    raster_format, d3d_format, depth, _ = RASTER_LAYOUTS[raster]
+    has_alpha = use_alpha and raster != TXD_RASTER_888
+
+    struct_data = bytearray()
+    struct_data.extend(struct.pack('<II', PLATFORM_D3D9, make_filter_flags()))
+    struct_data.extend(encode_texture_name(name))
+    struct_data.extend(b'\x00' * 32)
+    struct_data.extend(struct.pack('<II', raster_format | RASTER_MIPMAP, d3d_format))
+    struct_data.extend(struct.pack('<HHBBBB', width, height, depth, len(mip_levels), 4, 0x01 if has_alpha else 0x00))
+    if palette is not None:
+        # Палитра RW хранится как RGBA, 256 записей
+        struct_data.extend(palette.tobytes())
+
+    for mip_data in mip_levels:
+        struct_data.extend(struct.pack('<I', len(mip_data)))
+        struct_data.extend(mip_data)
+
+    tex_native = bytearray()
+    write_rw_section_header(tex_native, RW_STRUCT, len(struct_data))
+    tex_native.extend(struct_data)
+    write_rw_section_header(tex_native, RW_EXTENSION, 0)
+
+    return bytes(tex_native)
+
+
+def texture_native_format(tex_native):
+    """Format name of a built texture native: DXT1/DXT3 or a TXD_RASTER_* value"""
+    d3d_format = struct.unpack_from('<I', tex_native, 12 + 76)[0]
+    fourcc = struct.pack('<I', d3d_format)
+    if fourcc.startswith(b'DXT'):
+        return fourcc.decode('ascii')
+    for raster, layout in RASTER_LAYOUTS.items():
+        if layout[1] == d3d_format:
+            return raster
+    return f"D3D{d3d_format}"
+
+
+# =============================================================================
+# DXT DECODERS
+# =============================================================================
+
+def blocks_to_image(blocks, width, height):
+    """Inverse of image_to_blocks: (N, 16, C) blocks to a (H, W, C) level cropped to width x height"""
+    blocks_x = max(1, (width + 3) // 4)
+    blocks_y = max(1, (height + 3) // 4)
+    channels = blocks.shape[2]
+    image = (blocks.reshape(blocks_y, blocks_x, 4, 4, channels)
+             .transpose(0, 2, 1, 3, 4)
+             .reshape(blocks_y * 4, blocks_x * 4, channels))
+    return image[:height, :width]
+
+
+def decode_dxt1_colors(blocks, punch_through=True):
+    """Decode DXT1 color fields of a structured block array to (N, 16, 4) uint8 RGBA"""
+    color0 = blocks['color0']
+    color1 = blocks['color1']
+    c0 = rgb_from_565(color0)
+    c1 = rgb_from_565(color1)
+    four_color = (color0 > color1)[:, None]
+    if not punch_through:
+        four_color = np.ones_like(four_color)
+
+    palette = np.empty((len(blocks), 4, 4), dtype=np.float64)
+    palette[:, 0, :3] = c0
+    palette[:, 1, :3] = c1
+    palette[:, 2, :3] = np.where(four_color, (2.0*c0 + c1)/3.0, (c0 + c1)/2.0)
+    palette[:, 3, :3] = np.where(four_color, (c0 + 2.0*c1)/3.0, 0.0)
+    palette[:, :, 3] = 255.0
+    # Режим 3 цветов: индекс 3 - прозрачный чёрный
+    palette[:, 3, 3] = np.where(four_color[:, 0], 255.0, 0.0)
+    palette = np.rint(palette).astype(np.uint8)
+
+    shifts = np.arange(0, 32, 2, dtype=np.uint32)
+    indices = (blocks['indices'][:, None] >> shifts) & 3
+    return np.take_along_axis(palette, indices[:, :, None].astype(np.intp), axis=1)
+
+
+def decode_dxt1_level(data, width, height):
+    blocks = np.frombuffer(data, dtype=DXT1_BLOCK_DTYPE)
+    return blocks_to_image(decode_dxt1_colors(blocks), width, height)
+
+
+def decode_dxt3_level(data, width, height):
+    blocks = np.frombuffer(data, dtype=DXT3_BLOCK_DTYPE)
+    rgba = decode_dxt1_colors(blocks, punch_through=False)
+    shifts = np.arange(0, 64, 4, dtype=np.uint64)
+    alpha = ((blocks['alpha'][:, None] >> shifts) & np.uint64(0xF)).astype(np.uint8)
+    rgba[:, :, 3] = alpha * 17
+    return blocks_to_image(rgba, width, height)
+
+
+def decode_dxt5_level(data, width, height):
+    blocks = np.frombuffer(data, dtype=DXT5_BLOCK_DTYPE)
+    rgba = decode_dxt1_colors(blocks, punch_through=False)
+    words = blocks['alpha']
+    palette = dxt5_alpha_palette(words & np.uint64(0xFF), (words >> np.uint64(8)) & np.uint64(0xFF))
+    shifts = np.arange(16, 64, 3, dtype=np.uint64)
+    indices = ((words[:, None] >> shifts) & np.uint64(7)).astype(np.intp)
+    rgba[:, :, 3] = np.take_along_axis(palette, indices, axis=1)
+    return blocks_to_image(rgba, width, height)
+
+
+def texture_rmse(pixels, level_data, use_alpha, fourcc=None):
+    """RMSE (0..255) between a block-aligned level and its DXT data, alpha only for DXT3/DXT5"""
+    height, width = pixels.shape[:2]
+    if use_alpha:
+        decoder = decode_dxt5_level if fourcc == 'DXT5' else decode_dxt3_level
+        decoded = decoder(level_data, width, height)
+        reference = pixels
+    else:
+        decoded = decode_dxt1_level(level_data, width, height)[:, :, :3]
+        reference = pixels[:, :, :3]
+    diff = decoded.astype(np.float64) - reference
+    return float(np.sqrt(np.mean(diff * diff)))
+
+
+DXT_DECODERS = {
+    'DXT1': (decode_dxt1_level, 8),
+    'DXT3': (decode_dxt3_level, 16),
+    'DXT5': (decode_dxt5_level, 16),
+}
+
+
+def decode_8888_level(data, width, height, palette=None):
+    bgra = np.frombuffer(data, dtype=np.uint8, count=width * height * 4).reshape(height, width, 4)
+    return bgra[:, :, [2, 1, 0, 3]]
+
+
+def decode_888_level(data, width, height, palette=None):
+    rgba = decode_8888_level(data, width, height)
+    rgba[:, :, 3] = 255
+    return rgba
+
+
+def decode_1555_level(data, width, height, palette=None):
+    value = np.frombuffer(data, dtype='<u2', count=width * height).reshape(height, width).astype(np.uint32)
+    rgba = np.empty((height, width, 4), dtype=np.uint8)
+    for channel, shift in enumerate((10, 5, 0)):
+        rgba[:, :, channel] = (((value >> shift) & 31) * 255 + 15) // 31
+    rgba[:, :, 3] = np.where(value & 0x8000, 255, 0)
+    return rgba
+
+
+def decode_pal8_level(data, width, height, palette):
+    indices = np.frombuffer(data, dtype=np.uint8, count=width * height).reshape(height, width)
+    return np.asarray(palette, dtype=np.uint8).reshape(-1, 4)[indices]
+
+
+# D3D формат -> декодер несжатого уровня (data, width, height, palette)
+RASTER_DECODERS = {
+    D3DFMT_A8R8G8B8: decode_8888_level,
+    D3DFMT_X8R8G8B8: decode_888_level,
+    D3DFMT_A1R5G5B5: decode_1555_level,
+    D3DFMT_P8: decode_pal8_level,
+}
+
+
+# =============================================================================
+# TXD READER
+# =============================================================================
+
+# platform, filter, name[32], mask[32], raster format, D3D format/hasAlpha, width, height,
+# depth, mip count, raster type, flags
+TEXNATIVE_HEADER = struct.Struct('<II32s32sIIHHBBBB')
+
+
+class TxdTexture:
+    """One texture native of a TxdReader: header fields and mip locations.
+
+    mip_offsets holds (offset, size) pairs into the mapped file; payloads
+    are only touched by mip_data()/native_data()/decode().
+    """
+
+    def __init__(self, reader, offset, size, fields, mip_offsets, palette_offset):
+        (self.platform, self.filter_flags, name, mask, self.raster_format,
+         d3d_format, self.width, self.height, self.depth, self.mip_count,
+         self.raster_type, self.flags) = fields
+        self.reader = reader
+        self.offset = offset  # начало секции TEXTURENATIVE (заголовок)
+        self.size = size      # размер секции вместе с заголовком
+        self.name = name.split(b'\x00', 1)[0].decode('ascii', errors='replace')
+        self.mask = mask.split(b'\x00', 1)[0].decode('ascii', errors='replace')
+        self.mip_offsets = mip_offsets
+        self.palette_offset = palette_offset
+        self.d3d_format = d3d_format
+
+        if self.platform == PLATFORM_D3D8:
+            # D3D8: вместо формата - флаг альфы, тип DXT в последнем байте
+            self.has_alpha = bool(d3d_format)
+            self.format = f"DXT{self.flags}" if self.flags else f"RASTER_{self.raster_format & 0x0F00:04X}"
+        else:
+            self.has_alpha = bool(self.flags & 0x01)
+            fourcc = struct.pack('<I', d3d_format)
+            self.format = fourcc.decode('ascii') if fourcc.startswith(b'DXT') else f"D3D{d3d_format}"
+
+    def __repr__(self):
+        return f"<TxdTexture {self.name!r} {self.format} {self.width}x{self.height} mips={len(self.mip_offsets)}>"
+
+    def mip_size(self, level):
+        return max(1, self.width >> level), max(1, self.height >> level)
+
+    def native_data(self):
+        """Zero-copy view of the whole section payload (STRUCT + EXTENSION)"""
+        return self.reader.view[self.offset + 12:self.offset + self.size]
+
+    def mip_data(self, level=0):
+        """Zero-copy view of one compressed mip level"""
+        offset, size = self.mip_offsets[level]
+        return self.reader.view[offset:offset + size]
+
+    def palette(self):
+        """Zero-copy view of the RGBA palette, None for non-palettized rasters"""
+        if self.palette_offset is None:
+            return None
+        size = 4 * (256 if self.raster_format & RASTER_PAL8 else 32)
+        return self.reader.view[self.palette_offset:self.palette_offset + size]
+
+    def decode(self, level=0):
+        """Decode one mip level to a top-down (H, W, 4) uint8 RGBA array"""
+        width, height = self.mip_size(level)
+        decoder = DXT_DECODERS.get(self.format)
+        if decoder is not None:
+            return decoder[0](self.mip_data(level), width, height)
+        raster_decoder = RASTER_DECODERS.get(self.d3d_format) if self.platform == PLATFORM_D3D9 else None
+        if raster_decoder is None:
+            raise ValueError(f"{self.name}: decoding {self.format} is not supported")
+        return raster_decoder(self.mip_data(level), width, height, self.palette())
+
+
+class TxdReader:
+    """Memory-mapped TXD parser.
+
+    Walks TEXDICTIONARY -> TEXTURENATIVE -> STRUCT and indexes every texture
+    without copying payloads. Views returned by textures must be released
+    before close() (mmap refuses to close while they are alive).
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self._file = open(filepath, 'rb')
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Пустой файл нельзя отобразить в память
+            self._file.close()
+            raise ValueError(f"{filepath}: empty file")
+        self.view = memoryview(self._mmap)
+        self.textures = []
+        try:
+            self._parse()
+        except Exception:
+            self.close()
+            raise
+        self.by_name = {texture.name.lower(): texture for texture in self.textures}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def __len__(self):
+        return len(self.textures)
+
+    def __iter__(self):
+        return iter(self.textures)
+
+    def get(self, name):
+        """Texture by name (case-insensitive, as in the game)"""
+        return self.by_name.get(name.lower())
+
+    def close(self):
+        if self._mmap is None:
+            return
+        self.view.release()
+        self._mmap.close()
+        self._file.close()
+        self._mmap = None
+
+    def _section(self, offset, expected=None):
+        if offset + 12 > len(self.view):
+            raise ValueError(f"{self.filepath}: truncated section header at {offset}")
+        section_type, size, version = struct.unpack_from('<III', self.view, offset)
+        if expected is not None and section_type != expected:
+            raise ValueError(f"{self.filepath}: expected section 0x{expected:X} at {offset}, got 0x{section_type:X}")
+        if offset + 12 + size > len(self.view):
+            raise ValueError(f"{self.filepath}: section 0x{section_type:X} at {offset} runs past end of file")
+        return section_type, size
+
+    def _parse(self):
+        _, dict_size = self._section(0, RW_TEXDICTIONARY)
+        end = 12 + dict_size
+        _, struct_size = self._section(12, RW_STRUCT)
+        self.texture_count, self.device_id = struct.unpack_from('<HH', self.view, 24)
+
+        offset = 24 + struct_size
+        while offset < end and len(self.textures) < self.texture_count:
+            section_type, size = self._section(offset)
+            if section_type == RW_TEXTURENATIVE:
+                self.textures.append(self._parse_native(offset, size))
+            offset += 12 + size
+
+    def _parse_native(self, offset, size):
+        _, struct_size = self._section(offset + 12, RW_STRUCT)
+        data_start = offset + 24
+        data_end = data_start + struct_size
+        if struct_size < TEXNATIVE_HEADER.size:
+            raise ValueError(f"{self.filepath}: texture native at {offset} is too short")
+        fields = TEXNATIVE_HEADER.unpack_from(self.view, data_start)
+        raster_format = fields[4]
+        mip_count = fields[9]
+
+        position = data_start + TEXNATIVE_HEADER.size
+        palette_offset = None
+        if raster_format & (RASTER_PAL8 | RASTER_PAL4):
+            palette_offset = position
+            # D3D хранит 256 цветов для PAL8 и 32 для PAL4
+            position += 4 * (256 if raster_format & RASTER_PAL8 else 32)
+
+        mip_offsets = []
+        for _ in range(mip_count):
+            if position + 4 > data_end:
+                raise ValueError(f"{self.filepath}: texture native at {offset} has truncated mip levels")
+            mip_size = struct.unpack_from('<I', self.view, position)[0]
+            position += 4
+            if position + mip_size > data_end:
+                raise ValueError(f"{self.filepath}: texture native at {offset} has truncated mip levels")
+            mip_offsets.append((position, mip_size))
+            position += mip_size
+
+        return TxdTexture(self, offset, 12 + size, fields, mip_offsets, palette_offset)
+
+
+# =============================================================================
+# WORKER POOL
+# =============================================================================
+
+TXD_BACKEND_THREAD = 'THREAD'
+TXD_BACKEND_PROCESS = 'PROCESS'
+
+
+def default_worker_count(backend):
+    """Worker count used when the setting is 0 (auto)"""
+    cpu_count = os.cpu_count() or 4
+    if backend == TXD_BACKEND_PROCESS:
+        return cpu_count
+    # Потоки упираются в GIL - больше 8 не даёт прироста
+    return min(8, cpu_count)
+
+
+def _ordered_results(executor, fn, jobs, window):
+    """Submit jobs with at most `window` in flight, yield (result, error) in order"""
+    in_flight = deque()
+    jobs = iter(jobs)
+    while True:
+        while len(in_flight) < window:
+            job = next(jobs, None)
+            if job is None:
+                break
+            in_flight.append(executor.submit(fn, *job))
+        if not in_flight:
+            return
+        future = in_flight.popleft()
+        try:
+            yield future.result(), None
+        except Exception as e:
+            yield None, e
+
+
+def _process_shared_texture(job):
+    """Process-pool worker: compress a texture whose pixels live in shared memory"""
+    shm_name, offset, shape, name, width, height, use_alpha, options = job
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        # Копия сразу отвязывает массив от сегмента - close() не упадёт при ошибке сжатия
+        pixels = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=offset).copy()
+    finally:
+        shm.close()
+    return encode_texture((name, pixels, width, height, use_alpha, options))
+
+
+def run_texture_jobs(texture_data, backend=TXD_BACKEND_THREAD, num_workers=0):
+    """Compress prepared textures on a worker pool.
+
+    Yields ((tex_native, rmse), error) per texture in input order, so callers
+    keep the DXT1-then-DXT3 layout of the archive. Only about two results
+    per worker are in flight, so finished textures can be streamed out one
+    by one. The process backend passes pixel arrays to workers through one
+    shared memory segment instead of pickling.
+    """
+    if not texture_data:
+        return
+    num_workers = num_workers or default_worker_count(backend)
+    num_workers = min(num_workers, len(texture_data))
+
+    if backend != TXD_BACKEND_PROCESS:
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            yield from _ordered_results(executor, encode_texture,
+                                        ((data,) for data in texture_data), num_workers * 2)
+        return
+
+    total_size = sum(data[1].nbytes for data in texture_data)
+    shm = shared_memory.SharedMemory(create=True, size=max(1, total_size))
+    try:
+        jobs = []
+        offset = 0
+        for name, pixels, width, height, use_alpha, options in texture_data:
+            view = np.ndarray(pixels.shape, dtype=np.uint8, buffer=shm.buf, offset=offset)
+            view[...] = pixels
+            del view
+            jobs.append((shm.name, offset, pixels.shape, name, width, height, use_alpha, options))
+            offset += pixels.nbytes
+
+        # spawn - одинаково на Windows/Linux/macOS и безопасно для процесса Blender
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=num_workers, mp_context=context) as executor:
+            yield from _ordered_results(executor, _process_shared_texture,
+                                        ((job,) for job in jobs), num_workers * 2)
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+# =============================================================================
+# NVTT (GPU)
+# =============================================================================
+
+NVTT_TIMEOUT = 60
+
+
+def write_png(path, pixels):
+    """Write a top-down (H, W, 3|4) uint8 array as an 8-bit PNG (no bpy needed)"""
+    height, width, channels = pixels.shape
+    color_type = 6 if channels == 4 else 2
+    # Каждая строка: байт фильтра 0 + сырые пиксели
+    raw = np.zeros((height, width * channels + 1), dtype=np.uint8)
+    raw[:, 1:] = np.ascontiguousarray(pixels).reshape(height, width * channels)
+
+    def chunk(tag, data):
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, color_type, 0, 0, 0)))
+        f.write(chunk(b'IDAT', zlib.compress(raw.tobytes(), 1)))
+        f.write(chunk(b'IEND', b''))
+
+
+def dds_to_texture_native(name, dds_data, use_alpha):
+    """Convert nvcompress DDS output (BC1/BC2 with mips) to a texture native"""
+    if dds_data[:4] != b'DDS ':
+        return None
+
+    # DDS Header (124 байта после "DDS ")
+    dds_height, dds_width = struct.unpack_from('<II', dds_data, 12)
+    mip_count = struct.unpack_from('<I', dds_data, 28)[0] or 1
+
+    # Проверяем на DX10 extended header
+    header_size = 148 if dds_data[84:88] == b'DX10' else 128
+    pixel_data = memoryview(dds_data)[header_size:]
+    block_size = 16 if use_alpha else 8
+
+    # Берём только уровни, которые реально есть в файле - число мипов в заголовке совпадёт
+    mip_levels = []
+    offset = 0
+    mip_w, mip_h = dds_width, dds_height
+    for _ in range(mip_count):
+        mip_size = max(1, (mip_w + 3) // 4) * max(1, (mip_h + 3) // 4) * block_size
+        if offset + mip_size > len(pixel_data):
+            break
+        mip_levels.append(pixel_data[offset:offset + mip_size])
+        offset += mip_size
+        mip_w = max(1, mip_w // 2)
+        mip_h = max(1, mip_h // 2)
+
+    if not mip_levels:
+        return None
+    return build_texture_native(name, dds_width, dds_height, use_alpha, mip_levels)
+
+
+class NvttCompressor:
+    """nvcompress command line wrapper.
+
+    Subclass and override command() to plug in another DDS compressor CLI
+    (or a stub). use_cuda starts as None and is settled by the first
+    texture: after one CUDA failure every further call goes straight to
+    the CPU fallback instead of retrying CUDA per texture.
+    """
+
+    def __init__(self, executable):
+        self.executable = executable
+        self.use_cuda = None
+        self._lock = threading.Lock()
+
+    def command(self, input_file, output_file, use_alpha, use_cuda):
+        # -alpha говорит nvcompress что PNG имеет alpha канал
+        fmt = "-bc2" if use_alpha else "-bc1"  # bc1=DXT1, bc2=DXT3
+        alpha_flag = ["-alpha"] if use_alpha else []
+        cuda_flag = [] if use_cuda else ["-nocuda"]
+        return [self.executable] + cuda_flag + [fmt, "-mipmap"] + alpha_flag + [input_file, output_file]
+
+    def run(self, input_file, output_file, use_alpha):
+        """Compress one file, returns True if the output DDS exists"""
+        if self.use_cuda is not False:
+            result = subprocess.run(self.command(input_file, output_file, use_alpha, True),
+                                    capture_output=True, timeout=NVTT_TIMEOUT)
+            with self._lock:
+                if self.use_cuda is None:
+                    self.use_cuda = result.returncode == 0
+            if result.returncode == 0:
+                return os.path.exists(output_file)
+
+        subprocess.run(self.command(input_file, output_file, use_alpha, False),
+                       capture_output=True, timeout=NVTT_TIMEOUT)
+        return os.path.exists(output_file)
+
+
+def _nvtt_job(compressor, name, input_file, output_file, use_alpha, pixels):
+    if not compressor.run(input_file, output_file, use_alpha):
+        raise RuntimeError("nvcompress did not produce output")
+    with open(output_file, 'rb') as f:
+        dds_data = f.read()
+    tex_native = dds_to_texture_native(name, dds_data, use_alpha)
+    if tex_native is None:
+        raise RuntimeError("invalid DDS output")
+    offset = 12 + TEXNATIVE_HEADER.size
+    level0 = tex_native[offset + 4:offset + 4 + struct.unpack_from('<I', tex_native, offset)[0]]
+    rmse = texture_rmse(pad_to_blocks(pixels), level0, use_alpha)
+    return tex_native, rmse
+
+
+def compress_textures_nvtt(texture_data, compressor, num_workers=0):
+    """Compress prepared textures with an external compressor in one batch.
+
+    All PNG inputs are written up front into one temp folder, then at most
+    num_workers compressor processes run at once; each DDS is parsed on the
+    worker thread as soon as its process exits. Yields (result, error) per
+    texture in input order, like run_texture_jobs.
+    """
+    if not texture_data:
+        return
+    num_workers = min(num_workers or default_worker_count(TXD_BACKEND_PROCESS), len(texture_data))
+
+    with tempfile.TemporaryDirectory(prefix="inu_nvtt_") as temp_dir:
+        jobs = []
+        for index, data in enumerate(texture_data):
+            name, use_alpha, options = data[0], data[4], data[5]
+            pixels = texture_pixels(data)
+            skip = min(options.get('mip_skip', 0), max_mip_skip(data[2], data[3]))
+            if skip:
+                # nvcompress сам строит мипы - ему отдаётся уже уменьшенный уровень
+                pixels = build_mip_chain(pixels, options.get('mip_filter', MIP_FILTER_BOX))[skip]
+            # Имена файлов по индексу - не зависят от символов в имени текстуры
+            input_file = os.path.join(temp_dir, f"{index}.png")
+            output_file = os.path.join(temp_dir, f"{index}.dds")
+            write_png(input_file, pixels if use_alpha else pixels[:, :, :3])
+            jobs.append((compressor, name, input_file, output_file, use_alpha, pixels))
+
+        # Пока неизвестно, работает ли CUDA - первая текстура идёт одна
+        if compressor.use_cuda is None:
+            try:
+                yield _nvtt_job(*jobs[0]), None
+            except Exception as e:
+                yield None, e
+            jobs = jobs[1:]
+
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            yield from _ordered_results(executor, _nvtt_job, jobs, num_workers * 2)
+
+
+# =============================================================================
+# INCREMENTAL UPDATE
+# =============================================================================
+
+def txd_sidecar_path(filepath):
+    """Sidecar with the source keys of every texture in a TXD"""
+    return filepath + ".inu.json"
+
+
+def native_checksum(tex_native):
+    return zlib.crc32(tex_native) & 0xFFFFFFFF
+
+
+def load_txd_sidecar(filepath):
+    """Previous {name_lower: {'key', 'crc'}} of a TXD, empty if missing or unreadable"""
+    try:
+        with open(txd_sidecar_path(filepath), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if data.get('encoder') != TXD_ENCODER_VERSION:
+        return {}
+    return data.get('textures', {})
+
+
+def save_txd_sidecar(filepath, textures):
+    path = txd_sidecar_path(filepath)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'encoder': TXD_ENCODER_VERSION, 'textures': textures}, f, indent=1, sort_keys=True)
+        os.replace(temp_path, path)
+    except OSError as e:
+        print(f"TXD SIDECAR WRITE ERROR: {e}")
+
+
+def open_previous_txd(filepath):
+    """TxdReader and sidecar of an existing TXD, (None, {}) if it can't be reused"""
+    sidecar = load_txd_sidecar(filepath)
+    if not sidecar or not os.path.isfile(filepath):
+        return None, {}
+    try:
+        return TxdReader(filepath), sidecar
+    except (OSError, ValueError) as e:
+        print(f"TXD INCREMENTAL: {filepath}: {e}")
+        return None, {}
+
+
+def find_reusable_native(reader, sidecar, name, key):
+    """Texture of the previous archive with the same name and source key, or None.
+
+    The stored CRC guards against archives edited by other tools after export.
+    """
+    entry = sidecar.get(name.lower())
+    if not entry or entry.get('key') != key:
+        return None
+    texture = reader.get(name)
+    if texture is None:
+        return None
+    with texture.native_data() as data:
+        if native_checksum(data) != entry.get('crc'):
+            return None
+    return texture
+
+
+# =============================================================================
+# DEDUPLICATION
+# =============================================================================
+
+TXD_DEDUP_OFF = 'OFF'        # каждая текстура сжимается отдельно
+TXD_DEDUP_SHARE = 'SHARE'    # одинаковые пиксели сжимаются один раз, все имена остаются
+TXD_DEDUP_REPORT = 'REPORT'  # как SHARE + список дубликатов в отчёте
+TXD_DEDUP_ALIAS = 'ALIAS'    # одна запись на одинаковые пиксели, материалы перенаправляются
+
+
+class TextureDedup:
+    """Run-wide index of finished archives by texture source key.
+
+    Shared by all TXDs exported in one run (Export All): a texture whose
+    key was already written to an earlier archive is copied from that file
+    instead of being compressed again. Only (path, name) pairs are kept,
+    payloads are read back through TxdReader when needed. Keys of archives
+    that are planned but not written yet (pipelined Export All) are reserved,
+    so later archives can count on them; read() returns None if such an
+    archive ends up without the texture.
+    """
+
+    def __init__(self):
+        self.archives = {}
+        self.pending = set()
+        self.shared = 0
+
+    def find(self, key):
+        return self.archives.get(key) or key in self.pending
+
+    def reserve(self, keys):
+        """Keys that an archive of this run is going to write"""
+        self.pending.update(keys)
+
+    def read(self, key, name):
+        """Texture native for key renamed to name, or None if it can't be read back"""
+        if key not in self.archives:
+            return None
+        path, source_name = self.archives[key]
+        try:
+            with TxdReader(path) as reader:
+                texture = reader.get(source_name)
+                if texture is None:
+                    return None
+                with texture.native_data() as data:
+                    tex_native = set_texture_native_name(data, name)
+        except (OSError, ValueError):
+            return None
+        self.shared += 1
+        return tex_native
+
+    def register(self, filepath, written):
+        """Record {name_lower: {'key', ...}} of a finished archive"""
+        for name, entry in written.items():
+            self.archives.setdefault(entry['key'], (filepath, name))
+
+
+# =============================================================================
+# TEXTURE CACHE
+# =============================================================================
+
+# Увеличивать при любом изменении вывода энкодера - старые записи кэша станут недоступны
+TXD_ENCODER_VERSION = 3
+
+
+def default_cache_dir():
+    return os.path.join(tempfile.gettempdir(), "inu_txd_cache")
+
+
+def hash_pixels(pixels):
+    """SHA-1 of a prepared (H, W, 4) uint8 pixel array"""
+    return hashlib.sha1(np.ascontiguousarray(pixels).data).hexdigest()
+
+
+def texture_cache_key(pixel_hash, width, height, use_alpha, settings=()):
+    """Cache key of a texture: pixel hash plus the encoder settings applied to it"""
+    key = (TXD_ENCODER_VERSION, pixel_hash, width, height, bool(use_alpha)) + tuple(settings)
+    return hashlib.sha1(repr(key).encode()).hexdigest()
+
+
+# Файл-метка папки кэша: без неё непустая папка кэшем не считается
+TXD_CACHE_MARKER = ".inu_txd_cache"
+# Записи кэша: <2 hex>/<40 hex>.txn и недописанные <40 hex>.txn.<pid>.tmp
+TXD_CACHE_DIR_RE = re.compile(r'^[0-9a-f]{2}$')
+TXD_CACHE_ENTRY_RE = re.compile(r'^([0-9a-f]{40})\.txn$')
+TXD_CACHE_TEMP_RE = re.compile(r'^([0-9a-f]{40})\.txn\.\d+\.tmp$')
+# Временный файл старше этого считается брошенным (процесс упал во время записи)
+TXD_CACHE_STALE_TEMP_SECONDS = 3600
+
+
+class TextureCache:
+    """Disk cache of finished texture natives, keyed by texture_cache_key.
+
+    Entries are stored without regard to the texture name (it is patched on
+    reuse), so identical pixels under different names share one entry. The
+    size cap is enforced by trim(), which evicts the least recently used
+    entries (file mtime is refreshed on every hit).
+
+    Only files of the cache layout are ever counted or deleted. A non-empty
+    directory without the marker file (and with foreign files in it) is
+    refused: the cache is then disabled for this export.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.error = self._claim_directory()
+
+    def _claim_directory(self):
+        """Create the marker in a new, empty or cache-only directory; error text if refused"""
+        marker = os.path.join(self.directory, TXD_CACHE_MARKER)
+        if os.path.isfile(marker):
+            return None
+        try:
+            names = os.listdir(self.directory) if os.path.isdir(self.directory) else []
+            foreign = [name for name in names
+                       if not (TXD_CACHE_DIR_RE.match(name) and os.path.isdir(os.path.join(self.directory, name)))]
+            if foreign:
+                return f"folder is not empty and is not a TXD cache ({self.directory})"
+            # Старый кэш без метки: все подпапки должны содержать только записи кэша
+            for name in names:
+                for filename in os.listdir(os.path.join(self.directory, name)):
+                    if not (TXD_CACHE_ENTRY_RE.match(filename) or TXD_CACHE_TEMP_RE.match(filename)):
+                        return f"folder is not empty and is not a TXD cache ({self.directory})"
+            os.makedirs(self.directory, exist_ok=True)
+            with open(marker, 'w', encoding='utf-8') as f:
+                f.write("INU_tools(gta_sa) TXD cache\n")
+        except OSError as e:
+            return str(e)
+        return None
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".txn")
+
+    def _entries(self):
+        """(mtime, size, path) of cache files only - entries and stale temp files"""
+        now = time.time()
+        entries = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return entries
+        for name in names:
+            subdir = os.path.join(self.directory, name)
+            if not TXD_CACHE_DIR_RE.match(name) or not os.path.isdir(subdir):
+                continue
+            try:
+                filenames = os.listdir(subdir)
+            except OSError:
+                continue
+            for filename in filenames:
+                match = TXD_CACHE_ENTRY_RE.match(filename)
+                temp = TXD_CACHE_TEMP_RE.match(filename) if not match else None
+                if not (match or temp) or not (match or temp).group(1).startswith(name):
+                    continue
+                path = os.path.join(subdir, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                # Временный файл другого процесса может быть ещё в работе
+                if temp and now - stat.st_mtime < TXD_CACHE_STALE_TEMP_SECONDS:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def contains(self, key):
+        """Check for an entry without reading it; an absent entry counts as a miss"""
+        if self.error:
+            return False
+        if os.path.isfile(self._path(key)):
+            return True
+        self.misses += 1
+        return False
+
+    def get(self, key, name):
+        if self.error:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                tex_native = f.read()
+            os.utime(path)
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return set_texture_native_name(tex_native, name)
+
+    def put(self, key, tex_native):
+        if self.error:
+            return
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(tex_native)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"TXD CACHE WRITE ERROR: {e}")
+
+    def trim(self):
+        """Evict least recently used entries until the cache fits max_bytes"""
+        if self.error:
+            return 0
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        return total
+
+    def summary(self):
+        if self.error:
+            return f"cache off: {self.error}"
+        return f"cache {self.hits} hit / {self.misses} miss"
+
+
+# =============================================================================
+# PUBLIC API
+# =============================================================================
+
+def as_rgba8(pixels):
+    """Validate a top-down image and return it as (H, W, 4) uint8.
+
+    Accepts (H, W, 3) or (H, W, 4) arrays, uint8 or float in 0..1 (floats
+    are scaled by 255 and truncated, as the add-on does with Blender pixels).
+    """
+    pixels = np.asarray(pixels)
+    if pixels.ndim != 3 or pixels.shape[2] not in (3, 4) or not pixels.shape[0] or not pixels.shape[1]:
+        raise ValueError(f"expected an (H, W, 3|4) image, got shape {pixels.shape}")
+    if pixels.dtype != np.uint8:
+        if not np.issubdtype(pixels.dtype, np.floating):
+            raise ValueError(f"expected uint8 or float pixels, got {pixels.dtype}")
+        pixels = (np.clip(pixels, 0.0, 1.0) * 255).astype(np.uint8)
+    if pixels.shape[2] == 3:
+        pixels = np.concatenate([pixels, np.full(pixels.shape[:2] + (1,), 255, np.uint8)], axis=2)
+    return np.ascontiguousarray(pixels)
+
+
+def prepare_texture(name, pixels, use_alpha=None, size=None, **options):
+    """Texture data tuple for encode_texture / run_texture_jobs from a plain image.
+
+    use_alpha None means "alpha texture if any pixel is not opaque"; size is
+    an optional (width, height) export size; options are encoder_options keys.
+    """
+    pixels = as_rgba8(pixels)
+    if use_alpha is None:
+        use_alpha = bool((pixels[:, :, 3] < 255).any())
+    width, height = size or (pixels.shape[1], pixels.shape[0])
+    return (name, pixels, width, height, use_alpha, encoder_options(**options))
+
+
+def compress_texture(pixels, name='texture', use_alpha=None, size=None, **options):
+    """Compress one image into a D3D9 texture native (bytes), see prepare_texture"""
+    return encode_texture(prepare_texture(name, pixels, use_alpha, size, **options))[0]
+
+
+def compress_textures(textures, backend=TXD_BACKEND_THREAD, num_workers=0, **options):
+    """Compress [(name, pixels)] on a worker pool, yields texture natives in input order.
+
+    A texture that fails to compress raises RuntimeError with its name.
+    """
+    texture_data = [prepare_texture(name, pixels, **options) for name, pixels in textures]
+    for data, (result, error) in zip(texture_data, run_texture_jobs(texture_data, backend, num_workers)):
+        if error is not None:
+            raise RuntimeError(f"{data[0]}: {error}")
+        yield result[0]
+
+
+def build_txd(natives):
+    """Complete TXD file contents (bytes) from texture natives, same layout as TxdWriter"""
+    natives = list(natives)
+    body = bytearray()
+    write_rw_section_header(body, RW_STRUCT, 4)
+    body.extend(struct.pack('<HH', len(natives), 0))
+    for tex_native in natives:
+        write_rw_section_header(body, RW_TEXTURENATIVE, len(tex_native))
+        body.extend(tex_native)
+    write_rw_section_header(body, RW_EXTENSION, 0)
+
+    data = bytearray()
+    write_rw_section_header(data, RW_TEXDICTIONARY, len(body))
+    data.extend(body)
+    return bytes(data)
+
+
+def write_txd(filepath, natives):
+    """Stream texture natives into a TXD file, returns its size in bytes"""
+    with TxdWriter(filepath) as writer:
+        for tex_native in natives:
+            writer.add(tex_native)
+    return writer.size